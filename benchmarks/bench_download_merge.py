@@ -0,0 +1,159 @@
+"""下载和合并路径的计时脚本
+
+在本地启动一个支持 Range 的 HTTP 服务器（可限制每个连接的速度，模拟 CDN 对单连接
+限速），分别用不同连接数下载同一个文件；再生成测试音视频，计时直接封装和各种转码合并。
+
+    python benchmarks/bench_download_merge.py --size 64 --rate 2048 --connections 1,4,8
+"""
+import argparse
+import asyncio
+import http.server
+import os
+import re
+import shutil
+import socketserver
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main  # noqa: E402
+
+
+class ThrottledHandler(http.server.BaseHTTPRequestHandler):
+    """按 Range 返回文件，每个连接的速度不超过 server.rate（字节/秒，0 为不限）"""
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        path = os.path.join(self.server.root, self.path.lstrip('/'))
+        size = os.path.getsize(path)
+        start, end = 0, size - 1
+        match = re.match(r'bytes=(\d+)-(\d*)', self.headers.get('Range') or '')
+        if match:
+            start = int(match.group(1))
+            end = min(int(match.group(2)), size - 1) if match.group(2) else size - 1
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{end}/{size}')
+        else:
+            self.send_response(200)
+        self.send_header('Content-Length', str(end - start + 1))
+        self.send_header('ETag', f'"{size}"')
+        self.end_headers()
+        rate = self.server.rate
+        started = time.monotonic()
+        sent = 0
+        with open(path, 'rb') as f:
+            f.seek(start)
+            left = end - start + 1
+            while left > 0:
+                data = f.read(min(64 * 1024, left))
+                try:
+                    self.wfile.write(data)
+                except (BrokenPipeError, ConnectionResetError):
+                    return
+                left -= len(data)
+                sent += len(data)
+                if rate:
+                    ahead = sent / rate - (time.monotonic() - started)
+                    if ahead > 0:
+                        time.sleep(ahead)
+
+
+class ThrottledServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads = True
+
+
+def bench_download(work_dir, size_mb, rate_kb, connection_counts):
+    source = os.path.join(work_dir, 'data.bin')
+    with open(source, 'wb') as f:
+        for _ in range(size_mb):
+            f.write(os.urandom(1024 * 1024))
+    server = ThrottledServer(('127.0.0.1', 0), ThrottledHandler)
+    server.root = work_dir
+    server.rate = rate_kb * 1024
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f'http://127.0.0.1:{server.server_address[1]}/data.bin'
+
+    async def download(connections, target):
+        downloader = main.RangedDownloader(connections=connections, stats=main.MirrorStats(None))
+        try:
+            return await downloader.download(url, target)
+        finally:
+            await main.http_client.close()
+
+    print(f"下载 {size_mb} MB，单连接限速 {rate_kb or '不限'} KB/s")
+    try:
+        for connections in connection_counts:
+            target = os.path.join(work_dir, f'out_{connections}.bin')
+            started = time.perf_counter()
+            size = asyncio.run(download(connections, target))
+            elapsed = time.perf_counter() - started
+            speed = size / elapsed / 1024 ** 2
+            print(f"  {connections:2d} 个连接: {elapsed:7.2f} s  {speed:7.1f} MB/s")
+            os.remove(target)
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def bench_merge(work_dir, duration, reencode_video):
+    video = os.path.join(work_dir, 'video.mp4')
+    video_mpeg2 = os.path.join(work_dir, 'video.mkv')
+    audio = os.path.join(work_dir, 'audio.m4a')
+    audio_wav = os.path.join(work_dir, 'audio.wav')
+    main.run_ffmpeg(['-f', 'lavfi', '-i', 'testsrc2=s=1280x720:r=30', '-t', str(duration),
+                     '-c:v', 'libx264', '-preset', 'veryfast', '-g', '60', video])
+    main.run_ffmpeg(['-f', 'lavfi', '-i', 'sine=frequency=440', '-t', str(duration),
+                     '-c:a', 'aac', audio])
+    main.run_ffmpeg(['-i', audio, '-c:a', 'pcm_s16le', audio_wav])
+
+    cases = [('直接封装 (h264 + aac)', video, audio),
+             ('只转码音频 (h264 + pcm)', video, audio_wav)]
+    if reencode_video:
+        main.run_ffmpeg(['-i', video, '-c:v', 'mpeg2video', '-q:v', '4', video_mpeg2])
+        cases.append(('分段转码视频 (mpeg2 + aac)', video_mpeg2, audio))
+
+    print(f"合并 {duration} 秒 720p 音视频（CPU 核心数 {os.cpu_count()}）")
+    # 临时文件的探测结果只保存在内存中，不写入程序目录的缓存
+    main.media_probe = main.MediaProbeService()
+    task = main.DownloadTask('benchmark')
+    for label, video_path, audio_path in cases:
+        output = os.path.join(work_dir, 'merged.mp4')
+        started = time.perf_counter()
+        ok = task._merge_audio_video(video_path, audio_path, output)
+        elapsed = time.perf_counter() - started
+        print(f"  {label:28s} {elapsed:7.2f} s  {'成功' if ok else '失败'}")
+        if os.path.exists(output):
+            os.remove(output)
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="下载和合并路径计时")
+    parser.add_argument('--size', type=int, default=64, help="下载文件大小 (MB)")
+    parser.add_argument('--rate', type=int, default=2048, help="单连接限速 (KB/s)，0 为不限")
+    parser.add_argument('--connections', default='1,4,8', help="要比较的连接数，逗号分隔")
+    parser.add_argument('--duration', type=int, default=60, help="合并测试的音视频时长（秒）")
+    parser.add_argument('--reencode-video', action='store_true',
+                        help="同时计时视频需要转码的合并（较慢）")
+    parser.add_argument('--skip-download', action='store_true')
+    parser.add_argument('--skip-merge', action='store_true')
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix='bench_')
+    try:
+        if not args.skip_download:
+            bench_download(work_dir, args.size, args.rate,
+                           [int(n) for n in args.connections.split(',')])
+        if not args.skip_merge:
+            bench_merge(work_dir, args.duration, args.reencode_video)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main_cli()
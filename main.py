@@ -3,484 +3,4225 @@ import os
 from PySide6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, 
                               QHBoxLayout, QLineEdit, QPushButton, QLabel, QProgressBar,
                               QFileDialog, QTimeEdit, QFrame, QMessageBox, QSizePolicy,
-                              QScrollArea)
-from PySide6.QtCore import QThread, Signal, Qt, QTime
+                              QScrollArea, QComboBox, QListWidget,
+                              QListWidgetItem, QPlainTextEdit, QSpinBox)
+from PySide6.QtCore import QThread, Signal, Qt, QTime, QObject, QRunnable, QThreadPool
 from bilibili_api import video, sync
-import requests
+import aiohttp
 import subprocess
-from moviepy.editor import VideoFileClip, AudioFileClip, concatenate_audioclips, AudioClip
+from moviepy.editor import AudioFileClip, AudioClip
+import argparse
 import asyncio
-class DownloadWorker(QThread):
+import qasync
+import json
+import re
+import shutil
+import tempfile
+import threading
+import queue
+import struct
+import time
+import hashlib
+import bisect
+from array import array
+from urllib.parse import urlparse, parse_qs
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+
+def get_ffmpeg_binary():
+    """返回 moviepy 使用的 ffmpeg 可执行文件路径"""
+    from moviepy.config import get_setting
+    return get_setting("FFMPEG_BINARY")
+
+
+def _split_stream_fields(text):
+    """按顶层逗号切分 ffmpeg 流描述，忽略括号内的逗号"""
+    fields = []
+    depth = 0
+    current = ''
+    for ch in text:
+        if ch == '(':
+            depth += 1
+        elif ch == ')':
+            depth -= 1
+        if ch == ',' and depth == 0:
+            fields.append(current.strip())
+            current = ''
+        else:
+            current += ch
+    if current.strip():
+        fields.append(current.strip())
+    return fields
+
+
+def parse_ffmpeg_info(output):
+    """解析 `ffmpeg -i` 输出的容器与流信息"""
+    info = {'duration': None, 'start_time': 0.0, 'bitrate': None, 'streams': []}
+    match = re.search(r'Duration:\s*(\d+):(\d+):(\d+(?:\.\d+)?)', output)
+    if match:
+        hours, minutes, seconds = match.groups()
+        info['duration'] = int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+    match = re.search(r'Duration:.*?start:\s*(-?\d+(?:\.\d+)?)', output)
+    if match:
+        info['start_time'] = float(match.group(1))
+    match = re.search(r'Duration:.*?bitrate:\s*(\d+)\s*kb/s', output)
+    if match:
+        info['bitrate'] = int(match.group(1)) * 1000
+
+    for match in re.finditer(r'^\s*Stream #\d+:(\d+)\S*:\s*(Video|Audio|Subtitle|Data):\s*(.*)$',
+                             output, re.MULTILINE):
+        index, kind, description = match.groups()
+        fields = _split_stream_fields(description)
+        stream = {
+            'index': int(index),
+            'type': kind.lower(),
+            'codec': fields[0].split()[0] if fields else '',
+            'profile': None,
+            'attached_pic': '(attached pic)' in description,
+            'bitrate': None,
+        }
+        for field in fields[1:]:
+            bitrate = re.match(r'^(\d+) kb/s', field)
+            if bitrate:
+                stream['bitrate'] = int(bitrate.group(1)) * 1000
+        profile = re.match(r'\S+\s+\(([^)]*)\)', fields[0]) if fields else None
+        if profile and '/' not in profile.group(1):
+            stream['profile'] = profile.group(1)
+
+        if stream['type'] == 'video':
+            for field in fields[1:]:
+                size = re.match(r'(\d+)x(\d+)', field)
+                fps = re.match(r'^([\d.]+)(k?) fps', field)
+                if size and 'width' not in stream:
+                    stream['width'], stream['height'] = int(size.group(1)), int(size.group(2))
+                elif re.match(r'^[a-z0-9_]+(\(.*\))?$', field) and 'pix_fmt' not in stream:
+                    stream['pix_fmt'] = field.split('(')[0]
+                elif fps:
+                    stream['fps'] = float(fps.group(1)) * (1000 if fps.group(2) else 1)
+                elif re.match(r'^\S+ tbn', field):
+                    stream['time_base'] = field.split()[0]
+        elif stream['type'] == 'audio':
+            for field in fields[1:]:
+                rate = re.match(r'(\d+) Hz', field)
+                if rate:
+                    stream['sample_rate'] = int(rate.group(1))
+                elif field in ('mono', 'stereo') or re.match(r'^\d+(\.\d+)?( channels)?(\(.*\))?$', field):
+                    stream['channels'] = field
+                elif re.match(r'^(s16|s32|flt|dbl|u8|s64)p?$', field):
+                    stream['sample_fmt'] = field
+        info['streams'].append(stream)
+    return info
+
+
+def probe_media(file_path):
+    """用一次 ffmpeg 调用读取文件的时长和音视频流信息（不解码）"""
+    result = subprocess.run([get_ffmpeg_binary(), '-hide_banner', '-i', file_path],
+                            stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                            stderr=subprocess.PIPE)
+    output = result.stderr.decode('utf-8', errors='replace')
+    info = parse_ffmpeg_info(output)
+    if not info['streams']:
+        last_line = output.strip().splitlines()[-1] if output.strip() else '未知错误'
+        raise ValueError(f"无法识别的媒体文件: {last_line}")
+    return info
+
+
+def iter_video_packets(file_path, start=0, end=None, start_time=0.0):
+    """逐个读取第一个视频流在 [start, end] 附近的数据包，生成 (pts, dts, 是否关键帧)
+
+    只复制数据包并计算校验（framecrc），不解码，耗时与读取的字节数成正比。
+    start_time 为容器的起始时间，返回的时间已换算为从 0 开始的时间轴（秒）。
+    """
+    args = [get_ffmpeg_binary(), '-hide_banner', '-nostdin', '-loglevel', 'error']
+    if start > 0:
+        args += ['-ss', f'{start:.3f}']
+    args += ['-i', file_path, '-copyts']
+    if end is not None:
+        args += ['-to', f'{end + start_time:.3f}']
+    args += ['-map', '0:v:0', '-c', 'copy', '-f', 'framecrc', '-']
+
+    time_base = None
+    process = subprocess.Popen(args, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                               stderr=subprocess.DEVNULL)
+    try:
+        for raw_line in process.stdout:
+            line = raw_line.decode('ascii', errors='ignore').strip()
+            if line.startswith('#tb 0:'):
+                num, den = line.split(':', 1)[1].strip().split('/')
+                time_base = int(num) / int(den)
+                continue
+            if not line or line.startswith('#') or time_base is None:
+                continue
+            fields = [field.strip() for field in line.split(',')]
+            # 没有 F= 字段表示只有关键帧标志
+            flags = 1
+            if len(fields) > 6 and fields[6].startswith('F='):
+                flags = int(fields[6][2:], 16)
+            yield (int(fields[2]) * time_base - start_time,
+                   int(fields[1]) * time_base - start_time,
+                   bool(flags & 1))
+    finally:
+        process.stdout.close()
+        process.kill()
+        process.wait()
+
+
+def scan_keyframes(file_path, start=0, end=None, start_time=0.0):
+    """返回第一个视频流在 [start, end] 附近的关键帧显示时间（秒），从关键帧索引中读取"""
+    return [pts for pts, _ in keyframe_index.keyframes(file_path, start, end, start_time)]
+
+
+def _be_array(typecode, data):
+    """把大端序的整数数组数据转换为 array"""
+    values = array(typecode)
+    values.frombytes(data[:len(data) // values.itemsize * values.itemsize])
+    if sys.byteorder == 'little':
+        values.byteswap()
+    return values
+
+
+def _iter_boxes(data, start=0, end=None):
+    """遍历内存中的 MP4 盒，生成 (类型, 内容起始偏移, 结束偏移)"""
+    end = len(data) if end is None else end
+    position = start
+    while position + 8 <= end:
+        size, box_type = struct.unpack_from('>I4s', data, position)
+        header = 8
+        if size == 1:
+            size = struct.unpack_from('>Q', data, position + 8)[0]
+            header = 16
+        elif size == 0:
+            size = end - position
+        if size < header:
+            break
+        yield box_type, position + header, min(position + size, end)
+        position += size
+
+
+def _find_box(data, start, end, *path):
+    """按路径查找子盒，返回 (内容起始偏移, 结束偏移)，找不到时返回 None"""
+    for box_type, payload, box_end in _iter_boxes(data, start, end):
+        if box_type == path[0]:
+            if len(path) == 1:
+                return payload, box_end
+            return _find_box(data, payload, box_end, *path[1:])
+    return None
+
+
+def _read_moov(file_path):
+    """流式跳过文件中的各个顶层盒，只把 moov 读入内存
+
+    分片 MP4（含 moof）的样本信息不在 moov 中，返回 None。
+    """
+    moov = None
+    with open(file_path, 'rb') as f:
+        file_size = os.fstat(f.fileno()).st_size
+        position = 0
+        while position + 8 <= file_size:
+            f.seek(position)
+            header = f.read(16)
+            size, box_type = struct.unpack_from('>I4s', header)
+            if size == 1:
+                size = struct.unpack_from('>Q', header, 8)[0]
+            elif size == 0:
+                size = file_size - position
+            if size < 8:
+                return None
+            if box_type == b'moof':
+                return None
+            if box_type == b'moov':
+                f.seek(position)
+                moov = f.read(size)
+            position += size
+    return moov
+
+
+def parse_mp4_keyframes(file_path):
+    """从 MP4 的样本表（stss/stts/ctts/stsc/stsz/stco）直接读出第一个视频流的关键帧
+
+    返回 (显示时间列表, 解码时间列表, 字节偏移列表)，时间与 ffmpeg 读取时的时间戳一致
+    （秒，未减去容器起始时间）。不是 MP4、分片 MP4 或者编辑列表较复杂时返回 None。
+    只读取 moov，不读取媒体数据，耗时与文件大小基本无关。
+    """
+    try:
+        moov = _read_moov(file_path)
+    except (OSError, struct.error):
+        return None
+    if not moov:
+        return None
+    try:
+        return _parse_moov_keyframes(moov)
+    except (struct.error, IndexError, ValueError):
+        return None
+
+
+def _parse_moov_keyframes(moov):
+    """解析 moov 中第一个视频轨的关键帧，见 parse_mp4_keyframes"""
+    movie_timescale = 1000
+    mvhd = _find_box(moov, 8, len(moov), b'mvhd')
+    if mvhd:
+        offset = 20 if moov[mvhd[0]] == 1 else 12
+        movie_timescale = struct.unpack_from('>I', moov, mvhd[0] + offset)[0] or 1000
+
+    for box_type, trak, trak_end in _iter_boxes(moov, 8):
+        if box_type != b'trak':
+            continue
+        hdlr = _find_box(moov, trak, trak_end, b'mdia', b'hdlr')
+        if not hdlr or moov[hdlr[0] + 8:hdlr[0] + 12] != b'vide':
+            continue
+        mdhd = _find_box(moov, trak, trak_end, b'mdia', b'mdhd')
+        offset = 20 if moov[mdhd[0]] == 1 else 12
+        timescale = struct.unpack_from('>I', moov, mdhd[0] + offset)[0]
+        stbl = _find_box(moov, trak, trak_end, b'mdia', b'minf', b'stbl')
+        if not timescale or not stbl:
+            return None
+        tables = {box_type: (payload, box_end)
+                  for box_type, payload, box_end in _iter_boxes(moov, *stbl)}
+
+        def table(name, typecode, header=8):
+            payload, box_end = tables[name]
+            return _be_array(typecode, moov[payload + header:box_end])
+
+        # 编辑列表：开头的空编辑推迟显示，一个普通编辑的 media_time 使时间戳整体前移
+        shift = 0.0
+        media_time = 0
+        elst = _find_box(moov, trak, trak_end, b'edts', b'elst')
+        if elst:
+            version = moov[elst[0]]
+            count = struct.unpack_from('>I', moov, elst[0] + 4)[0]
+            entry_format, entry_size = ('>qq', 20) if version == 1 else ('>Ii', 12)
+            normal = 0
+            for i in range(count):
+                duration, entry_time = struct.unpack_from(entry_format,
+                                                          moov, elst[0] + 8 + i * entry_size)
+                if entry_time == -1:
+                    if normal:
+                        return None
+                    shift += duration / movie_timescale
+                else:
+                    normal += 1
+                    media_time = entry_time
+            if normal > 1:
+                return None
+
+        if b'stts' not in tables or b'stsz' not in tables or b'stsc' not in tables:
+            return None
+        stts = table(b'stts', 'I')
+        sample_size = struct.unpack_from('>I', moov, tables[b'stsz'][0] + 4)[0]
+        sample_count = struct.unpack_from('>I', moov, tables[b'stsz'][0] + 8)[0]
+        sizes = None if sample_size else table(b'stsz', 'I', 12)
+        stsc = table(b'stsc', 'I')
+        if b'stco' in tables:
+            chunk_offsets = table(b'stco', 'I')
+        elif b'co64' in tables:
+            chunk_offsets = table(b'co64', 'Q')
+        else:
+            return None
+        if b'stss' in tables:
+            keyframes = sorted(n - 1 for n in table(b'stss', 'I'))
+        else:
+            keyframes = range(sample_count)
+        # 显示时间偏移按有符号数读取（版本 0 的负偏移 ffmpeg 也按有符号处理）
+        ctts = table(b'ctts', 'i') if b'ctts' in tables else None
+        # 有负偏移时 ffmpeg 把解码时间前移，保证解码时间不晚于显示时间
+        dts_shift = max(0, -min(ctts[1::2])) if ctts else 0
+
+        pts_list, dts_list, offsets = [], [], []
+        # 用双指针依次推进 stts、ctts、stsc，只计算关键帧
+        stts_index = ctts_index = 0
+        stts_first = ctts_first = 0   # 当前条目覆盖的第一个样本
+        stts_dts = 0                  # 当前条目第一个样本的解码时间
+        chunk_entry = 0
+        chunk = 0                     # 当前块序号（从 0 开始）
+        chunk_sample = 0              # 当前块的第一个样本
+        for sample in keyframes:
+            if sample >= sample_count:
+                break
+            while stts_index * 2 + 1 < len(stts) and sample >= stts_first + stts[stts_index * 2]:
+                stts_dts += stts[stts_index * 2] * stts[stts_index * 2 + 1]
+                stts_first += stts[stts_index * 2]
+                stts_index += 1
+            dts = stts_dts + (sample - stts_first) * stts[stts_index * 2 + 1]
+            composition = 0
+            if ctts is not None:
+                while ctts_index * 2 + 1 < len(ctts) and sample >= ctts_first + ctts[ctts_index * 2]:
+                    ctts_first += ctts[ctts_index * 2]
+                    ctts_index += 1
+                if ctts_index * 2 + 1 < len(ctts):
+                    composition = ctts[ctts_index * 2 + 1]
+            while True:
+                per_chunk = stsc[chunk_entry * 3 + 1]
+                next_first_chunk = (stsc[chunk_entry * 3 + 3] - 1
+                                    if chunk_entry * 3 + 3 < len(stsc) else None)
+                if sample < chunk_sample + per_chunk:
+                    break
+                chunk += 1
+                chunk_sample += per_chunk
+                if next_first_chunk is not None and chunk >= next_first_chunk:
+                    chunk_entry += 1
+            if sizes is None:
+                inner = (sample - chunk_sample) * sample_size
+            else:
+                inner = sum(sizes[chunk_sample:sample])
+            pts_list.append((dts + composition - media_time) / timescale + shift)
+            dts_list.append((dts - media_time - dts_shift) / timescale + shift)
+            offsets.append(chunk_offsets[chunk] + inner)
+        return pts_list, dts_list, offsets
+    return None
+
+
+def get_app_dir():
+    """返回程序所在目录（打包后为可执行文件所在目录）"""
+    if getattr(sys, 'frozen', False):
+        return os.path.dirname(sys.executable)
+    return os.path.dirname(os.path.abspath(__file__))
+
+
+def _load_json_cache(path):
+    """读取 JSON 缓存文件，文件不存在或已损坏时返回空字典"""
+    if path and os.path.exists(path):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            pass
+    return {}
+
+
+def _save_json_cache(path, data, indent=None):
+    """先写入临时文件再替换，原子地保存 JSON 文件，失败时抛出 OSError"""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    temp_path = path + '.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=indent)
+    os.replace(temp_path, path)
+
+
+class MediaProbeService:
+    """媒体信息探测服务
+
+    每个文件只调用一次 ffmpeg 读取容器和流信息，结果按 路径 + 大小 + 修改时间
+    缓存在内存和磁盘（JSON）中，文件变化后自动失效。可在多个线程中同时使用。
+    """
+
+    # 批量探测时新条目很多，间隔一段时间才落盘一次，其余修改由 flush() 写入
+    SAVE_INTERVAL = 5
+
+    def __init__(self, cache_path=None, max_entries=2000):
+        self.cache_path = cache_path
+        self.max_entries = max_entries
+        self._entries = None
+        self._dirty = False
+        self._last_save = 0
+        self._lock = threading.Lock()
+
+    def _load(self):
+        """首次使用时读取磁盘缓存"""
+        if self._entries is None:
+            self._entries = _load_json_cache(self.cache_path)
+
+    def _save(self):
+        """原子地写入磁盘缓存"""
+        if not self.cache_path:
+            return
+        try:
+            _save_json_cache(self.cache_path, self._entries)
+            self._dirty = False
+            self._last_save = time.time()
+        except OSError as e:
+            print(f"保存媒体信息缓存失败: {str(e)}")
+
+    def probe(self, file_path):
+        """返回文件的媒体信息，缓存命中时不启动 ffmpeg"""
+        path = os.path.abspath(file_path)
+        stat = os.stat(path)
+        with self._lock:
+            self._load()
+            entry = self._entries.get(path)
+            if entry and entry['size'] == stat.st_size and entry['mtime'] == stat.st_mtime_ns:
+                return entry['info']
+
+        info = probe_media(path)
+
+        with self._lock:
+            self._entries.pop(path, None)
+            self._entries[path] = {'size': stat.st_size, 'mtime': stat.st_mtime_ns, 'info': info}
+            # 超出上限时淘汰最早加入的条目
+            while len(self._entries) > self.max_entries:
+                self._entries.pop(next(iter(self._entries)))
+            self._dirty = True
+            if time.time() - self._last_save >= self.SAVE_INTERVAL:
+                self._save()
+        return info
+
+    def flush(self):
+        """把尚未落盘的修改写入磁盘"""
+        with self._lock:
+            if self._entries is not None and self._dirty:
+                self._save()
+
+    def stream_flags(self, file_path):
+        """返回 (是否包含视频流, 是否包含音频流)，无法识别的文件返回 (False, False)"""
+        try:
+            info = self.probe(file_path)
+        except (OSError, ValueError):
+            return False, False
+        video_stream = first_stream(info, 'video')
+        has_video = (video_stream is not None and video_stream.get('width', 1) > 0
+                     and video_stream.get('height', 1) > 0)
+        return has_video, first_stream(info, 'audio') is not None
+
+
+media_probe = MediaProbeService(os.path.join(get_app_dir(), 'cache', 'probe_cache.json'))
+
+
+class KeyframeTable:
+    """一个文件第一个视频流的关键帧表
+
+    pts/dts 为关键帧的显示和解码时间（秒，未减去容器起始时间），按显示时间排序；
+    offsets 为关键帧数据在文件中的字节偏移，未知时为 -1。
+    """
+
+    def __init__(self, pts, dts, offsets):
+        self.pts = pts
+        self.dts = dts
+        self.offsets = offsets
+
+    def window(self, start, end=None):
+        """返回 [start, end] 内的关键帧序号范围，包含 start 之前最近的关键帧（即定位点）"""
+        first = max(0, bisect.bisect_right(self.pts, start) - 1)
+        last = len(self.pts) if end is None else bisect.bisect_right(self.pts, end)
+        return range(first, max(first, last))
+
+    def estimate_bytes(self, start, end):
+        """估算直接复制 [start, end] 需要读取的字节数，没有字节偏移时返回 None"""
+        indexes = self.window(start)
+        if not indexes:
+            return None
+        first = indexes[0]
+        last = bisect.bisect_right(self.pts, end)
+        if last >= len(self.pts) or self.offsets[first] < 0 or self.offsets[last] < 0:
+            return None
+        return self.offsets[last] - self.offsets[first]
+
+
+class KeyframeIndex:
+    """关键帧索引服务
+
+    每个文件只扫描一次：MP4 直接读取 moov 中的样本表，其他格式（以及分片 MP4）
+    用 ffmpeg 复制数据包（framecrc）流式扫描一遍，不解码。结果以二进制数组的形式
+    保存在缓存目录中，文件头记录源文件的大小和修改时间，文件变化后自动重建。
+    可在多个线程中同时使用。
+    """
+
+    MAGIC = b'BKFI'
+    VERSION = 1
+    HEADER = struct.Struct('<4sIQqI')  # 标识, 版本, 文件大小, 修改时间, 关键帧数
+
+    def __init__(self, cache_dir=None, max_entries=500, max_memory_entries=32):
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.max_memory_entries = max_memory_entries
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def _sidecar_path(self, path):
+        digest = hashlib.sha1(path.encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, f'{digest}.kfi')
+
+    def _read_sidecar(self, path, stat):
+        """读取磁盘上的索引，与文件不匹配或损坏时返回 None"""
+        if not self.cache_dir:
+            return None
+        try:
+            with open(self._sidecar_path(path), 'rb') as f:
+                magic, version, size, mtime, count = self.HEADER.unpack(f.read(self.HEADER.size))
+                if (magic, version, size, mtime) != (self.MAGIC, self.VERSION,
+                                                     stat.st_size, stat.st_mtime_ns):
+                    return None
+                arrays = []
+                for typecode in ('d', 'd', 'q'):
+                    values = array(typecode)
+                    values.fromfile(f, count)
+                    if sys.byteorder == 'big':
+                        values.byteswap()
+                    arrays.append(values)
+        except (OSError, EOFError, struct.error):
+            return None
+        return KeyframeTable(*arrays)
+
+    def _write_sidecar(self, path, stat, table):
+        """原子地写入索引文件，超出上限时删除最久未更新的索引"""
+        if not self.cache_dir:
+            return
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            sidecar_path = self._sidecar_path(path)
+            temp_path = sidecar_path + '.tmp'
+            with open(temp_path, 'wb') as f:
+                f.write(self.HEADER.pack(self.MAGIC, self.VERSION, stat.st_size,
+                                         stat.st_mtime_ns, len(table.pts)))
+                for values in (table.pts, table.dts, table.offsets):
+                    if sys.byteorder == 'big':
+                        values = array(values.typecode, values)
+                        values.byteswap()
+                    values.tofile(f)
+            os.replace(temp_path, sidecar_path)
+
+            names = [name for name in os.listdir(self.cache_dir) if name.endswith('.kfi')]
+            if len(names) > self.max_entries:
+                names.sort(key=lambda name: os.path.getmtime(os.path.join(self.cache_dir, name)))
+                for name in names[:len(names) - self.max_entries]:
+                    os.remove(os.path.join(self.cache_dir, name))
+        except OSError as e:
+            print(f"保存关键帧索引失败: {str(e)}")
+
+    def build(self, file_path):
+        """扫描文件生成关键帧表"""
+        parsed = parse_mp4_keyframes(file_path)
+        if parsed is None:
+            packets = sorted((pts, dts) for pts, dts, is_key in iter_video_packets(file_path)
+                             if is_key)
+            parsed = ([pts for pts, _ in packets], [dts for _, dts in packets],
+                      [-1] * len(packets))
+        else:
+            order = sorted(range(len(parsed[0])), key=parsed[0].__getitem__)
+            parsed = tuple([values[i] for i in order] for values in parsed)
+        return KeyframeTable(array('d', parsed[0]), array('d', parsed[1]), array('q', parsed[2]))
+
+    def get(self, file_path):
+        """返回文件的关键帧表，索引有效时不读取媒体文件"""
+        path = os.path.abspath(file_path)
+        stat = os.stat(path)
+        key = (stat.st_size, stat.st_mtime_ns)
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry and entry[0] == key:
+                return entry[1]
+
+        table = self._read_sidecar(path, stat)
+        if table is None:
+            table = self.build(path)
+            self._write_sidecar(path, stat, table)
+
+        with self._lock:
+            self._entries.pop(path, None)
+            self._entries[path] = (key, table)
+            while len(self._entries) > self.max_memory_entries:
+                self._entries.pop(next(iter(self._entries)))
+        return table
+
+    def keyframes(self, file_path, start=0, end=None, start_time=0.0):
+        """返回 [start, end] 附近关键帧的 (pts, dts) 列表（秒，从 0 开始的时间轴）
+
+        与从 start 定位后读取数据包的结果一致：包含 start 之前最近的关键帧。
+        """
+        table = self.get(file_path)
+        end = None if end is None else end + start_time
+        return [(table.pts[i] - start_time, table.dts[i] - start_time)
+                for i in table.window(start + start_time, end)]
+
+    def estimate_size(self, file_path, start, end, start_time=0.0):
+        """估算直接复制 [start, end] 得到的文件大小（字节），无法估算时返回 None"""
+        return self.get(file_path).estimate_bytes(start + start_time, end + start_time)
+
+
+keyframe_index = KeyframeIndex(os.path.join(get_app_dir(), 'cache', 'keyframes'))
+
+
+def play_url_deadline(download_info):
+    """返回下载地址中 deadline 参数的最早时间戳，没有签名过期时间时返回 None"""
+    deadlines = []
+    dash = download_info.get('dash') or {}
+    for stream in (dash.get('video') or []) + (dash.get('audio') or []):
+        for url in [stream.get('baseUrl')] + list(stream.get('backupUrl') or []):
+            if not url:
+                continue
+            values = parse_qs(urlparse(url).query).get('deadline')
+            if values and values[0].isdigit():
+                deadlines.append(int(values[0]))
+    return min(deadlines) if deadlines else None
+
+
+class MetadataCache:
+    """视频信息和下载地址的缓存
+
+    视频信息按固定的较长有效期缓存；下载地址缓存到签名中的 deadline 之前。
+    条目按最近使用顺序淘汰，并保存在磁盘（JSON）中供下次启动使用。
+    命中和未命中次数通过 stats() 查看。
+    """
+
+    INFO_TTL = 24 * 3600
+    # 没有 deadline 参数的下载地址只缓存很短时间
+    PLAY_URL_TTL = 600
+    # 下载地址在过期前预留的时间（秒），避免下载到一半地址失效
+    EXPIRY_MARGIN = 300
+    SAVE_INTERVAL = 5
+
+    def __init__(self, cache_path=None, max_entries=500):
+        self.cache_path = cache_path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = None
+        self._dirty = False
+        self._last_save = 0
+        self._lock = threading.Lock()
+
+    def _load(self):
+        """首次使用时读取磁盘缓存"""
+        if self._entries is None:
+            self._entries = _load_json_cache(self.cache_path)
+
+    def _save(self):
+        """原子地写入磁盘缓存"""
+        if not self.cache_path:
+            return
+        try:
+            _save_json_cache(self.cache_path, self._entries)
+            self._dirty = False
+            self._last_save = time.time()
+        except OSError as e:
+            print(f"保存元数据缓存失败: {str(e)}")
+
+    def get(self, key):
+        """返回未过期的缓存值，不存在或已过期时返回 None"""
+        with self._lock:
+            self._load()
+            entry = self._entries.pop(key, None)
+            if entry is None or entry['expires'] <= time.time():
+                self.misses += 1
+                if entry is not None:
+                    self._dirty = True
+                return None
+            # 重新插入到末尾，保持最近使用顺序
+            self._entries[key] = entry
+            self.hits += 1
+            return entry['value']
+
+    def put(self, key, value, expires):
+        with self._lock:
+            self._load()
+            self._entries.pop(key, None)
+            self._entries[key] = {'expires': expires, 'value': value}
+            while len(self._entries) > self.max_entries:
+                self._entries.pop(next(iter(self._entries)))
+            self._dirty = True
+            # 批量下载时写入很频繁，间隔一段时间才落盘一次
+            if time.time() - self._last_save >= self.SAVE_INTERVAL:
+                self._save()
+
+    def flush(self):
+        """把尚未落盘的修改写入磁盘"""
+        with self._lock:
+            if self._entries is not None and self._dirty:
+                self._save()
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses,
+                    'entries': len(self._entries or {})}
+
+    async def video_info(self, v, bvid):
+        """获取视频信息，优先使用缓存"""
+        key = f'info:{bvid}'
+        info = self.get(key)
+        if info is None:
+            info = await v.get_info()
+            self.put(key, info, time.time() + self.INFO_TTL)
+        return info
+
+    async def download_url(self, v, bvid, cid):
+        """获取下载地址，缓存到签名过期前"""
+        key = f'playurl:{bvid}:{cid}'
+        download_info = self.get(key)
+        if download_info is None:
+            download_info = await v.get_download_url(cid=cid)
+            deadline = play_url_deadline(download_info)
+            if deadline is None:
+                expires = time.time() + self.PLAY_URL_TTL
+            else:
+                expires = deadline - self.EXPIRY_MARGIN
+            if expires > time.time():
+                self.put(key, download_info, expires)
+        return download_info
+
+
+metadata_cache = MetadataCache(os.path.join(get_app_dir(), 'cache', 'metadata_cache.json'))
+
+
+class EncodingProfile:
+    """编码配置
+
+    重新编码时使用的视频编码器、速度预设、质量目标（CRF，或指定 video_bitrate 时
+    使用固定码率）、线程数和音频参数。threads 为编码最多使用的 CPU 线程数，
+    0 表示按 CPU 核心数自动决定。
+    """
+
+    # 支持的视频编码器及其转换为 Annex B 的码流过滤器
+    VIDEO_CODECS = {
+        'libx264': 'h264_mp4toannexb',
+        'libx265': 'hevc_mp4toannexb',
+    }
+    FIELDS = ('video_codec', 'preset', 'crf', 'video_bitrate', 'threads',
+              'audio_codec', 'audio_bitrate')
+
+    def __init__(self, name, video_codec='libx264', preset='medium', crf=23, video_bitrate=None,
+                 threads=0, audio_codec='aac', audio_bitrate='192k'):
+        if video_codec not in self.VIDEO_CODECS:
+            raise ValueError(f"不支持的视频编码器: {video_codec}")
+        self.name = name
+        self.video_codec = video_codec
+        self.preset = preset
+        self.crf = crf
+        self.video_bitrate = video_bitrate  # 如 '4M'，为空时使用 CRF
+        self.threads = max(0, int(threads or 0))
+        self.audio_codec = audio_codec      # MP4 输出的音频编码器，MP3 输出固定使用 libmp3lame
+        self.audio_bitrate = audio_bitrate
+
+    @classmethod
+    def from_dict(cls, name, data):
+        return cls(name, **{key: data[key] for key in cls.FIELDS if key in data})
+
+    def to_dict(self):
+        return {key: getattr(self, key) for key in self.FIELDS}
+
+    @property
+    def bitstream_filter(self):
+        return self.VIDEO_CODECS[self.video_codec]
+
+    def quality_args(self):
+        """质量目标：指定码率时使用固定码率，否则使用 CRF"""
+        if self.video_bitrate:
+            return ['-b:v', str(self.video_bitrate)]
+        return ['-crf', str(self.crf)]
+
+    def video_args(self):
+        """视频编码参数（不含线程数）"""
+        args = ['-c:v', self.video_codec, '-preset', self.preset] + self.quality_args()
+        if self.video_codec == 'libx265':
+            args += ['-x265-params', 'log-level=error']
+        return args
+
+    def tag_args(self):
+        """封装为 MP4 时需要的参数（HEVC 使用 hvc1 标签，苹果设备才能播放）"""
+        return ['-tag:v', 'hvc1'] if self.video_codec == 'libx265' else []
+
+    def thread_args(self):
+        return ['-threads', str(self.threads)] if self.threads else []
+
+    def audio_args(self, mp3=False):
+        """音频编码参数，mp3 为 True 时输出 MP3"""
+        codec = 'libmp3lame' if mp3 else self.audio_codec
+        return ['-c:a', codec, '-b:a', str(self.audio_bitrate)]
+
+    def describe(self):
+        """配置的简短说明，记录在进度信息中"""
+        quality = f'码率 {self.video_bitrate}' if self.video_bitrate else f'CRF {self.crf}'
+        threads = f'{self.threads} 线程' if self.threads else '自动线程数'
+        return (f'{self.name}（{self.video_codec} {self.preset} {quality}，{threads}，'
+                f'音频 {self.audio_codec} {self.audio_bitrate}）')
+
+
+class EncodingProfiles:
+    """编码配置列表，保存在程序目录的 config.json 中
+
+    内置几个常用配置；config.json 的 encoding_profiles 中可以修改内置配置或添加
+    新配置，encoding_profile 记录当前选中的配置。config.json 中的其他设置原样保留。
+    config.json 无法读取时只使用内置配置，并且不再写入，以免覆盖用户的设置。
+    """
+
+    DEFAULT = '标准'
+    BUILTIN = (
+        EncodingProfile('标准'),
+        EncodingProfile('预览', preset='ultrafast', crf=28, audio_bitrate='128k'),
+        EncodingProfile('归档', preset='slow', crf=20, audio_bitrate='256k'),
+        EncodingProfile('小体积', video_codec='libx265', crf=28, audio_bitrate='128k'),
+    )
+
+    def __init__(self, config_path=None):
+        self.config_path = config_path
+        self._config = None
+        self._profiles = None
+        # 读取配置文件时发现的问题，由界面或命令行显示给用户
+        self._errors = []
+        # 配置文件存在但无法读取，此时不写入配置文件
+        self._read_failed = False
+        self._lock = threading.Lock()
+
+    def _load(self):
+        """首次使用时读取配置文件"""
+        if self._profiles is not None:
+            return
+        self._config = {}
+        if self.config_path and os.path.exists(self.config_path):
+            try:
+                with open(self.config_path, 'r', encoding='utf-8') as f:
+                    self._config = json.load(f)
+                if not isinstance(self._config, dict):
+                    raise ValueError("内容不是 JSON 对象")
+            except (OSError, ValueError) as e:
+                self._errors.append(f"读取配置文件 {self.config_path} 失败，本次只使用内置编码配置"
+                                    f"且不会保存修改: {str(e)}")
+                self._read_failed = True
+                self._config = {}
+        self._profiles = {profile.name: profile for profile in self.BUILTIN}
+        for name, data in (self._config.get('encoding_profiles') or {}).items():
+            try:
+                self._profiles[name] = EncodingProfile.from_dict(name, data)
+            except (TypeError, ValueError) as e:
+                self._errors.append(f"编码配置 {name} 无效: {str(e)}")
+
+    def _save(self):
+        """原子地写入配置文件，内置配置也一并写入方便修改
+
+        配置文件无法读取时抛出 ValueError，写入失败时抛出 OSError。
+        """
+        if not self.config_path:
+            return
+        if self._read_failed:
+            raise ValueError(f"配置文件 {self.config_path} 无法读取，为避免覆盖其中的设置，不会保存修改")
+        self._config['encoding_profiles'] = {name: profile.to_dict()
+                                             for name, profile in self._profiles.items()}
+        _save_json_cache(self.config_path, self._config, indent=2)
+
+    def errors(self):
+        """返回读取配置文件时发现的问题"""
+        with self._lock:
+            self._load()
+            return list(self._errors)
+
+    def names(self):
+        with self._lock:
+            self._load()
+            return list(self._profiles)
+
+    def get(self, name):
+        """按名称返回编码配置，不存在时抛出 ValueError"""
+        with self._lock:
+            self._load()
+            if name not in self._profiles:
+                raise ValueError(f"没有名为 {name} 的编码配置")
+            return self._profiles[name]
+
+    def current(self):
+        """返回当前选中的编码配置"""
+        with self._lock:
+            self._load()
+            name = self._config.get('encoding_profile')
+            return self._profiles.get(name) or self._profiles[self.DEFAULT]
+
+    def select(self, name):
+        """选中编码配置并保存到配置文件
+
+        保存失败时抛出 OSError 或 ValueError，选中的配置在本次运行中仍然有效。
+        """
+        with self._lock:
+            self._load()
+            if name not in self._profiles:
+                raise ValueError(f"没有名为 {name} 的编码配置")
+            self._config['encoding_profile'] = name
+            self._save()
+
+
+encoding_profiles = EncodingProfiles(os.path.join(get_app_dir(), 'config.json'))
+
+
+# MP4 容器可以直接封装（无需转码）的编码格式
+MP4_COPY_CODECS = {
+    'video': {'h264', 'hevc', 'av1', 'mpeg4', 'vp9'},
+    'audio': {'aac', 'mp3', 'ac3', 'eac3', 'flac', 'opus', 'alac'},
+}
+
+
+def first_stream(info, kind):
+    """返回指定类型的第一个流（忽略作为封面的图片流）"""
+    for stream in info['streams']:
+        if stream['type'] == kind and not stream['attached_pic']:
+            return stream
+    return None
+
+
+# 拼接时必须一致才能直接复制码流的参数及其显示名称
+STREAM_COPY_PARAMS = {
+    'video': [('codec', '视频编码'), ('profile', '编码档次'), ('width', '宽度'),
+              ('height', '高度'), ('pix_fmt', '像素格式'), ('fps', '帧率'),
+              ('time_base', '时间基')],
+    'audio': [('codec', '音频编码'), ('sample_rate', '采样率'), ('channels', '声道')],
+}
+
+
+def compare_stream_params(infos, kinds):
+    """比较多个文件指定类型流的编码参数，全部一致时返回 None，否则返回差异说明"""
+    for kind in kinds:
+        streams = [first_stream(info, kind) for info in infos]
+        if any(stream is None for stream in streams):
+            return f"部分文件缺少{'视频' if kind == 'video' else '音频'}流"
+        for key, label in STREAM_COPY_PARAMS[kind]:
+            values = [stream.get(key) for stream in streams]
+            if any(value != values[0] for value in values[1:]):
+                return f"{label}不一致（{' / '.join(str(value) for value in values)}）"
+    return None
+
+
+class ProcessGroup:
+    """一个任务启动的 ffmpeg 子进程
+
+    cancel() 结束组内正在运行的进程，之后再启动进程时直接抛出异常，用于中止剪辑、
+    拼接等在后台线程中同步执行的任务。可在多个线程中同时使用。
+    """
+
+    def __init__(self):
+        self.cancelled = False
+        self._processes = set()
+        self._lock = threading.Lock()
+
+    def run(self, command):
+        """执行命令直到结束，返回 CompletedProcess；任务已取消时抛出 RuntimeError"""
+        with self._lock:
+            if self.cancelled:
+                raise RuntimeError("任务已取消")
+            process = subprocess.Popen(command, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                                       stderr=subprocess.PIPE)
+            self._processes.add(process)
+        try:
+            stdout, stderr = process.communicate()
+        finally:
+            with self._lock:
+                self._processes.discard(process)
+        if self.cancelled:
+            raise RuntimeError("任务已取消")
+        return subprocess.CompletedProcess(command, process.returncode, stdout, stderr)
+
+    def cancel(self):
+        """结束所有正在运行的进程"""
+        with self._lock:
+            self.cancelled = True
+            processes = list(self._processes)
+        for process in processes:
+            try:
+                process.kill()
+            except OSError:
+                pass
+
+
+def run_ffmpeg(args, processes=None):
+    """执行 ffmpeg 命令，失败时抛出包含错误输出的异常
+
+    processes 为 ProcessGroup 时进程记录在其中，可以随任务一起中止。
+    """
+    command = [get_ffmpeg_binary(), '-hide_banner', '-nostdin', '-y'] + list(args)
+    if processes is not None:
+        result = processes.run(command)
+    else:
+        result = subprocess.run(command, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                                stderr=subprocess.PIPE)
+    if result.returncode != 0:
+        lines = result.stderr.decode('utf-8', errors='replace').strip().splitlines()
+        raise RuntimeError(lines[-1] if lines else f"ffmpeg 退出码 {result.returncode}")
+    return result
+
+
+def remux_audio_video(video_path, audio_path, output_path):
+    """直接复制码流将视频流和音频流封装为 MP4，不解码不转码
+
+    编码格式无法放入 MP4 时抛出 ValueError，由调用方决定是否转码。
+    """
+    video_stream = first_stream(probe_media(video_path), 'video')
+    audio_stream = first_stream(probe_media(audio_path), 'audio')
+    if video_stream is None or audio_stream is None:
+        raise ValueError("缺少视频流或音频流")
+    if video_stream['codec'] not in MP4_COPY_CODECS['video']:
+        raise ValueError(f"视频编码 {video_stream['codec']} 无法直接封装为 MP4")
+    if audio_stream['codec'] not in MP4_COPY_CODECS['audio']:
+        raise ValueError(f"音频编码 {audio_stream['codec']} 无法直接封装为 MP4")
+
+    args = ['-i', video_path, '-i', audio_path,
+            '-map', f"0:{video_stream['index']}", '-map', f"1:{audio_stream['index']}",
+            '-c', 'copy', '-movflags', '+faststart']
+    if video_stream['codec'] == 'hevc':
+        # 使用 hvc1 标签以兼容 QuickTime 等播放器
+        args += ['-tag:v', 'hvc1']
+    run_ffmpeg(args + [output_path])
+
+
+def copy_audio_range(file_path, stream_index, start, end, output_path, processes=None):
+    """直接复制码流剪出音频的 [start, end)，按音频帧边界截断
+
+    在输出端定位：输入端定位时直接复制会保留定位点之前约 1 秒的预读数据包（时间戳为负，
+    MP4 用编辑列表隐藏），concat demuxer 拼接时会把它们一起播放，时长变长且音画错位。
+    """
+    run_ffmpeg(['-i', file_path, '-ss', f'{start:.6f}', '-t', f'{end - start:.6f}',
+                '-map', f'0:{stream_index}', '-c', 'copy', output_path], processes)
+
+
+def format_time_label(seconds):
+    """将秒数转换为 HH-mm-ss 格式，有毫秒时追加 .zzz，用于输出文件名"""
+    total_ms = int(round(seconds * 1000))
+    hours = total_ms // 3600000
+    minutes = (total_ms % 3600000) // 60000
+    secs = (total_ms % 60000) // 1000
+    ms = total_ms % 1000
+    label = f"{hours:02d}-{minutes:02d}-{secs:02d}"
+    if ms:
+        label += f".{ms:03d}"
+    return label
+
+
+def qtime_to_seconds(qtime):
+    """将 QTime 转换为秒数（精确到毫秒）"""
+    return (qtime.hour() * 3600 + qtime.minute() * 60 + qtime.second()
+            + qtime.msec() / 1000)
+
+
+def seconds_to_qtime(seconds):
+    """将秒数转换为 QTime（精确到毫秒）"""
+    total_ms = int(seconds * 1000)
+    return QTime(total_ms // 3600000, (total_ms % 3600000) // 60000,
+                 (total_ms % 60000) // 1000, total_ms % 1000)
+
+
+def parse_time_text(text):
+    """解析 HH:MM:SS.zzz、MM:SS 或秒数形式的时间，返回秒数"""
+    parts = text.strip().split(':')
+    if not 1 <= len(parts) <= 3:
+        raise ValueError(f"无法识别的时间: {text}")
+    seconds = 0.0
+    for part in parts:
+        seconds = seconds * 60 + float(part)
+    if seconds < 0:
+        raise ValueError(f"无法识别的时间: {text}")
+    return seconds
+
+
+def format_time_text(seconds):
+    """将秒数格式化为 HH:MM:SS.zzz，与 parse_time_text 互逆"""
+    total_ms = int(round(seconds * 1000))
+    return (f"{total_ms // 3600000:02d}:{total_ms % 3600000 // 60000:02d}:"
+            f"{total_ms % 60000 // 1000:02d}.{total_ms % 1000:03d}")
+
+
+def _is_time_text(text):
+    """text 能否被 parse_time_text 解析"""
+    try:
+        parse_time_text(text)
+    except ValueError:
+        return False
+    return True
+
+
+def parse_cue_list(text):
+    """解析剪辑列表，返回 [(开始秒, 结束秒, 名称)]
+
+    每行一个片段：开始时间 结束时间 [名称]，用空白或逗号分隔（即也可以是 CSV），
+    名称可以省略；忽略空行、# 开头的注释和第一行的表头（前两列都不是时间）。
+    其他无法解析的行抛出 ValueError 并指出行号。
+    """
+    cues = []
+    header_allowed = True
+    for number, line in enumerate(text.splitlines(), 1):
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        fields = line.split(',', 2) if ',' in line else line.split(None, 2)
+        try:
+            start, end = parse_time_text(fields[0]), parse_time_text(fields[1])
+        except (ValueError, IndexError):
+            if header_allowed and len(fields) > 1 and not any(
+                    _is_time_text(field) for field in fields[:2]):
+                header_allowed = False
+                continue
+            raise ValueError(f"剪辑列表第{number}行格式不正确: {line}")
+        header_allowed = False
+        if start >= end:
+            raise ValueError(f"剪辑列表第{number}行的开始时间必须小于结束时间")
+        name = fields[2].strip().strip('"') if len(fields) > 2 else ''
+        cues.append((start, end, name))
+    return cues
+
+
+def load_cue_file(file_path):
+    """从文本/CSV、JSON 或 ffmpeg 章节文件（FFMETADATA）读取剪辑列表"""
+    with open(file_path, 'r', encoding='utf-8-sig') as f:
+        text = f.read()
+
+    if file_path.lower().endswith('.json'):
+        data = json.loads(text)
+        if isinstance(data, dict):
+            # ffprobe -show_chapters 的输出
+            data = [{'start': chapter['start_time'], 'end': chapter['end_time'],
+                     'name': (chapter.get('tags') or {}).get('title', '')}
+                    for chapter in data.get('chapters', [])]
+        cues = []
+        for item in data:
+            if isinstance(item, dict):
+                start, end = item['start'], item['end']
+                name = item.get('name') or item.get('title') or ''
+            else:
+                start, end, name = (list(item) + [''])[:3]
+            start, end = parse_time_text(str(start)), parse_time_text(str(end))
+            if start >= end:
+                raise ValueError("剪辑列表中片段的开始时间必须小于结束时间")
+            cues.append((start, end, str(name)))
+        return cues
+
+    if text.startswith(';FFMETADATA'):
+        cues = []
+        chapter = None
+        for line in text.splitlines() + ['[END]']:
+            line = line.strip()
+            if line.startswith('['):
+                if chapter and 'START' in chapter and 'END' in chapter:
+                    num, den = chapter.get('TIMEBASE', '1/1000').split('/')
+                    scale = int(num) / int(den)
+                    cues.append((int(chapter['START']) * scale, int(chapter['END']) * scale,
+                                 chapter.get('title', '')))
+                chapter = {} if line.upper() == '[CHAPTER]' else None
+            elif chapter is not None and '=' in line:
+                key, value = line.split('=', 1)
+                chapter[key if key == 'title' else key.upper()] = value
+        return cues
+
+    return parse_cue_list(text)
+
+
+_ffmpeg_encoders = None
+
+
+def ffmpeg_has_encoder(name):
+    """判断 ffmpeg 是否支持指定编码器"""
+    global _ffmpeg_encoders
+    if _ffmpeg_encoders is None:
+        result = subprocess.run([get_ffmpeg_binary(), '-hide_banner', '-encoders'],
+                                stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                                stderr=subprocess.DEVNULL)
+        output = result.stdout.decode('utf-8', errors='replace')
+        _ffmpeg_encoders = set(re.findall(r'^\s*[VAS][A-Z.]{5}\s+(\S+)', output, re.MULTILINE))
+    return name in _ffmpeg_encoders
+
+
+class SmartRenderer:
+    """智能剪辑引擎
+
+    只重新编码剪切点所在的不完整 GOP，中间完整的 GOP 直接复制数据包。
+    各段都转换为在码流内携带参数集（Annex B）的形式，拼接时解码器能跟随参数集切换；
+    音频按精确区间单独编码。
+    编码工作量与剪辑时长无关，只和两端 GOP 的长度有关。
+    边界的编码器由原视频决定，速度预设、质量目标、线程数和音频参数取自编码配置。
+    """
+
+    # 支持智能剪辑的视频编码及其转换为 Annex B 的码流过滤器、对应编码器
+    CODECS = {
+        'h264': ('h264_mp4toannexb', 'libx264'),
+        'hevc': ('hevc_mp4toannexb', 'libx265'),
+    }
+    # 在剪切点附近扫描关键帧的范围（秒）
+    SCAN_WINDOW = 20
+    # 时间比较容差（秒）
+    EPSILON = 0.001
+
+    def __init__(self, progress_callback=None, profile=None, processes=None):
+        self.progress_callback = progress_callback
+        self.profile = profile or encoding_profiles.current()
+        # 启动的 ffmpeg 进程记录在所属任务的 ProcessGroup 中
+        self.processes = processes
+        # 最近一次 render 重新编码的边界片段数，为 0 时整段都是直接复制的
+        self.encoded_pieces = 0
+
+    def _report(self, message):
+        if self.progress_callback:
+            self.progress_callback(message)
+
+    def _keyframe_packets(self, file_path, start, end, start_time):
+        """返回区间附近关键帧的 (pts, dts) 列表"""
+        return keyframe_index.keyframes(file_path, start, end, start_time)
+
+    def _find_copy_range(self, file_path, start, end, start_time):
+        """返回可直接复制的关键帧区间 (起点 pts, 终点 pts, 终点 dts)，没有完整 GOP 时返回 None"""
+        head = [k for k in self._keyframe_packets(file_path, start, min(end, start + self.SCAN_WINDOW),
+                                                  start_time) if k[0] >= start - self.EPSILON]
+        if not head:
+            head = [k for k in self._keyframe_packets(file_path, start, end, start_time)
+                    if k[0] >= start - self.EPSILON]
+        tail = [k for k in self._keyframe_packets(file_path, max(start, end - self.SCAN_WINDOW), end,
+                                                  start_time) if k[0] <= end + self.EPSILON]
+        if not head or not tail:
+            return None
+        (inner_start, _), (inner_end, inner_end_dts) = head[0], tail[-1]
+        if inner_end - inner_start <= self.EPSILON:
+            return None
+        return inner_start, inner_end, inner_end_dts
+
+    def _encode_args(self, stream, encoder):
+        """生成与原视频参数一致的编码参数"""
+        args = (['-c:v', encoder, '-preset', self.profile.preset] + self.profile.quality_args()
+                + self.profile.thread_args() + ['-fps_mode', 'passthrough'])
+        if stream.get('pix_fmt'):
+            args += ['-pix_fmt', stream['pix_fmt']]
+        profile = (stream.get('profile') or '').lower()
+        if encoder == 'libx264' and profile in ('baseline', 'main', 'high'):
+            args += ['-profile:v', profile]
+        if encoder == 'libx265':
+            args += ['-x265-params', 'log-level=error']
+        return args
+
+    def render(self, file_path, start, end, output_path, include_audio=True, copy_audio=False):
+        """将 [start, end) 剪辑到 output_path，无法智能剪辑时抛出 ValueError
+
+        copy_audio 为 True 时音频按帧边界直接复制，不按编码配置重新编码。
+        """
+        info = media_probe.probe(file_path)
+        video_stream = first_stream(info, 'video')
+        audio_stream = first_stream(info, 'audio') if include_audio else None
+        if video_stream is None:
+            raise ValueError("文件不包含视频流")
+        if video_stream['codec'] not in self.CODECS:
+            raise ValueError(f"不支持智能剪辑的视频编码: {video_stream['codec']}")
+        bsf, encoder = self.CODECS[video_stream['codec']]
+        if not ffmpeg_has_encoder(encoder):
+            raise ValueError(f"ffmpeg 缺少编码器 {encoder}")
+
+        copy_range = self._find_copy_range(file_path, start, end, info['start_time'])
+        video_map = f"0:{video_stream['index']}"
+        encode_args = self._encode_args(video_stream, encoder)
+        work_dir = tempfile.mkdtemp(prefix='smart_render_', dir=os.path.dirname(output_path) or None)
+        try:
+            # (起点, 终点, 是否复制)
+            if copy_range is None:
+                pieces = [(start, end, False)]
+            else:
+                inner_start, inner_end, inner_end_dts = copy_range
+                pieces = []
+                if inner_start - start > self.EPSILON:
+                    pieces.append((start, inner_start, False))
+                pieces.append((inner_start, inner_end, True))
+                if end - inner_end > self.EPSILON:
+                    pieces.append((inner_end, end, False))
+            self.encoded_pieces = sum(1 for _, _, copy in pieces if not copy)
+
+            piece_paths = []
+            for i, (piece_start, piece_end, copy) in enumerate(pieces):
+                piece_path = os.path.join(work_dir, f'piece_{i}.mp4')
+                if copy:
+                    self._report(f"智能剪辑：复制完整 GOP {piece_start:.3f}s - {piece_end:.3f}s")
+                    # 向后偏移半毫秒，避免浮点误差导致定位到前一个关键帧
+                    seek = piece_start + 0.0005
+                    # 复制时按解码时间截断，截止到结束关键帧之前的最后一个数据包，
+                    # 避免把结束关键帧之后显示的帧也复制进来
+                    args = ['-ss', f'{seek:.6f}', '-i', file_path,
+                            '-t', f'{inner_end_dts - seek:.6f}', '-map', video_map,
+                            '-c:v', 'copy', '-bsf:v', bsf]
+                else:
+                    self._report(f"智能剪辑：重新编码边界 {piece_start:.3f}s - {piece_end:.3f}s")
+                    args = ['-ss', f'{piece_start:.6f}', '-i', file_path,
+                            '-t', f'{piece_end - piece_start:.6f}', '-map', video_map] + encode_args
+                    args += ['-bsf:v', bsf]
+                run_ffmpeg(args + ['-an', '-avoid_negative_ts', 'make_zero', piece_path],
+                           self.processes)
+                piece_paths.append(piece_path)
+
+            list_path = os.path.join(work_dir, 'pieces.txt')
+            with open(list_path, 'w', encoding='utf-8') as f:
+                for piece_path in piece_paths:
+                    f.write(f"file '{piece_path}'\n")
+
+            self._report("智能剪辑：拼接片段...")
+            args = ['-f', 'concat', '-safe', '0', '-i', list_path]
+            if audio_stream is not None and copy_audio:
+                audio_path = os.path.join(work_dir, 'audio.mp4')
+                copy_audio_range(file_path, audio_stream['index'], start, end, audio_path,
+                                 self.processes)
+                args += ['-i', audio_path, '-map', '0:v:0', '-map', '1:a:0', '-c:a', 'copy']
+            elif audio_stream is not None:
+                args += ['-ss', f'{start:.6f}', '-t', f'{end - start:.6f}', '-i', file_path,
+                         '-map', '0:v:0', '-map', f"1:{audio_stream['index']}"]
+                args += self.profile.audio_args()
+            else:
+                args += ['-map', '0:v:0']
+            args += ['-c:v', 'copy', '-movflags', '+faststart']
+            if video_stream['codec'] == 'hevc':
+                args += ['-tag:v', 'hvc1']
+            run_ffmpeg(args + [output_path], self.processes)
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+        return output_path
+
+
+def physical_memory():
+    """返回物理内存大小（字节），无法获取时返回 None"""
+    try:
+        return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+class ChunkedEncoder:
+    """分段并行编码器
+
+    在关键帧处把时间轴切成若干段（编码器通常在场景切换处放置关键帧），每段由一个
+    独立的 ffmpeg 进程解码并按编码配置编码，多个进程同时运行以用满所有 CPU 核心；
+    各段都以 IDR 帧开头、码流参数一致，最后用 concat 直接复制拼接，不再重新编码。
+    音频很轻，作为一个单独的任务完整编码一次。
+    同时运行的进程数受 CPU 核心数（或编码配置的线程数）和内存上限两方面限制。
+    """
+
+    # 每段的最短时长（秒），太短时进程启动和 GOP 开销占比过高
+    MIN_CHUNK_SECONDS = 4
+    # 每个核心分到的段数，多于 1 段可以平衡各段编码速度的差异
+    CHUNKS_PER_WORKER = 2
+
+    def __init__(self, workers=None, memory_limit=None, progress_callback=None, profile=None,
+                 processes=None):
+        self.profile = profile or encoding_profiles.current()
+        # 启动的 ffmpeg 进程记录在所属任务的 ProcessGroup 中
+        self.processes = processes
+        self.workers = max(1, workers or self.profile.threads or os.cpu_count() or 1)
+        # 默认最多使用一半的物理内存
+        self.memory_limit = memory_limit or (physical_memory() or 8 * 1024 ** 3) // 2
+        self.progress_callback = progress_callback
+
+    def _report(self, message):
+        if self.progress_callback:
+            self.progress_callback(message)
+
+    @staticmethod
+    def audio_source(file_path, start, end, stream_index, codec_args):
+        """生成从文件中截取 [start, end) 音频的输入描述 (输入参数, 映射, 编码参数)"""
+        return (['-ss', f'{start:.6f}', '-t', f'{end - start:.6f}', '-i', file_path],
+                f'0:{stream_index}', codec_args)
+
+    def _process_memory(self, stream):
+        """估算一个编码进程的内存占用（字节）：解码和编码前瞻缓存的帧加上固定开销"""
+        frame_bytes = (stream.get('width') or 1920) * (stream.get('height') or 1080) * 3 // 2
+        return frame_bytes * 80 + 64 * 1024 * 1024
+
+    def split_points(self, file_path, start, end, start_time):
+        """返回各段的边界 [start, ..., end]，中间的边界都是关键帧"""
+        duration = end - start
+        count = min(self.workers * self.CHUNKS_PER_WORKER,
+                    int(duration // self.MIN_CHUNK_SECONDS))
+        if count <= 1:
+            return [start, end]
+        keyframes = [pts for pts, _ in keyframe_index.keyframes(file_path, start, end, start_time)
+                     if start + self.MIN_CHUNK_SECONDS / 2 < pts < end - self.MIN_CHUNK_SECONDS / 2]
+        points = [start]
+        for i in range(1, count):
+            ideal = start + duration * i / count
+            index = bisect.bisect_left(keyframes, ideal)
+            candidates = keyframes[max(0, index - 1):index + 1]
+            if not candidates:
+                continue
+            point = min(candidates, key=lambda t: abs(t - ideal))
+            if point - points[-1] >= self.MIN_CHUNK_SECONDS / 2:
+                points.append(point)
+        points.append(end)
+        return points
+
+    def encode(self, file_path, start, end, output_path, video_filter=None, audio=None):
+        """把 file_path 中第一个视频流的 [start, end) 重新编码为 output_path（MP4）
+
+        video_filter 为可选的视频滤镜；audio 为 audio_source 格式的音频输入描述，
+        为 None 时不输出音频。
+        """
+        info = media_probe.probe(file_path)
+        video_stream = first_stream(info, 'video')
+        if video_stream is None:
+            raise ValueError("文件不包含视频流")
+        if not ffmpeg_has_encoder(self.profile.video_codec):
+            raise ValueError(f"ffmpeg 缺少编码器 {self.profile.video_codec}")
+
+        points = self.split_points(file_path, start, end, info['start_time'])
+        chunks = list(zip(points, points[1:]))
+        memory_slots = max(1, self.memory_limit // self._process_memory(video_stream))
+        concurrency = max(1, min(self.workers, memory_slots, len(chunks) + (audio is not None)))
+        # 进程数少于核心数时让每个 x264 进程多用几个线程
+        threads = max(1, self.workers // concurrency)
+
+        work_dir = tempfile.mkdtemp(prefix='chunked_encode_',
+                                    dir=os.path.dirname(os.path.abspath(output_path)))
+        try:
+            jobs = []
+            chunk_paths = []
+            for i, (chunk_start, chunk_end) in enumerate(chunks):
+                chunk_path = os.path.join(work_dir, f'chunk_{i:04d}.mp4')
+                args = ['-ss', f'{chunk_start:.6f}', '-i', file_path,
+                        '-t', f'{chunk_end - chunk_start:.6f}',
+                        '-map', f"0:{video_stream['index']}", '-an']
+                if video_filter:
+                    args += ['-vf', video_filter]
+                # 各段的编码参数必须一致才能直接拼接
+                args += self.profile.video_args() + ['-pix_fmt', 'yuv420p',
+                                                     '-fps_mode', 'passthrough']
+                args += ['-threads', str(threads), '-bsf:v', self.profile.bitstream_filter,
+                         chunk_path]
+                jobs.append(args)
+                chunk_paths.append(chunk_path)
+            audio_path = None
+            if audio is not None:
+                input_args, audio_map, codec_args = audio
+                audio_path = os.path.join(work_dir, 'audio.m4a')
+                jobs.append(input_args + ['-map', audio_map, '-vn'] + list(codec_args)
+                            + [audio_path])
+
+            self._report(f"并行编码：{len(chunks)} 段，同时运行 {concurrency} 个编码进程...")
+            finished = 0
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                futures = [pool.submit(run_ffmpeg, args, self.processes) for args in jobs]
+                try:
+                    for future in as_completed(futures):
+                        future.result()
+                        finished += 1
+                        self._report(f"并行编码：已完成 {finished}/{len(jobs)} 个任务")
+                except BaseException:
+                    for future in futures:
+                        future.cancel()
+                    raise
+
+            list_path = os.path.join(work_dir, 'chunks.txt')
+            with open(list_path, 'w', encoding='utf-8') as f:
+                for chunk_path in chunk_paths:
+                    f.write(f"file '{chunk_path}'\n")
+            args = ['-f', 'concat', '-safe', '0', '-i', list_path]
+            if audio_path is not None:
+                args += ['-i', audio_path, '-map', '0:v:0', '-map', '1:a:0']
+            else:
+                args += ['-map', '0:v:0']
+            run_ffmpeg(args + ['-c', 'copy', '-movflags', '+faststart'] + self.profile.tag_args()
+                       + [output_path], self.processes)
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+        return output_path
+
+
+class DownloadJournal:
+    """断点续传日志
+
+    以 JSON 形式保存在 .part 文件旁，记录远程对象的 ETag/Content-Length
+    和已经写入 .part 文件的字节区间，重启后只需请求缺失的区间。
+    """
+
+    def __init__(self, path, etag=None, content_length=0, completed=None):
+        self.path = path
+        self.etag = etag
+        self.content_length = content_length
+        self.completed = completed or []
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path):
+        """读取日志文件，不存在或损坏时返回 None"""
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            completed = [(int(s), int(e)) for s, e in data.get('completed', [])]
+            return cls(path, data.get('etag'), int(data.get('content_length', 0)), completed)
+        except (OSError, ValueError, TypeError):
+            return None
+
+    def matches(self, etag, content_length):
+        """判断日志是否属于同一个远程对象"""
+        if self.content_length != content_length:
+            return False
+        # 服务器没有返回 ETag 时只能依赖文件长度判断
+        return not (self.etag and etag) or self.etag == etag
+
+    def add_range(self, start, end):
+        """记录一个已完成的闭区间并与相邻区间合并"""
+        with self._lock:
+            ranges = sorted(self.completed + [(start, end)])
+            merged = []
+            for s, e in ranges:
+                if merged and s <= merged[-1][1] + 1:
+                    merged[-1] = (merged[-1][0], max(merged[-1][1], e))
+                else:
+                    merged.append((s, e))
+            self.completed = merged
+
+    def completed_size(self):
+        """已完成的字节数"""
+        with self._lock:
+            return sum(e - s + 1 for s, e in self.completed)
+
+    def missing_ranges(self):
+        """返回尚未下载的闭区间列表"""
+        with self._lock:
+            missing = []
+            position = 0
+            for s, e in self.completed:
+                if s > position:
+                    missing.append((position, s - 1))
+                position = max(position, e + 1)
+            if position < self.content_length:
+                missing.append((position, self.content_length - 1))
+            return missing
+
+    def save(self):
+        """原子地写入日志文件"""
+        with self._lock:
+            data = {
+                'etag': self.etag,
+                'content_length': self.content_length,
+                'completed': self.completed,
+            }
+            _save_json_cache(self.path, data)
+
+    def remove(self):
+        """下载完成后删除日志文件"""
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+DOWNLOAD_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
+    'Referer': 'https://www.bilibili.com'
+}
+
+
+class FileWriter:
+    """.part 文件的后台写入线程
+
+    网络协程把收到的数据攒成大块后放入有界缓冲池，写入线程按偏移写盘，写完后
+    才把区间记入断点续传日志。缓冲池满时提交方等待空位，磁盘跟不上时网络读取
+    随之放慢（背压），而不会阻塞事件循环。
+    """
+
+    def __init__(self, path, journal=None, max_blocks=8, journal_interval=4 * 1024 * 1024):
+        self.path = path
+        self.journal = journal
+        self.journal_interval = journal_interval
+        self.written = 0
+        self.error = None
+        self._loop = asyncio.get_running_loop()
+        self._slots = asyncio.Semaphore(max_blocks)
+        self._queue = queue.Queue()
+        self._unsaved = 0
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    async def submit(self, offset, data):
+        """提交一个数据块，缓冲池满时等待"""
+        if self.error is not None:
+            raise self.error
+        await self._slots.acquire()
+        self._queue.put((offset, data, True))
+
+    def submit_nowait(self, offset, data):
+        """不等待空位直接提交，用于分段退出时写回剩余数据"""
+        self._queue.put((offset, data, False))
+
+    async def close(self):
+        """写完所有已提交的数据后结束写入线程，写入出错时抛出异常"""
+        self._queue.put(None)
+        await self._loop.run_in_executor(None, self._thread.join)
+        if self.error is not None:
+            raise self.error
+
+    def _run(self):
+        try:
+            f = open(self.path, 'r+b', buffering=0)
+        except OSError as e:
+            self.error = e
+            f = None
+        try:
+            while True:
+                item = self._queue.get()
+                if item is None:
+                    break
+                offset, data, holds_slot = item
+                if f is not None and self.error is None:
+                    try:
+                        f.seek(offset)
+                        f.write(data)
+                        self.written += len(data)
+                        if self.journal is not None:
+                            self.journal.add_range(offset, offset + len(data) - 1)
+                            self._unsaved += len(data)
+                            if self._unsaved >= self.journal_interval:
+                                self.journal.save()
+                                self._unsaved = 0
+                    except OSError as e:
+                        self.error = e
+                if holds_slot:
+                    try:
+                        self._loop.call_soon_threadsafe(self._slots.release)
+                    except RuntimeError:
+                        # 事件循环已关闭，没有等待方了
+                        pass
+        finally:
+            if f is not None:
+                f.close()
+
+
+class MemoryWriter:
+    """在内存中按偏移收集一个分段的数据，接口与 FileWriter 相同，用于流式下载"""
+
+    def __init__(self, start, size):
+        self.start = start
+        self.data = bytearray(size)
+        self.written = 0
+
+    async def submit(self, offset, data):
+        self.submit_nowait(offset, data)
+
+    def submit_nowait(self, offset, data):
+        index = offset - self.start
+        self.data[index:index + len(data)] = data
+        self.written += len(data)
+
+
+class OffsetWriter:
+    """把偏移平移 delta 后交给另一个 writer，用于把不相邻的区间首尾相接地写入文件"""
+
+    def __init__(self, writer, delta):
+        self.writer = writer
+        self.delta = delta
+
+    async def submit(self, offset, data):
+        await self.writer.submit(offset + self.delta, data)
+
+    def submit_nowait(self, offset, data):
+        self.writer.submit_nowait(offset + self.delta, data)
+
+
+# 连接断开、超时等可以从断点重试的错误
+RETRY_ERRORS = (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError, asyncio.TimeoutError)
+
+
+class HttpClient:
+    """进程共享的 HTTP 客户端
+
+    下载和 bilibili_api 的请求共用事件循环中的同一个 aiohttp 会话：保持长连接，
+    限制每个主机的连接数（超出时排队等待空闲连接），并缓存 DNS 解析结果。
+    bilibili_api 第一次请求时会自己创建会话，之后替换掉的会话不会被关闭，
+    所以调用 bilibili_api 之前要先调用 session() 装上共享会话。
+    """
+
+    def __init__(self, per_host_connections=16, total_connections=100, dns_ttl=300):
+        self.per_host_connections = per_host_connections
+        self.total_connections = total_connections
+        self.dns_ttl = dns_ttl
+        self._sessions = {}
+
+    def session(self):
+        """返回当前事件循环的会话，必须在事件循环中调用"""
+        loop = asyncio.get_running_loop()
+        session = self._sessions.get(loop)
+        if session is None or session.closed:
+            from bilibili_api.utils.network import set_aiohttp_session
+            connector = aiohttp.TCPConnector(limit=self.total_connections,
+                                             limit_per_host=self.per_host_connections,
+                                             ttl_dns_cache=self.dns_ttl)
+            session = aiohttp.ClientSession(connector=connector, headers=DOWNLOAD_HEADERS,
+                                            trust_env=True)
+            self._sessions[loop] = session
+            # bilibili_api 的请求也走同一个连接池
+            set_aiohttp_session(session)
+        return session
+
+    async def close(self):
+        """关闭当前事件循环的会话"""
+        session = self._sessions.pop(asyncio.get_running_loop(), None)
+        if session is not None:
+            await session.close()
+
+
+http_client = HttpClient()
+
+
+class MirrorError(Exception):
+    """当前镜像不可用（速度过慢或返回的内容不一致），需要换到其他镜像"""
+
+
+class MirrorStats:
+    """CDN 镜像主机的速度统计
+
+    按主机记录连接延迟、单连接下载速度（指数平滑）和失败次数，保存在磁盘（JSON）
+    中，之后的下载优先使用表现最好的主机。
+    """
+
+    SMOOTHING = 0.3
+    # 统计数据在这段时间内（秒）视为可信，可以跳过镜像测速直接使用
+    FRESH_SECONDS = 1800
+    SAVE_INTERVAL = 5
+
+    def __init__(self, cache_path=None, max_entries=200):
+        self.cache_path = cache_path
+        self.max_entries = max_entries
+        self._entries = None
+        self._dirty = False
+        self._last_save = 0
+        self._lock = threading.Lock()
+
+    def _load(self):
+        """首次使用时读取磁盘缓存"""
+        if self._entries is None:
+            self._entries = _load_json_cache(self.cache_path)
+
+    def _save(self):
+        """原子地写入磁盘缓存"""
+        if not self.cache_path:
+            return
+        try:
+            _save_json_cache(self.cache_path, self._entries)
+            self._dirty = False
+            self._last_save = time.time()
+        except OSError as e:
+            print(f"保存镜像统计失败: {str(e)}")
+
+    def _smooth(self, old, value):
+        return value if old is None else old + self.SMOOTHING * (value - old)
+
+    def record(self, url, latency=None, rate=None, failed=False):
+        """记录一次请求的延迟（秒）、单连接速度（字节/秒）或失败"""
+        host = urlparse(url).netloc
+        with self._lock:
+            self._load()
+            entry = self._entries.pop(host, None) or {
+                'latency': None, 'rate': None, 'failures': 0, 'updated': 0}
+            if latency is not None:
+                entry['latency'] = self._smooth(entry['latency'], latency)
+            if rate is not None:
+                entry['rate'] = self._smooth(entry['rate'], rate)
+            if failed:
+                entry['failures'] += 1
+            elif rate is not None:
+                # 成功的传输逐渐抵消以前的失败
+                entry['failures'] //= 2
+            entry['updated'] = time.time()
+            self._entries[host] = entry
+            while len(self._entries) > self.max_entries:
+                self._entries.pop(next(iter(self._entries)))
+            self._dirty = True
+            if time.time() - self._last_save >= self.SAVE_INTERVAL:
+                self._save()
+
+    def _entry(self, url):
+        with self._lock:
+            self._load()
+            return self._entries.get(urlparse(url).netloc)
+
+    def rank(self, urls):
+        """按预期速度排列镜像：没有失败的已知主机在前，其次是未测过的主机，最后是失败过的主机"""
+        good, unknown, failing = [], [], []
+        for url in urls:
+            entry = self._entry(url)
+            if entry is None or not entry['rate']:
+                unknown.append(url)
+            elif entry['failures']:
+                failing.append((entry['rate'] / (1 + entry['failures']), url))
+            else:
+                good.append((entry['rate'], url))
+        good.sort(key=lambda item: -item[0])
+        failing.sort(key=lambda item: -item[0])
+        return [url for _, url in good] + unknown + [url for _, url in failing]
+
+    def best_rate(self, urls):
+        """这些镜像中已知的最高单连接速度，都没有测过时返回 None"""
+        rates = []
+        for url in urls:
+            entry = self._entry(url)
+            if entry is not None and entry['rate']:
+                rates.append(entry['rate'] / (1 + entry['failures']))
+        return max(rates) if rates else None
+
+    def is_fresh(self, url):
+        """主机最近测过速且没有失败过"""
+        entry = self._entry(url)
+        return (entry is not None and bool(entry['rate']) and not entry['failures']
+                and time.time() - entry['updated'] < self.FRESH_SECONDS)
+
+    def flush(self):
+        """把尚未落盘的修改写入磁盘"""
+        with self._lock:
+            if self._entries is not None and self._dirty:
+                self._save()
+
+
+mirror_stats = MirrorStats(os.path.join(get_app_dir(), 'cache', 'mirror_stats.json'))
+
+
+class RangedDownloader:
+    """分段并发下载器
+
+    先用 Range 请求探测服务器是否支持断点续传，支持时将文件按字节区间切分，
+    多个连接并发拉取并写入预分配文件的对应偏移；服务器忽略 Range 时退回单连接下载。
+    未完成的数据保存在 .part 文件中，配合 DownloadJournal 可以在中断后续传，
+    连接中途断开时按指数退避重试剩余区间。所有网络操作都是异步的，
+    多个下载可以在同一个事件循环中并发进行；收到的数据攒成按 WRITE_ALIGN 对齐的
+    大块交给 FileWriter 在后台线程写盘，块大小随网络速度调整。
+
+    提供多个镜像地址时，先对排名靠前的镜像并发发起小区间请求测速，选最快的开始
+    下载；传输中某个镜像出错或某个连接明显慢于其他连接时换到下一个镜像继续。
+    各主机的速度记录在 mirror_stats 中，之后的下载直接从最好的主机开始。
+
+    stream() 不写文件，按顺序把数据交给调用方（例如直接送入 ffmpeg）。
+    """
+
+    WRITE_ALIGN = 64 * 1024
+    MIN_WRITE_BLOCK = 256 * 1024
+    MAX_WRITE_BLOCK = 8 * 1024 * 1024
+    # 每个写入块大约容纳这么多秒的网络数据
+    WRITE_BLOCK_SECONDS = 0.25
+    # 同时测速的镜像数量和每个镜像测速下载的字节数
+    RACE_MIRRORS = 3
+    RACE_BYTES = 256 * 1024
+    # 每隔 SLOW_WINDOW 秒检查一次连接速度。某个连接低于所有连接平均速度的 SLOW_RATIO，
+    # 或者当前镜像的总速度低于其他镜像单连接速度的 SLOW_RATIO 时换镜像
+    SLOW_WINDOW = 5
+    SLOW_RATIO = 0.25
+
+    def __init__(self, headers=None, connections=8, min_segment_size=2 * 1024 * 1024,
+                 chunk_size=256 * 1024, timeout=30, progress_callback=None,
+                 max_retries=5, backoff_base=0.5, backoff_max=16,
+                 journal_interval=4 * 1024 * 1024, client=None, max_write_blocks=8,
+                 stats=None, min_mirror_rate=32 * 1024):
+        self.headers = dict(headers or {})
+        self.client = client or http_client
+        self.stats = stats or mirror_stats
+        # 单个连接低于这个速度（字节/秒）时，有其他镜像可用就换镜像
+        self.min_mirror_rate = min_mirror_rate
+        self.connections = max(1, connections)
+        self.min_segment_size = min_segment_size
+        self.chunk_size = chunk_size
+        self.timeout = aiohttp.ClientTimeout(total=None, sock_connect=timeout, sock_read=timeout)
+        self.progress_callback = progress_callback
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.journal_interval = journal_interval
+        self.max_write_blocks = max_write_blocks
+        self._cancelled = False
+        self._tasks = []
+        self._downloaded = 0
+        self._total_size = 0
+        self._etag = None
+        self._writer = None
+        self._received = 0
+        self._started = 0
+        self._block_size = self.MIN_WRITE_BLOCK
+        self._rate_mark = (0, 0)
+        self._mirrors = []
+        self._url = None
+        self._probe_host = None
+        self._active = 0
+        # 换到当前镜像的时间和当时已收到的字节数
+        self._mirror_mark = (0, 0)
+        # 流式下载时已交给调用方的字节数
+        self._delivered = 0
+        self.switches = 0
+
+    def throughput(self):
+        """返回 (网络速度, 写入速度)，单位为字节/秒，按本次下载开始以来的平均值计算
+
+        写入速度为写入磁盘的速度，流式下载时为交给调用方的速度。
+        """
+        elapsed = time.monotonic() - self._started if self._started else 0
+        if elapsed <= 0:
+            return 0, 0
+        written = self._writer.written if self._writer is not None else self._delivered
+        return self._received / elapsed, written / elapsed
+
+    def _adapt_block_size(self):
+        """根据最近的网络速度调整写入块大小"""
+        now = time.monotonic()
+        mark_time, mark_bytes = self._rate_mark
+        if now - mark_time < 0.5:
+            return
+        rate = (self._received - mark_bytes) / (now - mark_time) if mark_time else 0
+        self._rate_mark = (now, self._received)
+        if rate > 0:
+            size = int(rate * self.WRITE_BLOCK_SECONDS) // self.WRITE_ALIGN * self.WRITE_ALIGN
+            self._block_size = max(self.MIN_WRITE_BLOCK, min(self.MAX_WRITE_BLOCK, size))
+
+    def _block_end(self, offset):
+        """offset 所在写入块的结束偏移（不含），块边界按 WRITE_ALIGN 对齐"""
+        return offset // self.WRITE_ALIGN * self.WRITE_ALIGN + self._block_size
+
+    async def probe(self, url):
+        """探测文件大小和 Range 支持情况
+
+        返回 (total_size, supports_range, response)。服务器忽略 Range 时返回的
+        response 是完整内容的流式响应，可直接用于单连接下载，避免重复请求。
+        """
+        headers = dict(self.headers, Range='bytes=0-0')
+        response = await self.client.session().get(url, headers=headers, timeout=self.timeout)
+        try:
+            response.raise_for_status()
+        except aiohttp.ClientResponseError:
+            response.release()
+            raise
+        self._etag = response.headers.get('etag')
+        self._probe_host = urlparse(url).netloc
+
+        if response.status == 206:
+            content_range = response.headers.get('content-range', '')
+            # 读完仅有的一个字节，连接才能放回连接池复用
+            await response.read()
+            match = re.match(r'bytes\s+\d+-\d+/(\d+)', content_range)
+            if match:
+                return int(match.group(1)), True, None
+            # 未知总长度时无法切分，重新以单连接下载
+            return 0, False, None
+
+        total_size = int(response.headers.get('content-length', 0))
+        return total_size, False, response
+
+    async def _probe_mirror(self, url):
+        """下载镜像开头的一小段数据测速，返回 url"""
+        started = time.monotonic()
+        headers = dict(self.headers, Range=f'bytes=0-{self.RACE_BYTES - 1}')
+        try:
+            async with self.client.session().get(url, headers=headers,
+                                                 timeout=self.timeout) as response:
+                response.raise_for_status()
+                first_byte = time.monotonic()
+                received = 0
+                while received < self.RACE_BYTES:
+                    chunk = await response.content.read(self.chunk_size)
+                    if not chunk:
+                        break
+                    received += len(chunk)
+        except (aiohttp.ClientResponseError,) + RETRY_ERRORS:
+            self.stats.record(url, failed=True)
+            raise
+        elapsed = max(time.monotonic() - first_byte, 1e-3)
+        self.stats.record(url, latency=first_byte - started, rate=received / elapsed)
+        return url
+
+    async def rank_mirrors(self, urls):
+        """返回按优先顺序排列的镜像地址，第一个是开始下载用的镜像
+
+        最好的主机最近测过速时直接使用，否则对排名前 RACE_MIRRORS 个镜像同时测速，
+        最先完成的排在最前面。
+        """
+        ranked = self.stats.rank(urls)
+        if len(ranked) < 2 or self.stats.is_fresh(ranked[0]):
+            return ranked
+        racers = [asyncio.ensure_future(self._probe_mirror(url))
+                  for url in ranked[:self.RACE_MIRRORS]]
+        try:
+            for next_done in asyncio.as_completed(racers):
+                try:
+                    winner = await next_done
+                except (aiohttp.ClientResponseError,) + RETRY_ERRORS:
+                    continue
+                return [winner] + [url for url in ranked if url != winner]
+        finally:
+            for racer in racers:
+                racer.cancel()
+            await asyncio.gather(*racers, return_exceptions=True)
+        # 全部测速失败时按原顺序尝试
+        return ranked
+
+    def _switch_mirror(self, failed_url):
+        """记录镜像失败并换到下一个镜像，没有其他镜像时返回 False"""
+        self.stats.record(failed_url, failed=True)
+        if len(self._mirrors) < 2:
+            return False
+        # 其他分段可能已经换过了
+        if self._url == failed_url:
+            index = self._mirrors.index(failed_url)
+            self._url = self._mirrors[(index + 1) % len(self._mirrors)]
+            self._mirror_mark = (time.monotonic(), self._received)
+            self.switches += 1
+        return True
+
+    def _is_slow(self, url, rate):
+        """判断 url 上的一个连接是否应该换镜像，rate 为这个连接最近的速度"""
+        if url != self._url:
+            # 其他分段已经换了镜像
+            return True
+        if rate < self.min_mirror_rate:
+            return True
+        mark_time, mark_bytes = self._mirror_mark
+        elapsed = time.monotonic() - mark_time
+        if elapsed < self.SLOW_WINDOW:
+            return False
+        total_rate = (self._received - mark_bytes) / elapsed
+        if self._active >= 2 and rate < total_rate / self._active * self.SLOW_RATIO:
+            return True
+        # 所有连接加起来还远不如其他镜像的一个连接
+        best = self.stats.best_rate([u for u in self._mirrors if u != url])
+        return best is not None and total_rate < best * self.SLOW_RATIO
+
+    def split_ranges(self, ranges):
+        """将待下载的闭区间切分为适合并发拉取的分段"""
+        remaining = sum(e - s + 1 for s, e in ranges)
+        segment_size = max(self.min_segment_size, -(-remaining // self.connections))
+        segments = []
+        for start, end in ranges:
+            while start <= end:
+                segment_end = min(end, start + segment_size - 1)
+                # 避免切出过小的尾巴
+                if end - segment_end < self.min_segment_size // 2:
+                    segment_end = end
+                segments.append((start, segment_end))
+                start = segment_end + 1
+        return segments
+
+    def cancel(self):
+        """取消所有正在进行的分段"""
+        self._cancelled = True
+        for task in self._tasks:
+            task.cancel()
+
+    def _check_cancelled(self):
+        if self._cancelled:
+            raise RuntimeError("下载已取消")
+
+    async def _probe_mirrors(self):
+        """依次探测镜像，返回第一个可用镜像的探测结果"""
+        while True:
+            url = self._url
+            try:
+                return await self.probe(url)
+            except (aiohttp.ClientResponseError,) + RETRY_ERRORS:
+                if not self._switch_mirror(url) or self._url == self._mirrors[0]:
+                    raise
+
+    async def _begin(self, urls):
+        """重置状态、选择镜像并探测，返回 probe() 的结果"""
+        self._cancelled = False
+        self._downloaded = 0
+        self._received = 0
+        self._delivered = 0
+        self._writer = None
+        self.switches = 0
+        urls = [urls] if isinstance(urls, str) else list(urls)
+        self._mirrors = await self.rank_mirrors(urls)
+        self._url = self._mirrors[0]
+        self._started = time.monotonic()
+        self._mirror_mark = (self._started, 0)
+        total_size, supports_range, response = await self._probe_mirrors()
+        self._total_size = total_size
+        return total_size, supports_range, response
+
+    async def download(self, urls, save_path):
+        """下载到 save_path，返回文件的总字节数
+
+        urls 为下载地址，或者同一个文件的多个镜像地址组成的列表。
+        数据先写入 save_path + '.part'，完成后再重命名为 save_path。
+        """
+        part_path = save_path + '.part'
+        journal_path = part_path + '.json'
+        total_size, supports_range, response = await self._begin(urls)
+
+        if not supports_range or total_size <= self.min_segment_size:
+            await self._download_single(response, part_path)
+            os.replace(part_path, save_path)
+            DownloadJournal(journal_path).remove()
+            return self._downloaded
+
+        if response is not None:
+            response.release()
+
+        journal = DownloadJournal.load(journal_path)
+        if (journal is not None and journal.matches(self._etag, total_size)
+                and os.path.exists(part_path) and os.path.getsize(part_path) == total_size):
+            # 同一个对象的未完成下载，只补齐缺失区间
+            self._downloaded = journal.completed_size()
+        else:
+            journal = DownloadJournal(journal_path, self._etag, total_size)
+            # 预分配输出文件，各分段写入各自的偏移
+            with open(part_path, 'wb') as f:
+                f.truncate(total_size)
+            journal.save()
+
+        segments = self.split_ranges(journal.missing_ranges())
+        if segments:
+            self._writer = FileWriter(part_path, journal, self.max_write_blocks,
+                                      self.journal_interval)
+            slots = asyncio.Semaphore(self.connections)
+            self._tasks = [asyncio.ensure_future(
+                self._fetch_range(start, end, journal, slots))
+                for start, end in segments]
+            try:
+                await asyncio.gather(*self._tasks)
+                await self._writer.close()
+            except BaseException:
+                # 等所有分段退出、已收到的数据写完后再保存日志，保留全部已写入的区间
+                for task in self._tasks:
+                    task.cancel()
+                await asyncio.gather(*self._tasks, return_exceptions=True)
+                try:
+                    await self._writer.close()
+                except OSError:
+                    pass
+                journal.save()
+                if self._cancelled:
+                    raise RuntimeError("下载已取消") from None
+                raise
+            finally:
+                self._tasks = []
+
+        os.replace(part_path, save_path)
+        journal.remove()
+        return self._downloaded
+
+    async def stream(self, urls, write):
+        """按顺序下载，数据依次交给协程函数 write 处理而不写入文件，返回总字节数
+
+        文件按 min_segment_size 切分，最多同时拉取 connections 个分段，先到的分段在
+        内存中等待前面的分段交出，内存占用约为 connections * min_segment_size。
+        交出的数据无法收回，服务器不支持 Range 时连接断开即失败，也不支持断点续传。
+        """
+        total_size, supports_range, response = await self._begin(urls)
+
+        if not supports_range:
+            if response is None:
+                response = await self.client.session().get(
+                    self._url, headers=self.headers, timeout=self.timeout)
+                response.raise_for_status()
+                self._total_size = int(response.headers.get('content-length', 0))
+            async with response:
+                while True:
+                    chunk = await response.content.read(self.chunk_size)
+                    if not chunk:
+                        break
+                    self._check_cancelled()
+                    self._report(len(chunk))
+                    await write(chunk)
+                    self._delivered += len(chunk)
+            if self._total_size and self._downloaded < self._total_size:
+                raise aiohttp.ClientPayloadError("连接提前关闭")
+            return self._downloaded
+
+        if response is not None:
+            response.release()
+        # 只用于分段请求时校验 ETag，不保存
+        journal = DownloadJournal(None, self._etag, total_size)
+        pieces = [(start, min(start + self.min_segment_size, total_size) - 1)
+                  for start in range(0, total_size, self.min_segment_size)]
+        slots = asyncio.Semaphore(self.connections)
+        pending = []
+        try:
+            for index, (start, end) in enumerate(pieces):
+                # 保持 connections 个分段在传输，交出最前面的分段
+                for ahead_start, ahead_end in pieces[index + len(pending):
+                                                     index + self.connections]:
+                    buffer = MemoryWriter(ahead_start, ahead_end - ahead_start + 1)
+                    pending.append((asyncio.ensure_future(self._fetch_range(
+                        ahead_start, ahead_end, journal, slots, buffer)), buffer))
+                self._tasks = [task for task, _ in pending]
+                task, buffer = pending.pop(0)
+                await task
+                await write(buffer.data)
+                self._delivered += len(buffer.data)
+        except BaseException:
+            for task, _ in pending:
+                task.cancel()
+            await asyncio.gather(*(task for task, _ in pending), return_exceptions=True)
+            if self._cancelled:
+                raise RuntimeError("下载已取消") from None
+            raise
+        finally:
+            self._tasks = []
+        return self._downloaded
+
+    async def read_range(self, urls, start, end):
+        """把一小段数据（如索引）读入内存，按镜像排名依次尝试"""
+        urls = [urls] if isinstance(urls, str) else list(urls)
+        headers = dict(self.headers, Range=f'bytes={start}-{end}')
+        error = None
+        for url in self.stats.rank(urls):
+            try:
+                async with self.client.session().get(url, headers=headers,
+                                                     timeout=self.timeout) as response:
+                    response.raise_for_status()
+                    if response.status != 206:
+                        raise RuntimeError(f"服务器未按区间返回数据: HTTP {response.status}")
+                    return await response.read()
+            except (aiohttp.ClientResponseError,) + RETRY_ERRORS as e:
+                self.stats.record(url, failed=True)
+                error = e
+        raise error
+
+    async def download_ranges(self, urls, ranges, save_path):
+        """只下载 ranges 中的闭区间，按顺序首尾相接写入 save_path，返回写入的字节数
+
+        用于按索引下载分片 MP4 的一部分，不支持断点续传。
+        """
+        total_size, supports_range, response = await self._begin(urls)
+        if response is not None:
+            response.release()
+        if not supports_range:
+            raise RuntimeError("服务器不支持按区间下载")
+        # 只用于分段请求时校验 ETag 和文件大小，不保存
+        journal = DownloadJournal(None, self._etag, total_size)
+        self._total_size = sum(end - start + 1 for start, end in ranges)
+        part_path = save_path + '.part'
+        with open(part_path, 'wb') as f:
+            f.truncate(self._total_size)
+
+        self._writer = FileWriter(part_path, max_blocks=self.max_write_blocks)
+        slots = asyncio.Semaphore(self.connections)
+        output_offset = 0
+        for start, end in ranges:
+            writer = OffsetWriter(self._writer, output_offset - start)
+            self._tasks += [asyncio.ensure_future(
+                self._fetch_range(segment_start, segment_end, journal, slots, writer))
+                for segment_start, segment_end in self.split_ranges([(start, end)])]
+            output_offset += end - start + 1
+        try:
+            await asyncio.gather(*self._tasks)
+            await self._writer.close()
+        except BaseException:
+            for task in self._tasks:
+                task.cancel()
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+            try:
+                await self._writer.close()
+            except OSError:
+                pass
+            if self._cancelled:
+                raise RuntimeError("下载已取消") from None
+            raise
+        finally:
+            self._tasks = []
+        os.replace(part_path, save_path)
+        return self._downloaded
+
+    async def _backoff(self, attempt):
+        """按指数退避等待，期间可被取消"""
+        await asyncio.sleep(min(self.backoff_base * (2 ** (attempt - 1)), self.backoff_max))
+        self._check_cancelled()
+
+    async def _read_blocks(self, response, start, end, writer, watch_url=None):
+        """从响应中读取 [start, end] 的数据，攒成对齐的块交给 writer，返回下一个待读取的偏移
+
+        连接断开时异常带有 position 属性，表示已经收到（并已提交写入）的位置。
+        给出 watch_url 时定期检查这个镜像连接的速度，需要换镜像时抛出 MirrorError。
+        """
+        position = start
+        buffer = bytearray()
+        buffer_start = start
+        window = (time.monotonic(), start)
+        try:
+            while position <= end:
+                chunk = await response.content.read(self.chunk_size)
+                if not chunk:
+                    break
+                self._check_cancelled()
+                # 防止服务器多返回数据覆盖相邻分段
+                chunk = chunk[:end + 1 - position]
+                buffer += chunk
+                position += len(chunk)
+                self._report(len(chunk))
+                if position >= self._block_end(buffer_start) or position > end:
+                    await writer.submit(buffer_start, bytes(buffer))
+                    buffer = bytearray()
+                    buffer_start = position
+                    self._adapt_block_size()
+                if watch_url and time.monotonic() - window[0] >= self.SLOW_WINDOW:
+                    rate = (position - window[1]) / (time.monotonic() - window[0])
+                    if self._is_slow(watch_url, rate):
+                        raise MirrorError(f"镜像速度过慢: {format_rate(rate)}")
+                    window = (time.monotonic(), position)
+        except RETRY_ERRORS + (MirrorError,) as e:
+            e.position = position
+            raise
+        finally:
+            if buffer:
+                writer.submit_nowait(buffer_start, bytes(buffer))
+        return position
+
+    async def _download_single(self, response, part_path):
+        """服务器不支持 Range 时的单连接下载，断开后换镜像从头重试"""
+        attempt = 0
+        while True:
+            position = 0
+            with open(part_path, 'wb'):
+                pass
+            self._writer = FileWriter(part_path, max_blocks=self.max_write_blocks)
+            try:
+                try:
+                    if response is None:
+                        response = await self.client.session().get(
+                            self._url, headers=self.headers, timeout=self.timeout)
+                        response.raise_for_status()
+                        self._total_size = int(response.headers.get('content-length', 0))
+                    async with response:
+                        end = self._total_size - 1 if self._total_size else sys.maxsize
+                        position = await self._read_blocks(response, 0, end, self._writer)
+                finally:
+                    await self._writer.close()
+                if self._total_size and position < self._total_size:
+                    raise aiohttp.ClientPayloadError("连接提前关闭")
+                return
+            except RETRY_ERRORS as e:
+                attempt += 1
+                if attempt > self.max_retries:
+                    raise
+                # 从头重新下载，回退已统计的进度
+                self._report(-getattr(e, 'position', position))
+                response = None
+                if not self._switch_mirror(self._url):
+                    await self._backoff(attempt)
+
+    async def _fetch_range(self, start, end, journal, slots, writer=None):
+        """下载单个字节区间交给 writer（默认为下载文件的写入线程）
+
+        连接断开时从断点重试：有其他镜像时立即换镜像，否则按指数退避。
+        """
+        async with slots:
+            self._active += 1
+            try:
+                position = start
+                attempt = 0
+                while position <= end:
+                    url = self._url
+                    try:
+                        position = await self._stream_range(url, position, end, journal,
+                                                            writer or self._writer)
+                        if position <= end:
+                            raise aiohttp.ClientPayloadError("连接提前关闭")
+                    except RETRY_ERRORS + (MirrorError, aiohttp.ClientResponseError) as e:
+                        self._check_cancelled()
+                        # HTTP 错误只有换镜像才有重试的意义
+                        if isinstance(e, aiohttp.ClientResponseError) and len(self._mirrors) < 2:
+                            raise
+                        progress = getattr(e, 'position', position)
+                        # 有进展时重新计算重试次数
+                        attempt = 1 if progress > position else attempt + 1
+                        position = progress
+                        if attempt > self.max_retries:
+                            raise
+                        if not self._switch_mirror(url):
+                            await self._backoff(attempt)
+            finally:
+                self._active -= 1
+
+    async def _stream_range(self, url, start, end, journal, writer):
+        """拉取 [start, end] 交给 writer，返回下一个待拉取的偏移"""
+        headers = dict(self.headers, Range=f'bytes={start}-{end}')
+        started = time.monotonic()
+        position = start
+        try:
+            async with self.client.session().get(url, headers=headers,
+                                                 timeout=self.timeout) as response:
+                response.raise_for_status()
+                if response.status != 206:
+                    raise RuntimeError(f"服务器未按区间返回数据: HTTP {response.status}")
+                content_range = response.headers.get('content-range', '')
+                match = re.match(r'bytes\s+\d+-\d+/(\d+)', content_range)
+                if match and int(match.group(1)) != journal.content_length:
+                    raise MirrorError("镜像返回的文件大小不一致")
+                # 不同镜像的 ETag 可能不同，只和探测时的主机比较
+                etag = response.headers.get('etag')
+                if (journal.etag and etag and etag != journal.etag
+                        and urlparse(url).netloc == self._probe_host):
+                    raise RuntimeError("远程文件已变化，无法续传")
+                watch_url = url if len(self._mirrors) > 1 else None
+                position = await self._read_blocks(response, start, end, writer, watch_url)
+                return position
+        except RETRY_ERRORS + (MirrorError,) as e:
+            position = getattr(e, 'position', position)
+            raise
+        finally:
+            # 数据量足够时记录这个连接的速度
+            elapsed = time.monotonic() - started
+            if position - start >= self.RACE_BYTES and elapsed > 0:
+                self.stats.record(url, rate=(position - start) / elapsed)
+
+    def _report(self, size):
+        """累计进度并回调"""
+        self._downloaded += size
+        if size > 0:
+            self._received += size
+        if self.progress_callback:
+            self.progress_callback(self._downloaded, self._total_size)
+
+
+class MuxerError(RuntimeError):
+    """ffmpeg 处理管道输入失败"""
+
+
+class PipeInput:
+    """PipeMuxer 的一路输入，ffmpeg 连上之前写入会等待"""
+
+    def __init__(self, muxer):
+        self._muxer = muxer
+        self._connected = asyncio.get_running_loop().create_future()
+        self._writer = None
+
+    def _accept(self, reader, writer):
+        if self._connected.done():
+            writer.close()
+        else:
+            self._connected.set_result(writer)
+
+    async def _connection(self):
+        if self._writer is None:
+            await asyncio.wait({self._connected, self._muxer.exited},
+                               return_when=asyncio.FIRST_COMPLETED)
+            if not self._connected.done():
+                # ffmpeg 没有打开这一路输入就退出了
+                raise await self._muxer.failure()
+            self._writer = self._connected.result()
+        return self._writer
+
+    async def write(self, data):
+        writer = await self._connection()
+        try:
+            writer.write(data)
+            await writer.drain()
+        except (ConnectionError, OSError):
+            raise await self._muxer.failure() from None
+
+    async def close(self):
+        """数据写完，通知 ffmpeg 这一路输入结束"""
+        writer = await self._connection()
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except (ConnectionError, OSError):
+            pass
+
+
+class PipeMuxer:
+    """把正在下载的数据直接送入 ffmpeg 封装/转码，不写临时文件
+
+    每路输入通过一个本地 TCP 连接（tcp://127.0.0.1:端口）交给 ffmpeg，各平台都
+    可以使用。ffmpeg 读得慢时写入会等待，下载也随之放慢。输入必须能顺序读取，
+    例如 moov 在开头的分片 MP4；需要来回跳读的文件只能先下载到临时文件。
+    """
+
+    def __init__(self, input_count, args, output_path):
+        self.input_count = input_count
+        self.args = list(args)
+        self.output_path = output_path
+        self.inputs = []
+        self.exited = None
+        self._servers = []
+        self._process = None
+
+    async def start(self):
+        """为每路输入监听一个本地端口并启动 ffmpeg"""
+        command = [get_ffmpeg_binary(), '-hide_banner', '-nostdin', '-y', '-loglevel', 'error']
+        for _ in range(self.input_count):
+            pipe_input = PipeInput(self)
+            server = await asyncio.start_server(pipe_input._accept, '127.0.0.1', 0)
+            port = server.sockets[0].getsockname()[1]
+            self.inputs.append(pipe_input)
+            self._servers.append(server)
+            command += ['-i', f'tcp://127.0.0.1:{port}']
+        command += self.args + [self.output_path]
+        self._process = subprocess.Popen(command, stdin=subprocess.DEVNULL,
+                                         stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        self.exited = asyncio.get_running_loop().run_in_executor(None, self._process.communicate)
+
+    async def failure(self):
+        """等待 ffmpeg 退出，返回带错误信息的 MuxerError"""
+        try:
+            _, stderr = await asyncio.wait_for(asyncio.shield(self.exited), 10)
+        except asyncio.TimeoutError:
+            self._process.kill()
+            return MuxerError("ffmpeg 无响应")
+        lines = stderr.decode('utf-8', errors='replace').strip().splitlines()
+        return MuxerError(lines[-1] if lines else f"ffmpeg 退出码 {self._process.returncode}")
+
+    async def finish(self):
+        """所有输入写完后等待 ffmpeg 结束，失败时抛出 MuxerError"""
+        await asyncio.shield(self.exited)
+        if self._process.returncode != 0:
+            raise await self.failure()
+
+    async def close(self, remove_output=False):
+        """结束 ffmpeg 和本地端口，remove_output 为真时删除不完整的输出文件"""
+        for server in self._servers:
+            server.close()
+        for pipe_input in self.inputs:
+            if pipe_input._writer is not None:
+                pipe_input._writer.close()
+        if self._process is not None:
+            if self._process.poll() is None:
+                self._process.kill()
+            await asyncio.gather(self.exited, return_exceptions=True)
+        if remove_output:
+            try:
+                os.remove(self.output_path)
+            except OSError:
+                pass
+
+
+def format_rate(bytes_per_second):
+    """把字节/秒格式化为易读的速度"""
+    if bytes_per_second >= 1024 * 1024:
+        return f"{bytes_per_second / (1024 * 1024):.1f} MB/s"
+    return f"{bytes_per_second / 1024:.0f} KB/s"
+
+
+def format_size(size):
+    """把字节数格式化为 MB"""
+    return f"{size / (1024 * 1024):.1f} MB"
+
+
+def format_eta(seconds):
+    """把剩余秒数格式化为 HH:MM:SS，未知时返回 --:--:--"""
+    if seconds is None:
+        return "--:--:--"
+    seconds = int(seconds)
+    return f"{seconds // 3600:02d}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+
+
+class TransferTelemetry:
+    """下载进度采样
+
+    按固定频率（默认 10 Hz）对累计字节数采样，计算瞬时速度、指数移动平均速度
+    和预计剩余时间。update() 只在需要刷新时返回快照，其余调用返回 None，
+    避免每个数据块都发出 Qt 信号。
+    """
+
+    def __init__(self, interval=0.1, smoothing=0.3):
+        self.interval = interval
+        self.smoothing = smoothing
+        self.average_rate = 0.0
+        self._last_time = None
+        self._last_bytes = 0
+
+    def update(self, downloaded, total, force=False):
+        """记录当前进度，到采样时间（或 force 为真）时返回快照字典"""
+        now = time.monotonic()
+        if self._last_time is None:
+            self._last_time = now
+            self._last_bytes = downloaded
+            if not force:
+                return None
+        elapsed = now - self._last_time
+        if elapsed < self.interval and not force:
+            return None
+
+        rate = (downloaded - self._last_bytes) / elapsed if elapsed > 0 else 0.0
+        if elapsed > 0:
+            if self.average_rate:
+                self.average_rate += self.smoothing * (rate - self.average_rate)
+            else:
+                self.average_rate = rate
+        self._last_time = now
+        self._last_bytes = downloaded
+
+        eta = None
+        if total and self.average_rate > 0:
+            eta = max(total - downloaded, 0) / self.average_rate
+        return {
+            'downloaded': downloaded,
+            'total': total,
+            'percent': int(downloaded * 100 / total) if total else None,
+            'rate': max(rate, 0.0),
+            'average_rate': self.average_rate,
+            'eta': eta,
+        }
+
+
+def format_telemetry(snapshot):
+    """把进度快照格式化为界面显示的文字"""
+    text = f"速度 {format_rate(snapshot['rate'])}（平均 {format_rate(snapshot['average_rate'])}）"
+    if snapshot.get('disk_rate') is not None:
+        text += f"  磁盘 {format_rate(snapshot['disk_rate'])}"
+    if snapshot.get('total'):
+        text += f"  已下载 {format_size(snapshot['downloaded'])} / {format_size(snapshot['total'])}"
+    else:
+        text += f"  已下载 {format_size(snapshot['downloaded'])}"
+    return text + f"  剩余 {format_eta(snapshot['eta'])}"
+
+
+BVID_PATTERN = re.compile(r'BV[0-9A-Za-z]{10}')
+
+
+def extract_bvid(text):
+    """从链接或文本中提取BV号，找不到时返回 None"""
+    match = BVID_PATTERN.search(text)
+    return match.group(0) if match else None
+
+
+def parse_page_selection(text, page_count):
+    """解析分P选择，如 "1-3,5"、"all"，返回从 1 开始的分P序号列表"""
+    text = text.strip().lower()
+    if text in ('all', '全部'):
+        return list(range(1, page_count + 1))
+    numbers = []
+    for part in re.split(r'[,，\s]+', text):
+        if not part:
+            continue
+        match = re.fullmatch(r'(\d+)(?:-(\d+))?', part)
+        if not match:
+            raise ValueError(f"无法识别的分P: {part}")
+        first = int(match.group(1))
+        last = int(match.group(2) or first)
+        if first < 1 or last > page_count or first > last:
+            raise ValueError(f"分P超出范围: {part}（共 {page_count} P）")
+        for number in range(first, last + 1):
+            if number not in numbers:
+                numbers.append(number)
+    if not numbers:
+        raise ValueError("没有选择分P")
+    return numbers
+
+
+def safe_filename(name):
+    """替换文件名中不允许出现的字符"""
+    return re.sub(r'[\\/:*?"<>|]', '_', name).strip() or '未命名'
+
+
+def parse_batch_input(text):
+    """解析批量下载列表：每行一个BV号或链接，忽略空行和 # 开头的注释，重复的BV号只保留一个"""
+    bvids = []
+    seen = set()
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        for bvid in BVID_PATTERN.findall(line):
+            if bvid not in seen:
+                seen.add(bvid)
+                bvids.append(bvid)
+    return bvids
+
+
+# DASH 视频流的清晰度代码（数值越大画质越高）
+VIDEO_QUALITIES = {
+    16: '360P', 32: '480P', 64: '720P', 74: '720P60', 80: '1080P', 112: '1080P+',
+    116: '1080P60', 120: '4K', 125: 'HDR', 126: '杜比视界', 127: '8K',
+}
+
+# DASH 流的 codecid 与编码名称的对应关系
+DASH_CODEC_IDS = {7: 'avc', 12: 'hevc', 13: 'av1'}
+
+
+def dash_stream_codec(stream):
+    """返回 DASH 流的编码名称（avc/hevc/av1/aac 等）"""
+    codec = DASH_CODEC_IDS.get(stream.get('codecid'))
+    if codec:
+        return codec
+    codecs = (stream.get('codecs') or '').lower()
+    for prefix, name in (('avc', 'avc'), ('hev', 'hevc'), ('hvc', 'hevc'), ('av01', 'av1'),
+                         ('mp4a', 'aac'), ('ec-3', 'eac3'), ('flac', 'flac')):
+        if codecs.startswith(prefix):
+            return name
+    return codecs or '未知'
+
+
+def describe_dash_stream(stream):
+    """DASH 流的简短说明，如：1080P hevc 1920x1080 1.20 Mbps"""
+    parts = []
+    if stream.get('id') in VIDEO_QUALITIES:
+        parts.append(VIDEO_QUALITIES[stream['id']])
+    parts.append(dash_stream_codec(stream))
+    if stream.get('width') and stream.get('height'):
+        parts.append(f"{stream['width']}x{stream['height']}")
+    if stream.get('bandwidth'):
+        parts.append(f"{stream['bandwidth'] / 1000 / 1000:.2f} Mbps")
+    return ' '.join(parts)
+
+
+# 可以直接复制码流放入 MP4 的 DASH 编码（名称同 dash_stream_codec）
+DASH_MP4_CODECS = {
+    'video': {'avc', 'hevc', 'av1'},
+    'audio': {'aac', 'eac3', 'flac'},
+}
+
+
+def dash_stream_urls(stream):
+    """DASH 流的主地址和备用镜像地址"""
+    return [stream['baseUrl']] + list(stream.get('backupUrl') or [])
+
+
+def is_streamable_dash(stream):
+    """DASH 流是否为带索引的分片 MP4（moov 在开头，可以边下载边封装）"""
+    return bool(stream.get('segment_base') or stream.get('SegmentBase'))
+
+
+def dash_segment_base(stream):
+    """返回 DASH 流初始化段的结束偏移和索引（sidx）的字节区间 (init_end, index_start, index_end)
+
+    没有 SegmentBase 信息时返回 None。
+    """
+    base = stream.get('segment_base') or {}
+    initialization = base.get('initialization')
+    index_range = base.get('index_range')
+    if not initialization:
+        base = stream.get('SegmentBase') or {}
+        initialization = base.get('Initialization')
+        index_range = base.get('indexRange')
+    try:
+        init_end = int(initialization.split('-')[1])
+        index_start, index_end = (int(value) for value in index_range.split('-'))
+    except (AttributeError, IndexError, ValueError):
+        return None
+    return init_end, index_start, index_end
+
+
+def parse_sidx(data, offset):
+    """解析 MP4 的 sidx 索引，返回分片列表 [(开始秒, 结束秒, 起始字节, 结束字节)]
+
+    data 为从 sidx 盒开头读取的数据，offset 为它在文件中的偏移，返回的字节区间
+    为文件中的绝对偏移（闭区间）。
+    """
+    size, box_type = struct.unpack('>I4s', data[:8])
+    if box_type != b'sidx':
+        raise ValueError("索引区间中没有 sidx")
+    version = data[8]
+    timescale = struct.unpack('>I', data[16:20])[0]
+    if version == 0:
+        earliest, first_offset = struct.unpack('>II', data[20:28])
+        position = 28
+    else:
+        earliest, first_offset = struct.unpack('>QQ', data[20:36])
+        position = 36
+    count = struct.unpack('>H', data[position + 2:position + 4])[0]
+    position += 4
+
+    fragments = []
+    byte = offset + size + first_offset
+    timestamp = earliest
+    for _ in range(count):
+        reference, duration, _ = struct.unpack('>III', data[position:position + 12])
+        position += 12
+        if reference >> 31:
+            raise ValueError("不支持多级 sidx 索引")
+        length = reference & 0x7fffffff
+        fragments.append((timestamp / timescale, (timestamp + duration) / timescale,
+                          byte, byte + length - 1))
+        byte += length
+        timestamp += duration
+    return fragments
+
+
+class StreamPolicy:
+    """DASH 流选择策略
+
+    B站会为每个清晰度提供 AVC/HEVC/AV1 等多种编码的视频流。先按最高清晰度和
+    码率上限筛选，在可选的最高清晰度中按编码偏好挑选；prefer_size 时改为选码率
+    最小的流（同画质下 HEVC/AV1 通常比 AVC 小 30%~50%）。码率上限同样用于音频流。
+    没有满足条件的流时退回码率最小的流。
+    """
+    CODEC_ORDERS = {
+        'avc': ('avc', 'hevc', 'av1'),
+        'hevc': ('hevc', 'av1', 'avc'),
+        'av1': ('av1', 'hevc', 'avc'),
+    }
+
+    def __init__(self, max_quality=0, codec='avc', max_bitrate=0, prefer_size=False):
+        self.max_quality = max_quality  # 最高清晰度代码，0 表示不限
+        self.codec = codec              # 优先使用的视频编码
+        self.max_bitrate = max_bitrate  # 视频流和音频流各自的码率上限（kbps），0 表示不限
+        self.prefer_size = prefer_size
+
+    def _allowed(self, stream):
+        if self.max_quality and stream.get('id', 0) > self.max_quality:
+            return False
+        if self.max_bitrate and stream.get('bandwidth', 0) > self.max_bitrate * 1000:
+            return False
+        return True
+
+    def select_video(self, streams):
+        """从 DASH 视频流列表中选出一个流"""
+        if not streams:
+            raise ValueError("没有可用的视频流")
+        candidates = [s for s in streams if self._allowed(s)]
+        if not candidates:
+            return min(streams, key=lambda s: s.get('bandwidth', 0))
+
+        quality = max(s.get('id', 0) for s in candidates)
+        candidates = [s for s in candidates if s.get('id', 0) == quality]
+        if self.prefer_size:
+            return min(candidates, key=lambda s: s.get('bandwidth', 0))
+        order = self.CODEC_ORDERS.get(self.codec, self.CODEC_ORDERS['avc'])
+
+        def rank(stream):
+            codec = dash_stream_codec(stream)
+            position = order.index(codec) if codec in order else len(order)
+            return (position, -stream.get('bandwidth', 0))
+        return min(candidates, key=rank)
+
+    def select_audio(self, streams):
+        """从 DASH 音频流列表中选出不超过码率上限的最高码率流（音频各档是不同音质，不按体积挑选）"""
+        if not streams:
+            raise ValueError("没有可用的音频流")
+        candidates = [s for s in streams if not self.max_bitrate
+                      or s.get('bandwidth', 0) <= self.max_bitrate * 1000]
+        if not candidates:
+            return min(streams, key=lambda s: s.get('bandwidth', 0))
+        return max(candidates, key=lambda s: s.get('bandwidth', 0))
+
+    def describe(self):
+        """策略的简短说明"""
+        parts = [f'最高 {VIDEO_QUALITIES.get(self.max_quality, self.max_quality)}'
+                 if self.max_quality else '最高画质',
+                 '最小体积' if self.prefer_size else f'{self.codec} 优先']
+        if self.max_bitrate:
+            parts.append(f'码率≤{self.max_bitrate} kbps')
+        return '，'.join(parts)
+
+
+class DownloadTask(QObject):
+    """单个视频的下载任务
+
+    以协程形式运行在共享的事件循环中，不需要单独的线程；合并、转码等阻塞操作
+    放到线程池中执行。进度通过 Qt 信号发出。
+    """
     progress_signal = Signal(str)
     progress_value = Signal(int)
+    telemetry_signal = Signal(object)  # TransferTelemetry 的快照
     finished_signal = Signal(str)
 
-    def __init__(self, url, download_type='mp3'):
-        super().__init__()
+    def __init__(self, url, download_type='mp3', connections=8, pages=None, policy=None,
+                 profile=None, parent=None):
+        super().__init__(parent)
         self.url = url
         self.download_type = download_type
+        self.connections = connections
+        # DASH 流选择策略，默认与以前一样选最高画质的 AVC 流
+        self.policy = policy or StreamPolicy()
+        # 需要转码时使用的编码配置
+        self.profile = profile or encoding_profiles.current()
+        # 要下载的分P，如 "1-3,5" 或 "all"；为空时下载链接中指定的分P
+        self.pages = pages
+        # 当前传输的分P序号和分P总数，用于把单P进度换算为总进度
+        self.page_position = (0, 1)
+        self._task = None
 
-    def _download_stream(self, response, save_path):
-        """下载单个流文件"""
-        total_size = int(response.headers.get('content-length', 0))
-        block_size = 1024
-        downloaded = 0
-        
-        with open(save_path, 'wb') as f:
-            for chunk in response.iter_content(chunk_size=block_size):
-                if chunk:
-                    f.write(chunk)
-                    downloaded += len(chunk)
-                    if total_size > 0:
-                        progress = int((downloaded / total_size) * 100)
-                        self.progress_value.emit(progress)
+    def start(self):
+        """在当前事件循环中开始下载"""
+        self._task = asyncio.ensure_future(self.download_media())
+
+    def isRunning(self):
+        return self._task is not None and not self._task.done()
+
+    def cancel(self):
+        """取消正在进行的下载，已下载的区间保留在 .part 文件中供下次续传"""
+        if self.isRunning():
+            self._task.cancel()
+
+    async def _download_stream(self, urls, save_path):
+        """下载单个流文件（多连接分段下载，支持断点续传和镜像切换）"""
+        await self._download_streams([('', urls, save_path)])
+
+    async def _download_streams(self, streams):
+        """并发下载多个流文件
+
+        streams 为 (名称, 下载地址或镜像地址列表, 目标) 列表。目标为保存路径；或者
+        (保存路径, 字节区间列表)，只下载这些区间；或者 PipeInput，数据按顺序直接写入
+        ffmpeg。总进度按字节加权后通过 progress_value
+        发出，多个流时各自的进度通过 progress_signal 显示；任一流失败会取消其余的流。
+        """
+        states = [{'name': name, 'downloaded': 0, 'total': 0} for name, _, _ in streams]
+        downloaders = []
+        telemetry = TransferTelemetry()
+        last_status = [None]
+
+        def publish(force=False):
+            # 所有流的大小都已知后才能按字节加权
+            if any(s['total'] <= 0 for s in states):
+                return
+            total = sum(s['total'] for s in states)
+            snapshot = telemetry.update(sum(s['downloaded'] for s in states), total, force)
+            if snapshot is None:
+                return
+            snapshot['disk_rate'] = sum(d.throughput()[1] for d in downloaders)
+            index, count = self.page_position
+            self.progress_value.emit(int((index * 100 + snapshot['percent']) / count))
+            self.telemetry_signal.emit(snapshot)
+            if len(states) > 1:
+                status = ' | '.join(f"{s['name']}: {int(s['downloaded'] * 100 / s['total'])}%"
+                                    for s in states)
+                if status != last_status[0]:
+                    last_status[0] = status
+                    self.progress_signal.emit(status)
+
+        def make_callback(state):
+            def on_progress(downloaded, total_size):
+                state['downloaded'] = downloaded
+                state['total'] = total_size
+                publish()
+            return on_progress
+
+        async def transfer(downloader, urls, target):
+            if isinstance(target, str):
+                await downloader.download(urls, target)
+            elif isinstance(target, tuple):
+                save_path, ranges = target
+                await downloader.download_ranges(urls, ranges, save_path)
+            else:
+                await downloader.stream(urls, target.write)
+                await target.close()
+
+        downloaders.extend(RangedDownloader(connections=self.connections,
+                                            progress_callback=make_callback(state))
+                           for state in states)
+        tasks = [asyncio.ensure_future(transfer(downloader, urls, target))
+                 for downloader, (_, urls, target) in zip(downloaders, streams)]
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+        # 采样间隔内结束的最后一段进度也要发出
+        publish(force=True)
 
     def _merge_audio_video(self, video_path, audio_path, output_path):
+        """合并音视频：优先直接复制码流封装，编码不兼容时才转码"""
         try:
-            # 使用 moviepy 合并音视频
-            video_clip = VideoFileClip(video_path)
-            audio_clip = AudioFileClip(audio_path)
-            final_clip = video_clip.set_audio(audio_clip)
-            
-            final_clip.write_videofile(output_path, 
-                                     codec='libx264',
-                                     audio_codec='aac',
-                                     temp_audiofile='temp-audio.m4a',
-                                     remove_temp=True)
-            
-            # 清理资源
-            video_clip.close()
-            audio_clip.close()
-            final_clip.close()
-            
+            remux_audio_video(video_path, audio_path, output_path)
+            return True
+        except Exception as e:
+            self.progress_signal.emit(f"无法直接封装（{str(e)}），改为转码合并...")
+        return self._reencode_audio_video(video_path, audio_path, output_path)
+
+    def _reencode_audio_video(self, video_path, audio_path, output_path):
+        """转码合并音视频，音频截到与视频等长
+
+        只转码无法放入 MP4 的流，另一路流直接复制；视频需要转码时分段并行编码。
+        两路流都能直接封装（直接封装因其他原因失败）时全部重新编码。
+        """
+        try:
+            video_info = media_probe.probe(video_path)
+            video_stream = first_stream(video_info, 'video')
+            audio_stream = first_stream(media_probe.probe(audio_path), 'audio')
+            if video_stream is None or audio_stream is None:
+                raise ValueError("缺少视频流或音频流")
+            duration = video_info['duration']
+            if not duration:
+                raise ValueError("无法读取视频时长")
+            video_copyable = video_stream['codec'] in MP4_COPY_CODECS['video']
+            audio_copyable = audio_stream['codec'] in MP4_COPY_CODECS['audio']
+            copy_video = video_copyable and not audio_copyable
+            copy_audio = audio_copyable and not video_copyable
+            audio_args = ['-c:a', 'copy'] if copy_audio else self.profile.audio_args()
+            self.progress_signal.emit(f"编码配置: {self.profile.describe()}")
+
+            if copy_video:
+                # 只有音频无法封装：复制视频，只转码音频
+                self.progress_signal.emit(f"直接复制视频流，只转码 {audio_stream['codec']} 音频...")
+                args = ['-i', video_path, '-t', f'{duration:.6f}', '-i', audio_path,
+                        '-map', f"0:{video_stream['index']}", '-map', f"1:{audio_stream['index']}",
+                        '-c:v', 'copy'] + audio_args + ['-movflags', '+faststart']
+                if video_stream['codec'] == 'hevc':
+                    args += ['-tag:v', 'hvc1']
+                run_ffmpeg(args + [output_path])
+                return True
+
+            audio = (['-t', f'{duration:.6f}', '-i', audio_path], f"0:{audio_stream['index']}",
+                     audio_args)
+            encoder = ChunkedEncoder(progress_callback=self.progress_signal.emit,
+                                     profile=self.profile)
+            encoder.encode(video_path, 0, duration, output_path, audio=audio)
             return True
         except Exception as e:
             self.progress_signal.emit(f"合并失败: {str(e)}")
             return False
 
-    def run(self):
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
+    async def download_media(self):
         try:
-            loop.run_until_complete(self.download_media())
+            meta = await self.fetch_metadata()
+            message = await self.download_pages(meta)
+        except asyncio.CancelledError:
+            message = "下载已取消"
         except Exception as e:
-            self.finished_signal.emit(f"下载失败: {str(e)}")
+            message = f"下载失败: {str(e)}"
         finally:
-            loop.close()
+            metadata_cache.flush()
+            mirror_stats.flush()
+            media_probe.flush()
+        self.finished_signal.emit(message)
 
-    async def download_media(self):
+    async def fetch_metadata(self):
+        """元数据阶段：解析BV号，获取标题、分P列表和第一个分P的下载地址"""
+        bv_number = extract_bvid(self.url)
+        if bv_number is None:
+            raise ValueError("链接中未找到BV号")
+
+        # 先装上共享会话，bilibili_api 的请求不再另建连接池
+        http_client.session()
+        v = video.Video(bvid=bv_number)
+        video_info = await metadata_cache.video_info(v, bv_number)
+        all_pages = video_info.get('pages') or [{'page': 1, 'part': video_info['title'],
+                                                 'cid': video_info['cid']}]
+        if self.pages:
+            numbers = parse_page_selection(self.pages, len(all_pages))
+        else:
+            # 未指定分P时下载链接中 ?p= 指定的分P，默认第一P
+            match = re.search(r'[?&]p=(\d+)', self.url)
+            number = int(match.group(1)) if match else 1
+            numbers = [number if 1 <= number <= len(all_pages) else 1]
+        pages = [{'page': all_pages[n - 1]['page'], 'part': all_pages[n - 1]['part'],
+                  'cid': all_pages[n - 1]['cid']} for n in numbers]
+        pages[0]['download_info'] = await metadata_cache.download_url(v, bv_number, pages[0]['cid'])
+        return {'bvid': bv_number, 'title': video_info['title'], 'video': v,
+                'multi_page': len(all_pages) > 1 and (self.pages or len(numbers) > 1),
+                'pages': pages}
+
+    async def _transfer(self, page_meta, transfer_slot):
+        """执行传输阶段，transfer_slot 为限制同时传输数量的信号量"""
+        if transfer_slot is None:
+            return await self.transfer_streams(page_meta)
+        async with transfer_slot:
+            return await self.transfer_streams(page_meta)
+
+    async def download_pages(self, meta, merge_executor=None, transfer_slot=None):
+        """按分P流水线下载，返回结果信息
+
+        解析下一P下载地址与当前P的传输重叠，当前P的合并/转码在 merge_executor 中
+        与下一P的传输并行，整体耗时约为传输时间加一次合并。
+        """
+        loop = asyncio.get_running_loop()
+        pages = meta['pages']
+        if not meta['multi_page']:
+            page = pages[0]
+            page_meta = {'title': safe_filename(meta['title']), 'download_info': page['download_info']}
+            plan = await self._transfer(page_meta, transfer_slot)
+            return await loop.run_in_executor(merge_executor, self.finalize, plan)
+
+        # 多P视频保存到以标题命名的子目录中
+        subdir = safe_filename(meta['title'])
+        next_info = None
+        finishing = []
         try:
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
-                'Referer': 'https://www.bilibili.com'
-            }
+            for index, page in enumerate(pages):
+                if next_info is not None:
+                    page['download_info'] = await next_info
+                    next_info = None
+                if index + 1 < len(pages):
+                    next_info = asyncio.ensure_future(metadata_cache.download_url(
+                        meta['video'], meta['bvid'], pages[index + 1]['cid']))
 
-            if 'BV' in self.url:
-                bv_number = 'BV' + self.url.split('BV')[1][:10]
-            else:
-                raise ValueError("链接中未找到BV号")
-            
-            v = video.Video(bvid=bv_number)
-            video_info = await v.get_info()
-            title = video_info['title']
-            cid = video_info['cid']
-            
-            # 创建下载目录
-            if getattr(sys, 'frozen', False):
-                current_dir = os.path.dirname(sys.executable)
-            else:
-                current_dir = os.path.dirname(os.path.abspath(__file__))
-            
-            download_dir = os.path.join(current_dir, 'downloads')
-            os.makedirs(download_dir, exist_ok=True)
+                self.page_position = (index, len(pages))
+                self.progress_signal.emit(f"正在下载第 {index + 1}/{len(pages)} P: {page['part']}")
+                page_meta = {'title': f"P{page['page']:02d}_{safe_filename(page['part'])}",
+                             'download_info': page['download_info'], 'subdir': subdir}
+                plan = await self._transfer(page_meta, transfer_slot)
+                finishing.append(loop.run_in_executor(merge_executor, self.finalize, plan))
+        finally:
+            if next_info is not None:
+                next_info.cancel()
+            messages = await asyncio.gather(*finishing, return_exceptions=True)
 
-            # 获取下载信息
-            download_info = await v.get_download_url(cid=cid)
-            
-            if self.download_type == 'mp3':
-                # 下载音频为MP3
-                audio_url = download_info['dash']['audio'][0]['baseUrl']
-                output_path = os.path.join(download_dir, f'{title}.mp3')
-                
-                self.progress_signal.emit(f"正在下载音频: {title}")
-                audio_response = requests.get(audio_url, headers=headers, stream=True)
-                self._download_stream(audio_response, output_path)
-                self.finished_signal.emit(f"下载完成: {output_path}")
-                
-            elif self.download_type == 'mp4audio':
-                # 下载音频为MP4格式
-                audio_url = download_info['dash']['audio'][0]['baseUrl']
-                temp_audio = os.path.join(download_dir, f'temp_audio_{title}.m4a')
-                output_path = os.path.join(download_dir, f'{title}_audio.mp4')
-                
-                self.progress_signal.emit(f"正在下载音频: {title}")
-                audio_response = requests.get(audio_url, headers=headers, stream=True)
-                self._download_stream(audio_response, temp_audio)
-                
-                try:
-                    # 使用 moviepy 转换为 MP4 格式
-                    audio = AudioFileClip(temp_audio)
-                    audio.write_audiofile(output_path, codec='aac')
-                    audio.close()
-                    
-                    # 清理时文件
-                    try:
-                        os.remove(temp_audio)
-                    except:
-                        pass
-                    
-                    self.finished_signal.emit(f"下载完成: {output_path}")
-                except Exception as e:
-                    self.finished_signal.emit(f"音频转换失败: {str(e)}")
-                
-            elif self.download_type == 'mp4':
-                # 只下载视频流
-                video_url = download_info['dash']['video'][0]['baseUrl']
-                output_path = os.path.join(download_dir, f'{title}.mp4')
-                
-                self.progress_signal.emit(f"正在下载视频: {title}")
-                video_response = requests.get(video_url, headers=headers, stream=True)
-                self._download_stream(video_response, output_path)
-                self.finished_signal.emit(f"下载完成: {output_path}")
-                
-            elif self.download_type == 'full_mp4':
-                # 下载视频和音频并合并
-                video_url = download_info['dash']['video'][0]['baseUrl']
-                audio_url = download_info['dash']['audio'][0]['baseUrl']
-                
-                temp_video = os.path.join(download_dir, f'temp_video_{title}.mp4')
-                temp_audio = os.path.join(download_dir, f'temp_audio_{title}.m4a')
-                final_path = os.path.join(download_dir, f'{title}.mp4')
-
-                # 下载视频流
-                self.progress_signal.emit(f"正在下载视频流: {title}")
-                video_response = requests.get(video_url, headers=headers, stream=True)
-                self._download_stream(video_response, temp_video)
-                
-                # 下载音频流
-                self.progress_signal.emit(f"正在下载音频流: {title}")
-                audio_response = requests.get(audio_url, headers=headers, stream=True)
-                self._download_stream(audio_response, temp_audio)
-
-                # 合并音视频
-                self.progress_signal.emit("正在合并音视频...")
-                if self._merge_audio_video(temp_video, temp_audio, final_path):
-                    # 清理临时文件
-                    try:
-                        os.remove(temp_video)
-                        os.remove(temp_audio)
-                    except:
-                        pass
-                    self.finished_signal.emit(f"下载完成: {final_path}")
+        failed = [m for m in messages if not (isinstance(m, str) and m.startswith("下载完成"))]
+        if failed:
+            return f"下载失败: {len(failed)}/{len(pages)} 个分P未完成"
+        last_path = messages[-1].split(": ", 1)[1]
+        return f"下载完成（共 {len(pages)} P）: {last_path}"
+
+    def _select_stream(self, download_info, kind):
+        """按选择策略挑选 DASH 视频流或音频流"""
+        streams = (download_info.get('dash') or {}).get(kind) or []
+        if kind == 'video':
+            return self.policy.select_video(streams)
+        return self.policy.select_audio(streams)
+
+    def _can_stream(self, streams, temp_paths):
+        """能否边下载边封装：流都可以顺序读取，并且没有可以续传的临时文件"""
+        if not all(is_streamable_dash(stream) for stream in streams):
+            return False
+        return not any(os.path.exists(path + '.part') for path in temp_paths)
+
+    async def _stream_mux(self, streams, args, output_path):
+        """边下载边交给 ffmpeg 生成 output_path，ffmpeg 处理失败时返回 False
+
+        streams 为 (类型, DASH 流) 列表，类型为 'video' 或 'audio'，依次作为 ffmpeg
+        的各路输入。
+        """
+        names = {'video': '视频流', 'audio': '音频流'}
+        muxer = PipeMuxer(len(streams), args, output_path)
+        finished = False
+        try:
+            await muxer.start()
+            await self._download_streams([(names[kind], dash_stream_urls(stream), pipe_input)
+                                          for (kind, stream), pipe_input
+                                          in zip(streams, muxer.inputs)])
+            await muxer.finish()
+            # 输入其实需要跳读时 ffmpeg 可能丢掉读不到的流而不报错
+            info = await asyncio.get_running_loop().run_in_executor(
+                None, probe_media, output_path)
+            for kind, _ in streams:
+                if first_stream(info, kind) is None:
+                    raise MuxerError(f"输出文件缺少{names[kind]}")
+            finished = True
+            return True
+        except MuxerError as e:
+            self.progress_signal.emit(f"无法边下载边封装（{str(e)}），改为先下载到临时文件...")
+            return False
+        finally:
+            await muxer.close(remove_output=not finished)
+
+    async def transfer_streams(self, meta):
+        """传输阶段：按下载类型下载流文件，返回交给 finalize 的处理计划
+
+        网络操作都是异步的，多个任务可以在同一个事件循环中同时传输。
+        """
+        title = meta['title']
+        download_info = meta['download_info']
+
+        # 创建下载目录
+        download_dir = os.path.join(get_app_dir(), 'downloads', meta.get('subdir', ''))
+        os.makedirs(download_dir, exist_ok=True)
+
+        if self.download_type == 'mp3':
+            # 下载音频为MP3
+            audio = self._select_stream(download_info, 'audio')
+            output_path = os.path.join(download_dir, f'{title}.mp3')
+
+            self.progress_signal.emit(f"正在下载音频: {title}（{describe_dash_stream(audio)}）")
+            await self._download_stream(dash_stream_urls(audio), output_path)
+            return {'type': 'done', 'output_path': output_path}
+
+        elif self.download_type == 'mp4audio':
+            # 下载音频为MP4格式
+            audio = self._select_stream(download_info, 'audio')
+            temp_audio = os.path.join(download_dir, f'temp_audio_{title}.m4a')
+            output_path = os.path.join(download_dir, f'{title}_audio.mp4')
+
+            self.progress_signal.emit(f"正在下载音频: {title}（{describe_dash_stream(audio)}）")
+            if self._can_stream([audio], [temp_audio]):
+                # AAC 直接复制，其他编码按编码配置转码
+                if dash_stream_codec(audio) == 'aac':
+                    codec_args = ['-c:a', 'copy']
                 else:
-                    self.finished_signal.emit("合并失败")
+                    self.progress_signal.emit(f"编码配置: {self.profile.describe()}")
+                    codec_args = self.profile.audio_args()
+                args = ['-map', '0:a'] + codec_args + ['-movflags', '+faststart']
+                if await self._stream_mux([('audio', audio)], args, output_path):
+                    return {'type': 'done', 'output_path': output_path}
+            await self._download_stream(dash_stream_urls(audio), temp_audio)
+            return {'type': 'convert_audio', 'audio_path': temp_audio, 'output_path': output_path}
+
+        elif self.download_type == 'mp4':
+            # 只下载视频流
+            video = self._select_stream(download_info, 'video')
+            output_path = os.path.join(download_dir, f'{title}.mp4')
+
+            self.progress_signal.emit(f"正在下载视频: {title}（{describe_dash_stream(video)}）")
+            await self._download_stream(dash_stream_urls(video), output_path)
+            return {'type': 'done', 'output_path': output_path}
+
+        elif self.download_type == 'full_mp4':
+            # 下载视频和音频并合并
+            video = self._select_stream(download_info, 'video')
+            audio = self._select_stream(download_info, 'audio')
+            video_desc = describe_dash_stream(video)
+            audio_desc = describe_dash_stream(audio)
+
+            temp_video = os.path.join(download_dir, f'temp_video_{title}.mp4')
+            temp_audio = os.path.join(download_dir, f'temp_audio_{title}.m4a')
+            final_path = os.path.join(download_dir, f'{title}.mp4')
+
+            # 同时下载视频流和音频流
+            self.progress_signal.emit(f"正在下载音视频流: {title}（视频 {video_desc}，音频 {audio_desc}）")
+            if (self._can_stream([video, audio], [temp_video, temp_audio])
+                    and dash_stream_codec(video) in DASH_MP4_CODECS['video']
+                    and dash_stream_codec(audio) in DASH_MP4_CODECS['audio']):
+                # 边下载边直接复制码流封装
+                args = ['-map', '0:v', '-map', '1:a', '-c', 'copy', '-movflags', '+faststart']
+                if dash_stream_codec(video) == 'hevc':
+                    args += ['-tag:v', 'hvc1']
+                if await self._stream_mux([('video', video), ('audio', audio)], args, final_path):
+                    return {'type': 'done', 'output_path': final_path}
+            await self._download_streams([('视频流', dash_stream_urls(video), temp_video),
+                                          ('音频流', dash_stream_urls(audio), temp_audio)])
+            return {'type': 'merge', 'video_path': temp_video, 'audio_path': temp_audio,
+                    'output_path': final_path}
+
+        raise ValueError(f"不支持的下载类型: {self.download_type}")
+
+    def finalize(self, plan):
+        """处理阶段：转码或合并下载好的流文件，返回结果信息"""
+        output_path = plan['output_path']
+        if plan['type'] == 'convert_audio':
+            try:
+                # 使用 moviepy 转换为 MP4 格式
+                self.progress_signal.emit(f"编码配置: {self.profile.describe()}")
+                audio = AudioFileClip(plan['audio_path'])
+                audio.write_audiofile(output_path, codec=self.profile.audio_codec,
+                                      bitrate=self.profile.audio_bitrate)
+                audio.close()
+
+                # 清理时文件
+                try:
+                    os.remove(plan['audio_path'])
+                except:
+                    pass
+            except Exception as e:
+                return f"音频转换失败: {str(e)}"
+
+        elif plan['type'] == 'merge':
+            # 合并音视频
+            self.progress_signal.emit(f"正在合并音视频: {os.path.basename(output_path)}")
+            if not self._merge_audio_video(plan['video_path'], plan['audio_path'], output_path):
+                return "合并失败"
+            # 清理临时文件
+            try:
+                os.remove(plan['video_path'])
+                os.remove(plan['audio_path'])
+            except:
+                pass
+
+        return f"下载完成: {output_path}"
+
 
+class RangeDownloadTask(DownloadTask):
+    """只下载视频中一段时间的片段并直接剪辑
+
+    B站的 DASH 流是带索引（sidx）的分片 MP4：先读取初始化段和索引，只请求与剪辑
+    区间重叠的分片，拼成只包含这段时间的小文件，再按剪辑模式剪出精确的区间。
+    下载量和耗时只与片段长度有关，与视频总长度无关。
+    """
+
+    # 下载类型对应需要的流
+    STREAM_KINDS = {
+        'mp3': ['audio'],
+        'mp4audio': ['audio'],
+        'mp4': ['video'],
+        'full_mp4': ['video', 'audio'],
+    }
+
+    def __init__(self, url, start_time, end_time, download_type='full_mp4', clip_mode='smart',
+                 connections=8, pages=None, policy=None, profile=None, parent=None):
+        super().__init__(url, download_type, connections, pages, policy, profile, parent)
+        self.start_time = start_time
+        self.end_time = end_time
+        self.clip_mode = clip_mode
+
+    async def _fragment_range(self, stream, reader):
+        """读取索引，返回 (需要下载的字节区间列表, 片段在完整视频中的开始时间, 完整文件大小)"""
+        segment_base = dash_segment_base(stream)
+        if segment_base is None:
+            raise ValueError("视频流没有分片索引，无法只下载片段")
+        init_end, index_start, index_end = segment_base
+        data = await reader.read_range(dash_stream_urls(stream), 0, index_end)
+        fragments = parse_sidx(data[index_start:], index_start)
+        chosen = [f for f in fragments if f[1] > self.start_time and f[0] < self.end_time]
+        if not chosen:
+            raise ValueError("剪辑区间超出视频长度")
+        # 初始化段（ftyp + moov）加上与区间重叠的连续分片，不需要索引本身
+        return ([(0, init_end), (chosen[0][2], chosen[-1][3])], chosen[0][0] - fragments[0][0],
+                fragments[-1][3] + 1)
+
+    async def transfer_streams(self, meta):
+        """传输阶段：只下载区间内的分片，返回交给 finalize 的处理计划"""
+        title = meta['title']
+        download_info = meta['download_info']
+        if self.download_type not in self.STREAM_KINDS:
+            raise ValueError(f"不支持的下载类型: {self.download_type}")
+
+        download_dir = os.path.join(get_app_dir(), 'downloads', meta.get('subdir', ''))
+        os.makedirs(download_dir, exist_ok=True)
+        time_range = f"{format_time_label(self.start_time)}_{format_time_label(self.end_time)}"
+
+        names = {'video': '视频流', 'audio': '音频流'}
+        extensions = {'video': '.mp4', 'audio': '.m4a'}
+        reader = RangedDownloader(connections=self.connections)
+        streams = []
+        parts = []
+        needed = full = 0
+        self.progress_signal.emit(f"正在读取分片索引: {title}")
+        for kind in self.STREAM_KINDS[self.download_type]:
+            stream = self._select_stream(download_info, kind)
+            ranges, offset, size = await self._fragment_range(stream, reader)
+            needed += sum(end - start + 1 for start, end in ranges)
+            full += size
+            path = os.path.join(download_dir, f'temp_range_{kind}_{title}{extensions[kind]}')
+            streams.append((names[kind], dash_stream_urls(stream), (path, ranges)))
+            parts.append((kind, path, offset))
+
+        self.progress_signal.emit(
+            f"正在下载片段 {time_range}: {title}（{format_size(needed)}，完整文件 {format_size(full)}）")
+        await self._download_streams(streams)
+        return {'type': 'clip', 'parts': parts, 'time_range': time_range,
+                'base_name': os.path.join(download_dir, title)}
+
+    def _align_parts(self, parts, merged_path):
+        """把各流的片段复制封装到一个文件，返回文件开头在完整视频中的时间（秒）
+
+        片段保留了原始的时间戳，但 ffmpeg 会把每路输入都平移到从 0 开始，这里按
+        索引中的开始时间用 -ss / -itsoffset 补回各流之间的差，以第一路流的起点为 0，
+        与下载完整视频后的时间轴一致。
+        """
+        origin = parts[0][2]
+        args = []
+        for kind, path, offset in parts:
+            if offset < origin:
+                args += ['-ss', f'{origin - offset:.6f}']
+            elif offset > origin:
+                args += ['-itsoffset', f'{offset - origin:.6f}']
+            args += ['-i', path]
+        for index in range(len(parts)):
+            args += ['-map', str(index)]
+        run_ffmpeg(args + ['-c', 'copy', merged_path])
+        return origin
+
+    def finalize(self, plan):
+        """处理阶段：对齐片段后按剪辑模式剪出精确区间，返回结果信息"""
+        if plan['type'] != 'clip':
+            return super().finalize(plan)
+        audio_only = self.download_type in ('mp3', 'mp4audio')
+        merged_path = plan['base_name'] + ('_range.m4a' if audio_only else '_range.mp4')
+        clipper = None
+        try:
+            self.progress_signal.emit(f"正在剪辑片段（编码配置: {self.profile.describe()}）...")
+            origin = self._align_parts(plan['parts'], merged_path)
+            clipper = MediaClipper(merged_path, max(0, self.start_time - origin),
+                                   self.end_time - origin, save_audio_only=audio_only,
+                                   video_only=self.download_type == 'mp4', mode=self.clip_mode,
+                                   profile=self.profile,
+                                   save_as_mp4_audio=self.download_type == 'mp4audio',
+                                   progress_callback=self.progress_signal.emit)
+            output_path = clipper.clip_to(plan['base_name'], plan['time_range'])
         except Exception as e:
-            self.finished_signal.emit(f"下载失败: {str(e)}")
+            return f"剪辑失败: {str(e)}"
+        finally:
+            if clipper is not None:
+                clipper.release()
+            for path in [merged_path] + [path for _, path, _ in plan['parts']]:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+        return f"下载完成: {output_path}"
 
-class ClipWorker(QThread):
+
+class BatchDownloadTask(QObject):
+    """批量下载调度
+
+    分为两个阶段流水线执行：元数据阶段并发获取标题和下载地址，传输阶段并发
+    下载文件，合并/转码在线程池中进行。所有条目都是同一个事件循环中的协程，
+    两个阶段各自限制并发数，并且预取的元数据数量有上限，避免下载地址在排队
+    期间过期。
+    """
     progress_signal = Signal(str)
+    progress_value = Signal(int)
+    item_status_signal = Signal(int, str)  # 条目序号, 状态
+    telemetry_signal = Signal(object)      # 所有条目汇总的进度快照
     finished_signal = Signal(str)
 
-    def __init__(self, file_path, start_time, end_time, save_audio_only=False, video_only=False):
-        super().__init__()
+    def __init__(self, urls, download_type='mp3', concurrency=3, meta_concurrency=4,
+                 connections=4, pages=None, policy=None, profile=None, parent=None):
+        super().__init__(parent)
+        self.urls = list(urls)
+        self.download_type = download_type
+        self.pages = pages
+        self.policy = policy
+        self.profile = profile
+        self.concurrency = max(1, concurrency)
+        self.meta_concurrency = max(1, meta_concurrency)
+        self.connections = connections
+        self.cancelled = False
+        self._task = None
+        self._item_tasks = []
+        self._lock = threading.Lock()
+        self._fractions = [0.0] * len(self.urls)
+        self._last_progress = -1
+        # 各条目最近一次的进度快照，以及已结束条目下载的字节数
+        self._item_snapshots = {}
+        self._finished_bytes = 0
+        self._started = 0
+        self._last_telemetry = 0
+        self.succeeded = 0
+        self.failed = 0
+
+    def start(self):
+        """在当前事件循环中开始批量下载"""
+        self._task = asyncio.ensure_future(self.run_batch())
+
+    def isRunning(self):
+        return self._task is not None and not self._task.done()
+
+    def cancel(self):
+        """取消批量下载：未开始的条目不再执行，进行中的条目中断"""
+        self.cancelled = True
+        for task in self._item_tasks:
+            task.cancel()
+
+    def _set_fraction(self, index, fraction):
+        """更新单个条目的完成比例并发出总进度"""
+        with self._lock:
+            self._fractions[index] = fraction
+            progress = int(sum(self._fractions) * 100 / max(len(self._fractions), 1))
+            if progress == self._last_progress:
+                return
+            self._last_progress = progress
+        self.progress_value.emit(progress)
+
+    def _update_telemetry(self, index, snapshot, force=False):
+        """汇总各条目的进度快照，最多每 0.1 秒发出一次"""
+        with self._lock:
+            if snapshot is not None:
+                self._item_snapshots[index] = snapshot
+            now = time.monotonic()
+            if now - self._last_telemetry < 0.1 and not force:
+                return
+            self._last_telemetry = now
+            active = list(self._item_snapshots.values())
+            fraction = sum(self._fractions) / max(len(self._fractions), 1)
+        elapsed = now - self._started
+        eta = elapsed * (1 - fraction) / fraction if fraction > 0 else None
+        self.telemetry_signal.emit({
+            'downloaded': self._finished_bytes + sum(s['downloaded'] for s in active),
+            'total': None,
+            'percent': int(fraction * 100),
+            'rate': sum(s['rate'] for s in active),
+            'average_rate': sum(s['average_rate'] for s in active),
+            'disk_rate': sum(s.get('disk_rate') or 0 for s in active),
+            'eta': eta,
+        })
+
+    def _finish_item_telemetry(self, index):
+        """条目结束后不再计入当前速度"""
+        with self._lock:
+            snapshot = self._item_snapshots.pop(index, None)
+            if snapshot is not None:
+                self._finished_bytes += snapshot['downloaded']
+        self._update_telemetry(index, None, force=True)
+
+    def _emit_summary(self):
+        total = len(self.urls)
+        done = self.succeeded + self.failed
+        self.progress_signal.emit(
+            f"批量下载: 已完成 {done}/{total}（成功 {self.succeeded}，失败 {self.failed}）")
+
+    async def _process(self, index, item, meta_semaphore, pipeline_semaphore, transfer_semaphore,
+                       merge_executor):
+        try:
+            async with pipeline_semaphore:
+                if self.cancelled:
+                    raise asyncio.CancelledError()
+                async with meta_semaphore:
+                    self.item_status_signal.emit(index, "正在获取视频信息")
+                    meta = await item.fetch_metadata()
+                self.item_status_signal.emit(index, f"等待下载: {meta['title']}")
+                message = await item.download_pages(meta, merge_executor, transfer_semaphore)
+        except asyncio.CancelledError:
+            message = "已取消"
+        except Exception as e:
+            message = f"下载失败: {str(e)}"
+        return self._finish_item(index, message)
+
+    def _finish_item(self, index, message):
+        """记录条目的结果并发出状态，返回是否成功"""
+        success = message.startswith("下载完成")
+        with self._lock:
+            if success:
+                self.succeeded += 1
+            else:
+                self.failed += 1
+        self._set_fraction(index, 1.0)
+        self._finish_item_telemetry(index)
+        self.item_status_signal.emit(index, message)
+        self._emit_summary()
+        return success
+
+    async def run_batch(self):
+        """执行整个批量下载，结束时发出 finished_signal"""
+        items = []
+        for index, url in enumerate(self.urls):
+            item = DownloadTask(url, self.download_type, self.connections, self.pages, self.policy,
+                                self.profile)
+            # 条目不单独启动，只复用它的下载逻辑，信号直接转发为批量任务的信号
+            item.progress_value.connect(
+                lambda value, index=index: self._set_fraction(index, value / 100 * 0.99),
+                Qt.DirectConnection)
+            item.progress_signal.connect(
+                lambda message, index=index: self.item_status_signal.emit(index, message),
+                Qt.DirectConnection)
+            item.telemetry_signal.connect(
+                lambda snapshot, index=index: self._update_telemetry(index, snapshot),
+                Qt.DirectConnection)
+            items.append(item)
+
+        self._started = time.monotonic()
+        self._emit_summary()
+        meta_semaphore = asyncio.Semaphore(self.meta_concurrency)
+        transfer_semaphore = asyncio.Semaphore(self.concurrency)
+        # 已取得元数据但还没下载完的条目数上限
+        pipeline_semaphore = asyncio.Semaphore(self.concurrency + self.meta_concurrency)
+        # 合并/转码使用单独的线程池，与后续条目的传输并行
+        merge_executor = ThreadPoolExecutor(max_workers=self.concurrency)
+        try:
+            self._item_tasks = [asyncio.ensure_future(
+                self._process(index, item, meta_semaphore, pipeline_semaphore,
+                              transfer_semaphore, merge_executor))
+                for index, item in enumerate(items)]
+            results = await asyncio.gather(*self._item_tasks, return_exceptions=True)
+            for index, result in enumerate(results):
+                # 还没开始执行就被取消的条目不会进入 _process 的异常处理
+                if isinstance(result, asyncio.CancelledError):
+                    self._finish_item(index, "已取消")
+            self.finished_signal.emit(
+                f"批量下载结束: 成功 {self.succeeded}，失败 {self.failed}，共 {len(self.urls)} 个")
+        except Exception as e:
+            self.finished_signal.emit(f"批量下载失败: {str(e)}")
+        finally:
+            self._item_tasks = []
+            merge_executor.shutdown(wait=False)
+            metadata_cache.flush()
+            mirror_stats.flush()
+            media_probe.flush()
+
+
+class MediaClipper:
+    """剪辑引擎：按剪辑模式剪出单个区间或整个剪辑列表
+
+    不依赖 Qt 线程，ClipWorker 在后台线程中使用它，RangeDownloadTask 在合并线程池中
+    直接调用。进度信息通过 progress_callback 报告。
+    """
+
+    # 快速剪辑时在剪切点前后扫描关键帧的范围（秒）
+    KEYFRAME_SCAN_WINDOW = 10
+
+    def __init__(self, file_path, start_time, end_time, save_audio_only=False, video_only=False,
+                 mode='precise', cues=None, profile=None, save_as_mp4_audio=False,
+                 progress_callback=None, processes=None):
         self.file_path = file_path
         self.start_time = start_time
         self.end_time = end_time
         self.save_audio_only = save_audio_only
         self.video_only = video_only
+        # 剪辑模式：precise 全部重新编码，smart 只重新编码边界 GOP，fast 对齐关键帧直接复制
+        self.mode = mode
+        # 剪辑列表 [(开始秒, 结束秒, 名称)]，不为空时忽略 start_time/end_time，一次剪出所有片段
+        self.cues = cues or []
+        # 重新编码时使用的编码配置
+        self.profile = profile or encoding_profiles.current()
+        # 只输出音频时保存为 MP4 音频而不是 MP3
+        self.save_as_mp4_audio = save_as_mp4_audio
+        self.progress_callback = progress_callback
+        # 剪辑过程中启动的 ffmpeg 进程，cancel() 时一并结束
+        self.processes = processes or ProcessGroup()
         self.media = None
         self.clip = None
-        self.save_as_mp4_audio = False
+
+    def _report(self, message):
+        if self.progress_callback:
+            self.progress_callback(message)
 
     def format_time(self, seconds):
-        """将秒数转换为 HH-mm-ss 格式"""
-        hours = seconds // 3600
-        minutes = (seconds % 3600) // 60
-        secs = seconds % 60
-        return f"{hours:02d}-{minutes:02d}-{secs:02d}"
+        """将秒数转换为 HH-mm-ss 格式（有毫秒时为 HH-mm-ss.zzz）"""
+        return format_time_label(seconds)
 
     def has_video_stream(self, file_path):
         """检查文件是否包含视频流和音频流"""
+        return media_probe.stream_flags(file_path)
+
+    def _snap_to_keyframes(self, start_time, end_time, file_start_time):
+        """将剪辑起止时间对齐到最近的关键帧，只扫描剪切点附近的数据
+
+        file_start_time 为文件的起始时间（容器中第一个时间戳）。
+        """
+        window = self.KEYFRAME_SCAN_WINDOW
+        start_keyframes = scan_keyframes(self.file_path, max(0, start_time - window),
+                                         start_time + window, file_start_time)
+        end_keyframes = scan_keyframes(self.file_path, max(0, end_time - window),
+                                       end_time + window, file_start_time)
+
+        start = start_time
+        if start_keyframes:
+            start = min(start_keyframes, key=lambda t: abs(t - start_time))
+            if start >= end_time:
+                # 最近的关键帧落在区间之外时退回到之前的关键帧
+                earlier = [t for t in start_keyframes if t <= start_time]
+                start = earlier[-1] if earlier else start_time
+
+        end = end_time
+        candidates = [t for t in end_keyframes if t > start]
+        if candidates:
+            nearest = min(candidates, key=lambda t: abs(t - end_time))
+            # 剪到文件末尾附近时保留原结束时间
+            if abs(nearest - end_time) < window:
+                end = nearest
+        return max(0, start), end
+
+    def _estimate_output_size(self):
+        """用关键帧索引估算快速剪辑和智能剪辑的输出大小（字节），无法估算时返回 None"""
+        info = media_probe.probe(self.file_path)
+        if (self.save_audio_only or os.path.splitext(self.file_path)[1].lower() != '.mp4'
+                or first_stream(info, 'video') is None):
+            return None
+        size = keyframe_index.estimate_size(self.file_path, self.start_time, self.end_time,
+                                            info['start_time'])
+        if size is None and info.get('duration'):
+            # 没有字节偏移（非 MP4 文件）时按时长比例估算
+            size = (os.path.getsize(self.file_path) * (self.end_time - self.start_time)
+                    / info['duration'])
+        return size
+
+    def _fast_clip(self, base_name, time_range, original_ext):
+        """快速剪辑：直接复制数据包，返回输出路径；无法无损剪辑时返回 None"""
+        info = media_probe.probe(self.file_path)
+        video_stream = first_stream(info, 'video')
+        audio_stream = first_stream(info, 'audio')
+
+        if not self.save_audio_only and original_ext == '.mp4' and video_stream is not None:
+            start, end = self._snap_to_keyframes(self.start_time, self.end_time,
+                                                 info['start_time'])
+            self._report(
+                f"快速剪辑：起止时间已对齐到关键帧 {start:.3f}s - {end:.3f}s")
+            output_path = f"{base_name}_剪辑_{time_range}.mp4"
+            args = ['-ss', f'{start:.3f}', '-i', self.file_path, '-t', f'{end - start:.3f}',
+                    '-map', f"0:{video_stream['index']}"]
+            if not self.video_only and audio_stream is not None:
+                args += ['-map', f"0:{audio_stream['index']}"]
+            args += ['-c', 'copy', '-avoid_negative_ts', 'make_zero',
+                     '-movflags', '+faststart', output_path]
+            run_ffmpeg(args, self.processes)
+            return output_path
+
+        if audio_stream is None:
+            raise ValueError("文件不包含音频流")
+
+        # 音频数据包（MP3/AAC 帧）本身就是独立可解码的，按帧边界复制即可
+        if self.save_as_mp4_audio:
+            output_path = f"{base_name}_剪辑_{time_range}.mp4"
+            compatible = audio_stream['codec'] in MP4_COPY_CODECS['audio']
+        else:
+            output_path = f"{base_name}_剪辑_{time_range}.mp3"
+            compatible = audio_stream['codec'] == 'mp3'
+        if not compatible:
+            self._report(
+                f"{audio_stream['codec']} 音频无法无损保存为{os.path.splitext(output_path)[1]}，改用精确剪辑...")
+            return None
+
+        run_ffmpeg(['-ss', f'{self.start_time:.3f}', '-i', self.file_path,
+                    '-t', f'{self.end_time - self.start_time:.3f}',
+                    '-map', f"0:{audio_stream['index']}", '-c', 'copy', output_path],
+                   self.processes)
+        return output_path
+
+    def _smart_clip(self, start_time, end_time, base_name, time_range, original_ext):
+        """智能剪辑：帧精确，只重新编码剪切点所在的 GOP；无法使用时返回 None"""
+        if self.save_audio_only or original_ext != '.mp4':
+            # 音频帧很短，解码重编码的代价很小，直接使用精确剪辑
+            return None
+        output_path = f"{base_name}_剪辑_{time_range}.mp4"
+        renderer = SmartRenderer(progress_callback=self.progress_callback, profile=self.profile,
+                                 processes=self.processes)
         try:
-            # 先尝试作为音频文件打开
-            try:
-                audio = AudioFileClip(file_path)
-                has_audio = True
-                audio.close()
-            except:
-                has_audio = False
+            return renderer.render(self.file_path, start_time, end_time, output_path,
+                                   include_audio=not self.video_only)
+        except ValueError as e:
+            self._report(f"无法智能剪辑（{str(e)}），改用精确剪辑...")
+            return None
+
+    def _precise_clip(self, base_name, time_range, original_ext):
+        """精确剪辑：视频分段并行重新编码，音频使用 moviepy 重新编码，返回输出路径"""
+        if not self.save_audio_only and original_ext == '.mp4':
+            # 处理视频：在关键帧处分段，多个进程并行编码
+            info = media_probe.probe(self.file_path)
+            audio_stream = None if self.video_only else first_stream(info, 'audio')
+            audio = None
+            if audio_stream is not None:
+                audio = ChunkedEncoder.audio_source(self.file_path, self.start_time,
+                                                    self.end_time, audio_stream['index'],
+                                                    self.profile.audio_args())
 
-            # 再尝试作为频文件打开
+            output_path = f"{base_name}_剪辑_{time_range}.mp4"
+            encoder = ChunkedEncoder(progress_callback=self.progress_callback,
+                                     profile=self.profile, processes=self.processes)
+            encoder.encode(self.file_path, self.start_time, self.end_time, output_path,
+                           audio=audio)
+
+        else:
+            # 处理音频
             try:
-                video = VideoFileClip(file_path)
-                has_video = video.size[0] > 0 and video.size[1] > 0
-                # 如果之前没检测到音频，再次检查视频文件的音频
-                if not has_audio:
-                    has_audio = video.audio is not None
-                video.close()
-            except:
-                has_video = False
+                # 直接使用 AudioFileClip 处理，不管是 MP3 还是 MP4
+                self.media = AudioFileClip(self.file_path)
+                self.clip = self.media.subclip(self.start_time, self.end_time)
 
-            return has_video, has_audio
-        except Exception as e:
-            print(f"检查文件流时出错: {str(e)}")
-            return False, False
+                # 根据设置决定输出格式
+                if self.save_as_mp4_audio:
+                    output_path = f"{base_name}_剪辑_{time_range}.mp4"
+                    self.clip.write_audiofile(output_path, codec=self.profile.audio_codec,
+                                              bitrate=self.profile.audio_bitrate)
+                else:
+                    output_path = f"{base_name}_剪辑_{time_range}.mp3"
+                    self.clip.write_audiofile(output_path,
+                                            codec='libmp3lame',
+                                            bitrate=self.profile.audio_bitrate)
+
+            except Exception as e:
+                self._report(f"处理音频时出错: {str(e)}")
+                raise
+
+        return output_path
+
+    def _cue_label(self, cue):
+        """片段在输出文件名中的标识：有名称时用名称，否则用时间区间"""
+        start, end, name = cue
+        if name:
+            return safe_filename(name)
+        return f"{self.format_time(start)}_{self.format_time(end)}"
+
+    def _cue_streams(self, original_ext):
+        """返回剪辑列表输出的 (视频流, 音频流, 输出扩展名)，不输出的流为 None"""
+        info = media_probe.probe(self.file_path)
+        video_stream = first_stream(info, 'video')
+        audio_stream = first_stream(info, 'audio')
+        if not self.save_audio_only and original_ext == '.mp4' and video_stream is not None:
+            return video_stream, None if self.video_only else audio_stream, '.mp4'
+        if audio_stream is None:
+            raise ValueError("文件不包含音频流")
+        return None, audio_stream, '.mp4' if self.save_as_mp4_audio else '.mp3'
+
+    def _fast_cues(self, base_name, cues, original_ext):
+        """快速剪辑整个列表：读取一次源文件，同时把各片段复制到各自的输出文件
+
+        视频片段的起止时间先用关键帧索引对齐到关键帧。返回输出路径列表；无法无损
+        剪辑时返回 None。
+        """
+        info = media_probe.probe(self.file_path)
+        video_stream, audio_stream, ext = self._cue_streams(original_ext)
+        if video_stream is None:
+            compatible = (audio_stream['codec'] in MP4_COPY_CODECS['audio']
+                          if ext == '.mp4' else audio_stream['codec'] == 'mp3')
+            if not compatible:
+                self._report(
+                    f"{audio_stream['codec']} 音频无法无损保存为{ext}，改用精确剪辑...")
+                return None
+
+        ranges = []
+        for cue in cues:
+            start, end = cue[0], cue[1]
+            if video_stream is not None:
+                start, end = self._snap_to_keyframes(start, end, info['start_time'])
+            ranges.append((start, end, f"{base_name}_剪辑_{self._cue_label(cue)}{ext}"))
+
+        # 从最早的片段开始读取，每个输出用自己的 -ss/-t 截取，数据包只读一次
+        origin = min(start for start, _, _ in ranges)
+        args = ['-ss', f'{origin:.3f}', '-i', self.file_path]
+        for start, end, output_path in ranges:
+            args += ['-ss', f'{start - origin:.3f}', '-t', f'{end - start:.3f}']
+            for stream in (video_stream, audio_stream):
+                if stream is not None:
+                    args += ['-map', f"0:{stream['index']}"]
+            args += ['-c', 'copy', '-avoid_negative_ts', 'make_zero']
+            if ext == '.mp4':
+                args += ['-movflags', '+faststart']
+            args.append(output_path)
+        self._report(f"快速剪辑：读取一次源文件，同时复制出 {len(ranges)} 个片段...")
+        run_ffmpeg(args, self.processes)
+        return [output_path for _, _, output_path in ranges]
+
+    def _precise_cues(self, base_name, cues, original_ext):
+        """精确剪辑整个列表：只解码一次源文件，解码后的画面和声音分发给各片段的编码器
+
+        用 split/trim 滤镜从同一路解码结果中截出各片段，重叠的片段共用解码结果，
+        解码范围为最早片段的开始到最晚片段的结束。返回输出路径列表。
+        """
+        video_stream, audio_stream, ext = self._cue_streams(original_ext)
+        origin = min(start for start, _, _ in cues)
+        finish = max(end for _, end, _ in cues)
+        count = len(cues)
+
+        filters = []
+        for kind, stream, split, trim, setpts in (
+                ('v', video_stream, 'split', 'trim', 'setpts'),
+                ('a', audio_stream, 'asplit', 'atrim', 'asetpts')):
+            if stream is None:
+                continue
+            filters.append(f"[0:{stream['index']}]{split}={count}"
+                           + ''.join(f"[{kind}{i}]" for i in range(count)))
+            for i, (start, end, _) in enumerate(cues):
+                filters.append(f"[{kind}{i}]{trim}=start={start - origin:.6f}"
+                               f":end={end - origin:.6f},{setpts}=PTS-STARTPTS[{kind}o{i}]")
+
+        args = ['-ss', f'{origin:.6f}', '-t', f'{finish - origin:.6f}', '-i', self.file_path,
+                '-filter_complex', ';'.join(filters)]
+        outputs = []
+        for i, cue in enumerate(cues):
+            output_path = f"{base_name}_剪辑_{self._cue_label(cue)}{ext}"
+            if video_stream is not None:
+                args += (['-map', f'[vo{i}]'] + self.profile.video_args()
+                         + self.profile.thread_args() + self.profile.tag_args())
+            if audio_stream is not None:
+                args += ['-map', f'[ao{i}]'] + self.profile.audio_args(mp3=ext == '.mp3')
+            if ext == '.mp4':
+                args += ['-movflags', '+faststart']
+            args.append(output_path)
+            outputs.append(output_path)
+        self._report(f"精确剪辑：解码一次源文件，同时编码 {count} 个片段...")
+        run_ffmpeg(args, self.processes)
+        return outputs
+
+    def clip_cues(self, base_name):
+        """按剪辑列表剪出所有片段，返回输出路径列表
+
+        快速剪辑和精确剪辑都只读取一次源文件；智能剪辑每个片段只重新编码两端的
+        GOP，逐个处理，无法智能剪辑的片段合并到一次精确剪辑中。
+        """
+        original_ext = os.path.splitext(self.file_path)[1].lower()
+        cues = sorted(self.cues, key=lambda cue: (cue[0], cue[1]))
+        duration = media_probe.probe(self.file_path)['duration']
+        if duration is not None:
+            for cue in cues:
+                if cue[0] >= duration:
+                    raise ValueError(f"片段 {self._cue_label(cue)} 的开始时间超出文件时长")
+        if self.mode == 'fast':
+            outputs = self._fast_cues(base_name, cues, original_ext)
+            if outputs is not None:
+                return outputs
+        elif self.mode == 'smart':
+            outputs = []
+            remaining = []
+            for i, cue in enumerate(cues):
+                self._report(f"智能剪辑第{i + 1}/{len(cues)}个片段...")
+                output_path = self._smart_clip(cue[0], cue[1], base_name, self._cue_label(cue),
+                                               original_ext)
+                if output_path is None:
+                    remaining.append(cue)
+                else:
+                    outputs.append(output_path)
+            if remaining:
+                outputs += self._precise_cues(base_name, remaining, original_ext)
+            return outputs
+        return self._precise_cues(base_name, cues, original_ext)
+
+    def clip_to(self, base_name, time_range):
+        """按剪辑模式剪辑，输出为 base_name_剪辑_time_range.扩展名，返回输出路径"""
+        original_ext = os.path.splitext(self.file_path)[1].lower()
+        output_path = None
+        if self.mode == 'fast':
+            output_path = self._fast_clip(base_name, time_range, original_ext)
+        elif self.mode == 'smart':
+            output_path = self._smart_clip(self.start_time, self.end_time, base_name, time_range,
+                                           original_ext)
+
+        if output_path is None:
+            output_path = self._precise_clip(base_name, time_range, original_ext)
+        return output_path
+
+    def release(self):
+        """关闭精确剪辑时打开的文件"""
+        try:
+            if hasattr(self, 'clip') and self.clip:
+                self.clip.close()
+            if hasattr(self, 'media') and self.media:
+                self.media.close()
+        except:
+            pass
+
+    def cancel(self):
+        """中止剪辑：结束正在运行的 ffmpeg 进程并关闭打开的文件，可从其他线程调用"""
+        self.processes.cancel()
+        self.release()
+
+
+class ClipWorker(QThread):
+    """在后台线程中用 MediaClipper 剪辑，进度和结果通过 Qt 信号发出"""
+    progress_signal = Signal(str)
+    finished_signal = Signal(str)
+
+    def __init__(self, file_path, start_time, end_time, save_audio_only=False, video_only=False,
+                 mode='precise', cues=None, profile=None):
+        super().__init__()
+        self.file_path = file_path
+        self.start_time = start_time
+        self.end_time = end_time
+        self.save_audio_only = save_audio_only
+        self.video_only = video_only
+        self.mode = mode
+        self.cues = cues or []
+        self.profile = profile or encoding_profiles.current()
+        self.save_as_mp4_audio = False
+        self.processes = ProcessGroup()
+        self.clipper = None
+
+    def cancel(self):
+        """中止剪辑，run() 随后以剪辑失败结束"""
+        self.processes.cancel()
+        if self.clipper is not None:
+            self.clipper.cancel()
 
     def run(self):
+        clipper = MediaClipper(self.file_path, self.start_time, self.end_time,
+                               self.save_audio_only, self.video_only, self.mode, self.cues,
+                               self.profile, self.save_as_mp4_audio,
+                               progress_callback=self.progress_signal.emit,
+                               processes=self.processes)
+        self.clipper = clipper
         try:
-            self.progress_signal.emit("开始剪辑...")
-            
-            # 获取原文件扩展名
-            original_ext = os.path.splitext(self.file_path)[1].lower()
-            time_range = f"{self.format_time(self.start_time)}_{self.format_time(self.end_time)}"
-            base_name = os.path.splitext(self.file_path)[0]
-            
-            if not self.save_audio_only and original_ext == '.mp4':
-                # 处理视频
-                self.media = VideoFileClip(self.file_path)
-                self.clip = self.media.subclip(self.start_time, self.end_time)
-                
-                if self.video_only:
-                    # 只保视频
-                    self.clip = self.clip.without_audio()
-                
-                output_path = f"{base_name}_剪辑_{time_range}.mp4"
-                self.clip.write_videofile(output_path,
-                                        codec='libx264',
-                                        audio_codec='aac' if not self.video_only else None,
-                                        temp_audiofile='temp-audio.m4a',
-                                        remove_temp=True)
-                
-            else:
-                # 处理音频
-                try:
-                    # 直接使用 AudioFileClip 处理，不管是 MP3 还是 MP4
-                    self.media = AudioFileClip(self.file_path)
-                    self.clip = self.media.subclip(self.start_time, self.end_time)
-                    
-                    # 根据设置决定输出格式
-                    if self.save_as_mp4_audio:
-                        output_path = f"{base_name}_剪辑_{time_range}.mp4"
-                        self.clip.write_audiofile(output_path, codec='aac')
-                    else:
-                        output_path = f"{base_name}_剪辑_{time_range}.mp3"
-                        self.clip.write_audiofile(output_path,
-                                                codec='libmp3lame',
-                                                bitrate='192k')
-                                            
-                except Exception as e:
-                    self.progress_signal.emit(f"处理音频时出错: {str(e)}")
-                    raise
-            
-            # 清理资源
-            try:
-                if hasattr(self, 'clip') and self.clip:
-                    self.clip.close()
-                if hasattr(self, 'media') and self.media:
-                    self.media.close()
-            except:
-                pass
+            if self.mode != 'fast':
+                self.progress_signal.emit(f"编码配置: {self.profile.describe()}")
+            if self.cues:
+                self.progress_signal.emit(f"开始按剪辑列表剪辑 {len(self.cues)} 个片段...")
+                outputs = clipper.clip_cues(os.path.splitext(self.file_path)[0])
+                self.finished_signal.emit(f"剪辑完成（共 {len(outputs)} 段）: {outputs[-1]}")
+                return
+
+            estimate = None
+            if self.mode != 'precise':
+                try:
+                    estimate = clipper._estimate_output_size()
+                except (OSError, ValueError):
+                    pass
+            if estimate:
+                self.progress_signal.emit(f"开始剪辑，预计输出约 {format_size(estimate)}...")
+            else:
+                self.progress_signal.emit("开始剪辑...")
             
+            time_range = f"{format_time_label(self.start_time)}_{format_time_label(self.end_time)}"
+            base_name = os.path.splitext(self.file_path)[0]
+            output_path = clipper.clip_to(base_name, time_range)
             self.finished_signal.emit(f"剪辑完成: {output_path}")
             
         except Exception as e:
             self.finished_signal.emit(f"剪辑失败: {str(e)}")
+        finally:
             # 确保资源被清理
-            try:
-                if hasattr(self, 'clip') and self.clip:
-                    self.clip.close()
-                if hasattr(self, 'media') and self.media:
-                    self.media.close()
-            except:
-                pass
+            clipper.release()
+            media_probe.flush()
 
 class ConcatWorker(QThread):
     progress_signal = Signal(str)
     finished_signal = Signal(str)
     format_select_signal = Signal()  # 新增信号用于请求格式选择
     
-    def __init__(self, file1, file2, start1, end1, start2, end2, concat_type):
+    def __init__(self, segments, concat_type, profile=None):
         super().__init__()
-        self.file1 = file1
-        self.file2 = file2
-        self.start1 = start1
-        self.end1 = end1
-        self.start2 = start2
-        self.end2 = end2
+        # 按顺序拼接的片段列表 [(文件路径, 开始秒数, 结束秒数), ...]
+        self.segments = list(segments)
         self.concat_type = concat_type  # 使用 concat_type 来确定拼接类型和输出格式
+        # 重新编码时使用的编码配置
+        self.profile = profile or encoding_profiles.current()
+        # 拼接过程中启动的 ffmpeg 进程，cancel() 时一并结束
+        self.processes = ProcessGroup()
+
+    def cancel(self):
+        """中止拼接，run() 随后以拼接失败结束"""
+        self.processes.cancel()
 
     def format_time(self, seconds):
-        """将秒数转换为 HH-mm-ss 格式"""
-        hours = seconds // 3600
-        minutes = (seconds % 3600) // 60
-        secs = seconds % 60
-        return f"{hours:02d}-{minutes:02d}-{secs:02d}"
+        """将秒数转换为 HH-mm-ss 格式（有毫秒时为 HH-mm-ss.zzz）"""
+        return format_time_label(seconds)
 
     def check_file(self, file_path):
         """检查文件的音视频流情况"""
-        has_video = False
-        has_audio = False
+        return media_probe.stream_flags(file_path)
+
+    def _output_path(self):
+        """根据拼接类型生成输出文件路径，文件名包含首个片段的开始和最后片段的结束时间"""
+        first_file, first_start, _ = self.segments[0]
+        last_end = self.segments[-1][2]
+        time_range = f"{self.format_time(first_start)}_{self.format_time(last_end)}"
+        if len(self.segments) > 2:
+            time_range = f"{len(self.segments)}段_{time_range}"
+        if 'video' in self.concat_type or self.concat_type == 'audio_mp4':
+            output_ext = '.mp4'
+        else:
+            output_ext = '.mp3'
+        return os.path.join(os.path.dirname(first_file), f"拼接_{time_range}{output_ext}")
+
+    def _join_segments(self, segment_paths, work_dir, output_path):
+        """用 concat demuxer 直接复制码流，按顺序流式拼接已处理好的片段"""
+        list_path = os.path.join(work_dir, 'segments.txt')
+        with open(list_path, 'w', encoding='utf-8') as f:
+            for segment_path in segment_paths:
+                f.write(f"file '{segment_path}'\n")
+
+        args = ['-f', 'concat', '-safe', '0', '-i', list_path, '-map', '0', '-c', 'copy']
+        if output_path.endswith('.mp4'):
+            args += ['-movflags', '+faststart']
+        run_ffmpeg(args + [output_path], self.processes)
+
+    def _copy_concat(self, infos, output_path, work_dir):
+        """编码参数一致时逐个剪出片段再直接复制码流拼接，返回 True；需要重新编码时返回 False"""
+        if self.concat_type == 'video':
+            kinds = ['video', 'audio']
+        elif self.concat_type == 'video_only':
+            kinds = ['video']
+        else:
+            kinds = ['audio']
+        reason = compare_stream_params(infos, kinds)
+        if reason is None and kinds == ['audio']:
+            codec = first_stream(infos[0], 'audio')['codec']
+            if self.concat_type == 'audio_mp3' and codec != 'mp3':
+                reason = f"{codec} 音频无法直接保存为MP3"
+            elif self.concat_type == 'audio_mp4' and codec not in MP4_COPY_CODECS['audio']:
+                reason = f"{codec} 音频无法直接封装为MP4"
+        if reason is not None:
+            self.progress_signal.emit(f"{reason}，改为重新编码拼接...")
+            return False
+
         try:
-            # 检查音频
-            try:
-                audio = AudioFileClip(file_path)
-                has_audio = True
-                audio.close()
-            except:
-                pass
-            
-            # 检查视频
-            try:
-                video = VideoFileClip(file_path)
-                has_video = video.size[0] > 0 and video.size[1] > 0
-                if not has_audio:
-                    has_audio = video.audio is not None
-                video.close()
-            except:
-                pass
-            
-            return has_video, has_audio
-        except Exception as e:
-            self.progress_signal.emit(f"检查文件失败: {str(e)}")
-            return False, False
+            segment_paths = []
+            encoded_pieces = 0
+            for i, (file_path, start, end) in enumerate(self.segments):
+                self.progress_signal.emit(f"正在剪出第{i + 1}/{len(self.segments)}个片段...")
+                if 'video' in self.concat_type:
+                    # 视频片段用智能剪辑切出：剪切点在关键帧上时整段直接复制，否则只重新
+                    # 编码两端的不完整 GOP；各文件音频参数一致，音频直接复制
+                    segment_path = os.path.join(work_dir, f'segment_{i}.mp4')
+                    renderer = SmartRenderer(progress_callback=self.progress_signal.emit,
+                                             profile=self.profile, processes=self.processes)
+                    renderer.render(file_path, start, end, segment_path,
+                                    include_audio=self.concat_type == 'video', copy_audio=True)
+                    encoded_pieces += renderer.encoded_pieces
+                else:
+                    # 音频帧独立可解码，按帧边界直接复制
+                    segment_path = os.path.join(work_dir, f'segment_{i}{os.path.splitext(output_path)[1]}')
+                    audio_stream = first_stream(infos[i], 'audio')
+                    copy_audio_range(file_path, audio_stream['index'], start, end, segment_path,
+                                     self.processes)
+                segment_paths.append(segment_path)
+        except ValueError as e:
+            # 智能剪辑不支持该编码时退回重新编码
+            self.progress_signal.emit(f"无法直接拼接（{str(e)}），改为重新编码拼接...")
+            return False
+
+        if encoded_pieces:
+            self.progress_signal.emit(
+                f"编码参数一致，重新编码了 {encoded_pieces} 处剪切点附近的画面，其余直接复制码流拼接...")
+        else:
+            self.progress_signal.emit("编码参数一致，直接复制码流拼接...")
+        self._join_segments(segment_paths, work_dir, output_path)
+        return True
+
+    def _reencode_target(self, infos):
+        """以第一个片段为准确定重新编码后的统一参数"""
+        target = {'width': None, 'height': None, 'fps': 30, 'sample_rate': 48000}
+        video_stream = first_stream(infos[0], 'video')
+        if video_stream is not None:
+            # libx264 要求宽高为偶数
+            target['width'] = (video_stream.get('width') or 1280) // 2 * 2
+            target['height'] = (video_stream.get('height') or 720) // 2 * 2
+            target['fps'] = video_stream.get('fps') or 30
+        audio_stream = first_stream(infos[0], 'audio')
+        if audio_stream is not None and audio_stream.get('sample_rate'):
+            target['sample_rate'] = audio_stream['sample_rate']
+        return target
+
+    def _reencode_segment(self, file_path, info, start, end, target, segment_path):
+        """把单个片段重新编码为统一参数，每次只打开一个文件"""
+        audio_stream = first_stream(info, 'audio')
+        duration = f'{end - start:.6f}'
+        audio_args = ['-ar', str(target['sample_rate']), '-ac', '2']
+
+        if 'video' in self.concat_type:
+            width, height = target['width'], target['height']
+            video_filter = (f"scale={width}:{height}:force_original_aspect_ratio=decrease,"
+                            f"pad={width}:{height}:(ow-iw)/2:(oh-ih)/2,setsar=1,"
+                            f"fps={target['fps']},format=yuv420p")
+            audio = None
+            if self.concat_type == 'video':
+                audio_args = self.profile.audio_args() + audio_args
+                if audio_stream is not None:
+                    audio = ChunkedEncoder.audio_source(file_path, start, end,
+                                                        audio_stream['index'], audio_args)
+                else:
+                    # 没有音频的片段补静音，保证所有片段的流结构一致
+                    audio = (['-f', 'lavfi', '-t', duration, '-i',
+                              f"anullsrc=r={target['sample_rate']}:cl=stereo"], '0:a', audio_args)
+            # 视频在关键帧处分段，多个进程并行编码
+            encoder = ChunkedEncoder(progress_callback=self.progress_signal.emit,
+                                     profile=self.profile, processes=self.processes)
+            encoder.encode(file_path, start, end, segment_path, video_filter=video_filter,
+                           audio=audio)
+            return
+
+        audio_args += self.profile.audio_args(mp3=self.concat_type == 'audio_mp3')
+        run_ffmpeg(['-ss', f'{start:.6f}', '-i', file_path, '-t', duration,
+                    '-map', f"0:{audio_stream['index']}", '-vn'] + audio_args + [segment_path],
+                   self.processes)
+
+    def _reencode_concat(self, infos, output_path, work_dir):
+        """逐个片段重新编码为统一参数后再复制拼接，内存占用与片段数量和时长无关"""
+        target = self._reencode_target(infos)
+        ext = '.mp3' if self.concat_type == 'audio_mp3' else '.mp4'
+        segment_paths = []
+        for i, (file_path, start, end) in enumerate(self.segments):
+            self.progress_signal.emit(f"正在重新编码第{i + 1}/{len(self.segments)}个片段...")
+            segment_path = os.path.join(work_dir, f'segment_{i}{ext}')
+            self._reencode_segment(file_path, infos[i], start, end, target, segment_path)
+            segment_paths.append(segment_path)
+
+        self.progress_signal.emit("正在拼接片段...")
+        self._join_segments(segment_paths, work_dir, output_path)
 
     def check_files(self):
-        """检查两个文件的音视频流情况"""
-        file1_has_video, file1_has_audio = self.check_file(self.file1)
-        file2_has_video, file2_has_audio = self.check_file(self.file2)
+        """检查所有片段文件的音视频流情况"""
+        checked = {}
+        for file_path, _, _ in self.segments:
+            if file_path not in checked:
+                checked[file_path] = self.check_file(file_path)
         
         # 根据拼接类型返回相应的检查结果
         if 'video' in self.concat_type:
-            # 视频拼接模式需要两个文件都有视频流
-            return file1_has_video and file2_has_video
+            # 视频拼接模式需要所有文件都有视频流
+            return all(has_video for has_video, _ in checked.values())
         else:
-            # 音频拼接模式需要两个文件都有音频流
-            return file1_has_audio and file2_has_audio
+            # 音频拼接模式需要所有文件都有音频流
+            return all(has_audio for _, has_audio in checked.values())
 
     def run(self):
         try:
             self.progress_signal.emit("开始拼接...")
+            self.progress_signal.emit(f"编码配置: {self.profile.describe()}")
             
+            if len(self.segments) < 2:
+                raise ValueError("至少需要两个片段才能拼接")
+
             # 检查文件是否满足拼接条件
             if not self.check_files():
                 if 'video' in self.concat_type:
-                    raise ValueError("视频拼接模式需要两个包含视频流的MP4文件")
+                    raise ValueError("视频拼接模式需要所有文件都包含视频流")
                 else:
-                    raise ValueError("音频拼接模式需要两个包含音频流的文件")
+                    raise ValueError("音频拼接模式需要所有文件都包含音频流")
             
-            # 视频拼接模式
-            if self.concat_type == 'video':
-                # 加载视频
-                video1 = VideoFileClip(self.file1).subclip(self.start1, self.end1)
-                video2 = VideoFileClip(self.file2).subclip(self.start2, self.end2)
-                
-                # 拼接视频
-                from moviepy.editor import concatenate_videoclips
-                final_clip = concatenate_videoclips([video1, video2])
-                
-                # 生成输出文件��
-                time_range = f"{self.format_time(self.start1)}_{self.format_time(self.end2)}"
-                output_path = os.path.join(os.path.dirname(self.file1), f"拼接_{time_range}.mp4")
-                
-                # 写入文件
-                final_clip.write_videofile(output_path,
-                                         codec='libx264',
-                                         audio_codec='aac',
-                                         temp_audiofile='temp-audio.m4a',
-                                         remove_temp=True)
-                
-                # 清理资源
-                video1.close()
-                video2.close()
-                final_clip.close()
-                
-                self.finished_signal.emit(f"拼接完成: {output_path}")
-                
-            # 纯视频拼接模式（无音频）
-            elif self.concat_type == 'video_only':
-                # 加载视频并移除音频
-                video1 = VideoFileClip(self.file1).subclip(self.start1, self.end1).without_audio()
-                video2 = VideoFileClip(self.file2).subclip(self.start2, self.end2).without_audio()
-                
-                # 拼接视频
-                from moviepy.editor import concatenate_videoclips
-                final_clip = concatenate_videoclips([video1, video2])
-                
-                # 生成输出文件名
-                time_range = f"{self.format_time(self.start1)}_{self.format_time(self.end2)}"
-                output_path = os.path.join(os.path.dirname(self.file1), f"拼接_{time_range}.mp4")
-                
-                # 写入文件（不包含音频）
-                final_clip.write_videofile(output_path,
-                                         codec='libx264',
-                                         audio=False)
-
-                # 清理资源
-                video1.close()
-                video2.close()
-                final_clip.close()
-                
-                self.finished_signal.emit(f"拼接完成: {output_path}")
-                
-            # 音频拼接模式
-            elif 'audio' in self.concat_type:
-                clips = []
-                
-                # 处理第一个文件
-                try:
-                    # 直接使用 AudioFileClip 处理
-                    audio1 = AudioFileClip(self.file1)
-                    clip1 = audio1.subclip(self.start1, self.end1)
-                    clips.append(clip1)
-                except Exception as e:
-                    self.progress_signal.emit(f"处理第一个文件时出错: {str(e)}")
-                    return
-                
-                # 处理第二个文件
-                try:
-                    # 直接使用 AudioFileClip 处理
-                    audio2 = AudioFileClip(self.file2)
-                    clip2 = audio2.subclip(self.start2, self.end2)
-                    clips.append(clip2)
-                except Exception as e:
-                    self.progress_signal.emit(f"处理第二个文件时出错: {str(e)}")
-                    return
-                
-                try:
-                    # 拼接音频
-                    final_clip = concatenate_audioclips(clips)
-                    
-                    # 生成输出文件名
-                    time_range = f"{self.format_time(self.start1)}_{self.format_time(self.end2)}"
-                    output_ext = '.mp3' if self.concat_type == 'audio_mp3' else '.mp4'
-                    output_path = os.path.join(os.path.dirname(self.file1), f"拼接_{time_range}{output_ext}")
-                    
-                    # 保存文件
-                    if output_ext == '.mp3':
-                        final_clip.write_audiofile(output_path,
-                                                 codec='libmp3lame',
-                                                 bitrate='192k')
-                    else:  # .mp4
-                        final_clip.write_audiofile(output_path,
-                                                 codec='aac')
-                    
-                    self.finished_signal.emit(f"拼接完成: {output_path}")
-                    
-                except Exception as e:
-                    self.finished_signal.emit(f"拼接失败: {str(e)}")
-                finally:
-                    # 清理资源
-                    try:
-                        for clip in clips:
-                            clip.close()
-                        if 'final_clip' in locals():
-                            final_clip.close()
-                    except:
-                        pass
+            output_path = self._output_path()
+            infos = [media_probe.probe(file_path) for file_path, _, _ in self.segments]
+            work_dir = tempfile.mkdtemp(prefix='concat_', dir=os.path.dirname(output_path) or None)
+            try:
+                # 编码参数一致时直接复制码流拼接，否则逐个片段重新编码
+                if not self._copy_concat(infos, output_path, work_dir):
+                    self._reencode_concat(infos, output_path, work_dir)
+            finally:
+                shutil.rmtree(work_dir, ignore_errors=True)
+
+            self.finished_signal.emit(f"拼接完成: {output_path}")
             
         except Exception as e:
             self.finished_signal.emit(f"拼接失败: {str(e)}")
+        finally:
+            media_probe.flush()
+
+class ProbeSignals(QObject):
+    """ProbeTask 的信号（QRunnable 本身不能定义信号）"""
+    finished_signal = Signal(object, str, object)  # 标签, 文件路径, 探测结果
+    error_signal = Signal(object, str, str)        # 标签, 文件路径, 错误信息
+
+
+class ProbeTask(QRunnable):
+    """在线程池中探测媒体文件，结果通过信号返回界面线程
+
+    标签由调用方给出并原样返回，用来区分结果对应哪个控件。
+    """
+
+    def __init__(self, file_path, tag=None):
+        super().__init__()
+        self.file_path = file_path
+        self.tag = tag
+        self.signals = ProbeSignals()
+
+    def run(self):
+        try:
+            info = media_probe.probe(self.file_path)
+            has_video, has_audio = media_probe.stream_flags(self.file_path)
+            result = {'info': info, 'has_video': has_video, 'has_audio': has_audio}
+        except Exception as e:
+            self.signals.error_signal.emit(self.tag, self.file_path, str(e))
+            return
+        self.signals.finished_signal.emit(self.tag, self.file_path, result)
+
+        # 顺便建立关键帧索引，之后剪辑时对齐关键帧和定位不再扫描文件
+        if has_video:
+            try:
+                keyframe_index.get(self.file_path)
+            except (OSError, ValueError):
+                pass
+
 
 class MainWindow(QMainWindow):
     def __init__(self):
@@ -492,6 +4233,28 @@ class MainWindow(QMainWindow):
         # 初始化所有控件
         self.url_input = QLineEdit()
         self.url_input.setPlaceholderText("请输入B站视频链接...")
+
+        self.pages_input = QLineEdit()
+        self.pages_input.setPlaceholderText("分P（如 1-3,5；all 为全部；留空下载链接指定的P）")
+
+        # DASH 流选择策略（单个下载和批量下载共用）
+        self.quality_combo = QComboBox()
+        self.quality_combo.addItem("最高画质", 0)
+        for quality in (120, 116, 112, 80, 64, 32, 16):
+            self.quality_combo.addItem(VIDEO_QUALITIES[quality], quality)
+
+        self.codec_combo = QComboBox()
+        self.codec_combo.addItem("AVC 优先（兼容性好）", 'avc')
+        self.codec_combo.addItem("HEVC 优先", 'hevc')
+        self.codec_combo.addItem("AV1 优先", 'av1')
+        self.codec_combo.addItem("同画质最小体积", 'size')
+
+        self.max_bitrate_spin = QSpinBox()
+        self.max_bitrate_spin.setRange(0, 100000)
+        self.max_bitrate_spin.setSingleStep(500)
+        self.max_bitrate_spin.setSuffix(" kbps")
+        self.max_bitrate_spin.setSpecialValueText("不限码率")
+        self.max_bitrate_spin.setToolTip("视频流和音频流的码率上限，0 为不限")
         
         # 下载按钮
         self.download_mp3_btn = QPushButton("下载MP3音频")
@@ -510,6 +4273,48 @@ class MainWindow(QMainWindow):
         self.open_folder_btn = QPushButton("打开下载文件夹")
         self.open_folder_btn.clicked.connect(self.open_download_folder)
         self.open_folder_btn.setEnabled(False)
+
+        # 只下载片段：按剪辑区间下载需要的分片后直接剪辑
+        self.range_start_time = QTimeEdit()
+        self.range_start_time.setDisplayFormat("HH:mm:ss.zzz")
+        self.range_end_time = QTimeEdit()
+        self.range_end_time.setDisplayFormat("HH:mm:ss.zzz")
+
+        self.download_range_btn = QPushButton("下载音视频片段")
+        self.download_range_btn.clicked.connect(lambda: self.start_range_download('full_mp4'))
+        self.download_range_audio_btn = QPushButton("下载音频片段")
+        self.download_range_audio_btn.clicked.connect(
+            lambda: self.start_range_download('mp4audio'))
+
+        # 批量下载控件
+        self.batch_input = QPlainTextEdit()
+        self.batch_input.setPlaceholderText("批量下载：每行一个BV号或视频链接，# 开头的行会被忽略")
+        self.batch_input.setMaximumHeight(100)
+
+        self.batch_import_btn = QPushButton("从文件导入")
+        self.batch_import_btn.clicked.connect(self.import_batch_file)
+
+        self.batch_type_combo = QComboBox()
+        self.batch_type_combo.addItem("MP3音频", 'mp3')
+        self.batch_type_combo.addItem("MP4音频", 'mp4audio')
+        self.batch_type_combo.addItem("MP4视频", 'mp4')
+        self.batch_type_combo.addItem("MP4音视频", 'full_mp4')
+
+        self.batch_concurrency_spin = QSpinBox()
+        self.batch_concurrency_spin.setRange(1, 16)
+        self.batch_concurrency_spin.setValue(3)
+        self.batch_concurrency_spin.setToolTip("同时下载的视频数量")
+
+        self.batch_start_btn = QPushButton("开始批量下载")
+        self.batch_start_btn.clicked.connect(self.start_batch_download)
+
+        self.batch_cancel_btn = QPushButton("取消批量下载")
+        self.batch_cancel_btn.setEnabled(False)
+        self.batch_cancel_btn.clicked.connect(self.cancel_batch_download)
+
+        self.batch_status_list = QListWidget()
+        self.batch_status_list.setMaximumHeight(120)
+        self.batch_worker = None
         
         # 进度条和状态标签
         self.progress_bar = QProgressBar()
@@ -519,6 +4324,9 @@ class MainWindow(QMainWindow):
         self.status_label.setObjectName("statusLabel")  # 设置对象名，用于CSS样式
         self.status_label.setMinimumHeight(80)  # 设置最小高度
         self.status_label.setAlignment(Qt.AlignCenter)  # 文字居中
+        # 下载速度、剩余时间
+        self.speed_label = QLabel()
+        self.speed_label.setAlignment(Qt.AlignCenter)
         self.status_label.setWordWrap(True)  # 允许文字换行
         
         # 添加样式
@@ -543,9 +4351,9 @@ class MainWindow(QMainWindow):
         self.select_file_btn.clicked.connect(self.select_file)
         
         self.start_time = QTimeEdit()
-        self.start_time.setDisplayFormat("HH:mm:ss")
+        self.start_time.setDisplayFormat("HH:mm:ss.zzz")
         self.end_time = QTimeEdit()
-        self.end_time.setDisplayFormat("HH:mm:ss")
+        self.end_time.setDisplayFormat("HH:mm:ss.zzz")
         
         self.convert_mp3_to_mp4_btn = QPushButton("MP3 To MP4")
         self.convert_mp3_to_mp4_btn.clicked.connect(self.convert_mp3_to_mp4)
@@ -555,6 +4363,37 @@ class MainWindow(QMainWindow):
         self.clip_video_btn = QPushButton("剪辑视频")
         self.clip_video_btn.clicked.connect(lambda: self.start_clip(False))
         
+        self.clip_mode_combo = QComboBox()
+        self.clip_mode_combo.addItem("精确剪辑", 'precise')
+        self.clip_mode_combo.addItem("智能剪辑(帧精确)", 'smart')
+        self.clip_mode_combo.addItem("快速剪辑(无损)", 'fast')
+        self.clip_mode_combo.setToolTip("精确剪辑：全部重新编码\n"
+                                        "智能剪辑：只重新编码剪切点附近的画面，其余直接复制\n"
+                                        "快速剪辑：起止时间对齐到关键帧，直接复制不重新编码")
+
+        # 编码配置：剪辑、拼接和下载中所有需要重新编码的地方共用，选择保存在 config.json 中
+        self.encoding_profile_combo = QComboBox()
+        for name in encoding_profiles.names():
+            self.encoding_profile_combo.addItem(name, name)
+        self.encoding_profile_combo.setCurrentText(encoding_profiles.current().name)
+        self.encoding_profile_combo.setToolTip(
+            "重新编码时使用的编码配置（可在 config.json 中修改或添加）:\n"
+            + "\n".join(encoding_profiles.get(name).describe()
+                        for name in encoding_profiles.names()))
+        self.encoding_profile_combo.currentIndexChanged.connect(self.select_encoding_profile)
+        config_errors = encoding_profiles.errors()
+        if config_errors:
+            self.status_label.setText("\n".join(config_errors))
+
+        # 剪辑列表：不为空时一次剪出列表中的所有片段
+        self.cue_list_input = QPlainTextEdit()
+        self.cue_list_input.setPlaceholderText(
+            "剪辑列表（可选）：每行一个片段，格式为 开始时间 结束时间 名称，"
+            "如 00:01:05.5 00:01:20 精彩1；不为空时按列表剪辑，源文件只读取一次")
+        self.cue_list_input.setMaximumHeight(100)
+        self.import_cue_list_btn = QPushButton("导入剪辑列表")
+        self.import_cue_list_btn.clicked.connect(self.import_cue_file)
+
         # 剪辑部分布局
         clip_file_layout = QHBoxLayout()
         clip_file_layout.addWidget(self.file_path_input)
@@ -565,6 +4404,9 @@ class MainWindow(QMainWindow):
         time_layout.addWidget(self.start_time)
         time_layout.addWidget(QLabel("结束时间:"))
         time_layout.addWidget(self.end_time)
+        time_layout.addWidget(self.clip_mode_combo)
+        time_layout.addWidget(QLabel("编码配置:"))
+        time_layout.addWidget(self.encoding_profile_combo)
         time_layout.addWidget(self.convert_mp3_to_mp4_btn)
         time_layout.addWidget(self.clip_audio_btn)
         time_layout.addWidget(self.clip_video_btn)
@@ -585,15 +4427,37 @@ class MainWindow(QMainWindow):
         self.select_concat_file2_btn.clicked.connect(lambda: self.select_concat_file(2))
         
         self.concat_start_time1 = QTimeEdit()
-        self.concat_start_time1.setDisplayFormat("HH:mm:ss")
+        self.concat_start_time1.setDisplayFormat("HH:mm:ss.zzz")
         self.concat_end_time1 = QTimeEdit()
-        self.concat_end_time1.setDisplayFormat("HH:mm:ss")
+        self.concat_end_time1.setDisplayFormat("HH:mm:ss.zzz")
         
         self.concat_start_time2 = QTimeEdit()
-        self.concat_start_time2.setDisplayFormat("HH:mm:ss")
+        self.concat_start_time2.setDisplayFormat("HH:mm:ss.zzz")
         self.concat_end_time2 = QTimeEdit()
-        self.concat_end_time2.setDisplayFormat("HH:mm:ss")
+        self.concat_end_time2.setDisplayFormat("HH:mm:ss.zzz")
         
+        # 拼接列表（多个片段按顺序拼接）
+        self.concat_list = QListWidget()
+        self.concat_list.setMinimumHeight(100)
+
+        self.add_concat_segment_btn = QPushButton("文件1片段加入列表")
+        self.add_concat_segment_btn.clicked.connect(self.add_concat_segment)
+
+        self.add_concat_files_btn = QPushButton("批量添加文件")
+        self.add_concat_files_btn.clicked.connect(self.add_concat_files)
+
+        self.remove_concat_segment_btn = QPushButton("移除选中")
+        self.remove_concat_segment_btn.clicked.connect(self.remove_concat_segment)
+
+        self.clear_concat_list_btn = QPushButton("清空列表")
+        self.clear_concat_list_btn.clicked.connect(self.clear_concat_list)
+
+        concat_list_buttons_layout = QHBoxLayout()
+        concat_list_buttons_layout.addWidget(self.add_concat_segment_btn)
+        concat_list_buttons_layout.addWidget(self.add_concat_files_btn)
+        concat_list_buttons_layout.addWidget(self.remove_concat_segment_btn)
+        concat_list_buttons_layout.addWidget(self.clear_concat_list_btn)
+
         # 拼接按钮布局
         concat_buttons_layout = QHBoxLayout()
 
@@ -616,12 +4480,7 @@ class MainWindow(QMainWindow):
         concat_buttons_layout.addStretch()
 
         # 加载样式表
-        if getattr(sys, 'frozen', False):
-            current_dir = os.path.dirname(sys.executable)
-        else:
-            current_dir = os.path.dirname(os.path.abspath(__file__))
-        
-        style_path = os.path.join(current_dir, 'style.qss')
+        style_path = os.path.join(get_app_dir(), 'style.qss')
         try:
             with open(style_path, 'r', encoding='utf-8') as f:
                 style = f.read()
@@ -656,6 +4515,31 @@ class MainWindow(QMainWindow):
         download_button_layout.addWidget(self.download_mp4_btn)
         download_button_layout.addWidget(self.download_full_mp4_btn)
         download_button_layout.addWidget(self.open_folder_btn)
+
+        range_layout = QHBoxLayout()
+        range_layout.addWidget(QLabel("片段开始:"))
+        range_layout.addWidget(self.range_start_time)
+        range_layout.addWidget(QLabel("片段结束:"))
+        range_layout.addWidget(self.range_end_time)
+        range_layout.addWidget(self.download_range_btn)
+        range_layout.addWidget(self.download_range_audio_btn)
+
+        stream_policy_layout = QHBoxLayout()
+        stream_policy_layout.addWidget(QLabel("画质:"))
+        stream_policy_layout.addWidget(self.quality_combo)
+        stream_policy_layout.addWidget(QLabel("编码:"))
+        stream_policy_layout.addWidget(self.codec_combo)
+        stream_policy_layout.addWidget(QLabel("码率上限:"))
+        stream_policy_layout.addWidget(self.max_bitrate_spin)
+
+        batch_button_layout = QHBoxLayout()
+        batch_button_layout.addWidget(self.batch_import_btn)
+        batch_button_layout.addWidget(QLabel("下载类型:"))
+        batch_button_layout.addWidget(self.batch_type_combo)
+        batch_button_layout.addWidget(QLabel("并发数:"))
+        batch_button_layout.addWidget(self.batch_concurrency_spin)
+        batch_button_layout.addWidget(self.batch_start_btn)
+        batch_button_layout.addWidget(self.batch_cancel_btn)
         
         # 剪辑部分布局
         clip_file_layout = QHBoxLayout()
@@ -667,6 +4551,9 @@ class MainWindow(QMainWindow):
         time_layout.addWidget(self.start_time)
         time_layout.addWidget(QLabel("结束时间:"))
         time_layout.addWidget(self.end_time)
+        time_layout.addWidget(self.clip_mode_combo)
+        time_layout.addWidget(QLabel("编码配置:"))
+        time_layout.addWidget(self.encoding_profile_combo)
         time_layout.addWidget(self.convert_mp3_to_mp4_btn)
         time_layout.addWidget(self.clip_audio_btn)
         time_layout.addWidget(self.clip_video_btn)
@@ -696,8 +4583,16 @@ class MainWindow(QMainWindow):
         # 1. 下载部分
         content_layout.addWidget(QLabel("视频链接:"))
         content_layout.addWidget(self.url_input)
+        content_layout.addWidget(self.pages_input)
+        content_layout.addLayout(stream_policy_layout)
         content_layout.addLayout(download_button_layout)
+        content_layout.addLayout(range_layout)
+        content_layout.addWidget(QLabel("批量下载:"))
+        content_layout.addWidget(self.batch_input)
+        content_layout.addLayout(batch_button_layout)
+        content_layout.addWidget(self.batch_status_list)
         content_layout.addWidget(self.progress_bar)
+        content_layout.addWidget(self.speed_label)
         content_layout.addWidget(self.status_label)
 
         # 添加分隔线
@@ -710,6 +4605,10 @@ class MainWindow(QMainWindow):
         content_layout.addWidget(QLabel("剪辑文件:"))
         content_layout.addLayout(clip_file_layout)
         content_layout.addLayout(time_layout)
+        cue_layout = QHBoxLayout()
+        cue_layout.addWidget(self.cue_list_input)
+        cue_layout.addWidget(self.import_cue_list_btn)
+        content_layout.addLayout(cue_layout)
 
         # 添加分隔线
         line2 = QFrame()
@@ -723,6 +4622,9 @@ class MainWindow(QMainWindow):
         content_layout.addLayout(time1_layout)
         content_layout.addLayout(concat_file2_layout)
         content_layout.addLayout(time2_layout)
+        content_layout.addWidget(QLabel("拼接列表（列表不为空时按列表顺序拼接所有片段）:"))
+        content_layout.addWidget(self.concat_list)
+        content_layout.addLayout(concat_list_buttons_layout)
         content_layout.addLayout(concat_buttons_layout)
 
         # 设置滚动区域的内容
@@ -736,6 +4638,13 @@ class MainWindow(QMainWindow):
         self.active_workers = []
         self.is_closing = False
 
+        # 文件探测在线程池中进行，避免大文件或网络路径卡住界面
+        self.probe_pool = QThreadPool(self)
+        self.probe_pool.setMaxThreadCount(4)
+        self.probe_tasks = set()
+        self.probe_results = {}
+        self.next_segment_token = 0
+
     def select_file(self):
         file_path, _ = QFileDialog.getOpenFileName(
             self,
@@ -745,74 +4654,92 @@ class MainWindow(QMainWindow):
         )
         if file_path:
             self.file_path_input.setText(file_path)
-            try:
-                duration = None
-                if file_path.lower().endswith('.mp4'):
-                    # 先尝试作为音频文件打开
-                    try:
-                        audio = AudioFileClip(file_path)
-                        duration = int(audio.duration)
-                        audio.close()
-                        has_audio = True
-                    except:
-                        has_audio = False
-
-                    # 再尝试作为视频文件打开
-                    try:
-                        video = VideoFileClip(file_path)
-                        if duration is None:
-                            duration = int(video.duration)
-                        has_video = video.size[0] > 0 and video.size[1] > 0
-                        # 如果之前没检测到音频，再次检查视频文件的音频
-                        if not has_audio:
-                            has_audio = video.audio is not None
-                        video.close()
-                    except:
-                        has_video = False
-                        if not has_audio:
-                            self.status_label.setText("无法取文件：既不是有效的频也不是有效的音频")
-                            return
-
-                    # 根据文件包含的流类型启用相应按钮
-                    if has_video:
-                        self.clip_video_btn.setEnabled(True)
-                        if has_audio:
-                            self.clip_audio_btn.setEnabled(True)
-                            self.status_label.setText("MP4文件（音视频）加载成功")
-                        else:
-                            self.clip_audio_btn.setEnabled(False)
-                            self.status_label.setText("MP4文件（仅视频）加载成功")
-                    else:
-                        self.clip_video_btn.setEnabled(False)
-                        if has_audio:
-                            self.clip_audio_btn.setEnabled(True)
-                            self.status_label.setText("MP4文件（仅音频）加载成功")
-                        else:
-                            self.clip_audio_btn.setEnabled(False)
-                            self.status_label.setText("无效的MP4文件")
-                            return
-
-                else:  # MP3文件
-                    try:
-                        audio = AudioFileClip(file_path)
-                        duration = int(audio.duration)
-                        audio.close()
-                        self.clip_audio_btn.setEnabled(True)
-                        self.clip_video_btn.setEnabled(False)
-                        self.status_label.setText("音频文件加载成功")
-                    except Exception as e:
-                        self.status_label.setText(f"读取音频文件失败: {str(e)}")
-                        return
-
-                # 设置结束时间
-                if duration is not None:
-                    hours = duration // 3600
-                    minutes = (duration % 3600) // 60
-                    seconds = duration % 60
-                    self.end_time.setTime(QTime(hours, minutes, seconds))
-                
-            except Exception as e:
-                self.status_label.setText(f"读取文件失败: {str(e)}")
+            self.clip_audio_btn.setEnabled(False)
+            self.clip_video_btn.setEnabled(False)
+            self.status_label.setText("正在读取文件信息...")
+            self.probe_file(file_path, ('clip',))
+
+    def probe_file(self, file_path, tag):
+        """在线程池中探测文件，完成后由 _probe_finished/_probe_failed 按标签分发"""
+        task = ProbeTask(file_path, tag)
+        task.setAutoDelete(False)
+        task.signals.finished_signal.connect(self._probe_finished)
+        task.signals.error_signal.connect(self._probe_failed)
+        self.probe_tasks.add(task)
+        self.probe_pool.start(task)
+
+    def _release_probe_task(self):
+        """释放已经返回结果的探测任务"""
+        sender = self.sender()
+        for task in list(self.probe_tasks):
+            if task.signals is sender:
+                self.probe_tasks.discard(task)
+
+    def _probe_finished(self, tag, file_path, result):
+        """探测结果回到界面线程后更新对应控件"""
+        self._release_probe_task()
+        self.probe_results[file_path] = result
+        if self.is_closing:
+            return
+        if tag[0] == 'clip':
+            # 用户可能已经选择了其他文件，过期的结果直接丢弃
+            if file_path == self.file_path_input.text():
+                self._apply_clip_probe(file_path, result)
+        elif tag[0] == 'concat':
+            self._apply_concat_probe(tag[1], file_path, result)
+        elif tag[0] == 'segment':
+            self._fill_concat_segment(tag, file_path, result)
+
+    def _probe_failed(self, tag, file_path, message):
+        """探测失败时在状态栏提示，拼接列表中移除对应的占位片段"""
+        self._release_probe_task()
+        self.probe_results.pop(file_path, None)
+        if self.is_closing:
+            return
+        if tag[0] == 'clip' and file_path != self.file_path_input.text():
+            return
+        if tag[0] == 'segment':
+            item = self._find_concat_segment(tag[1])
+            if item is not None:
+                self.concat_list.takeItem(self.concat_list.row(item))
+            self._update_concat_buttons()
+        self.status_label.setText(f"读取文件失败: {message}")
+
+    def _apply_clip_probe(self, file_path, result):
+        """根据探测结果设置剪辑按钮和结束时间"""
+        duration = result['info']['duration']
+        has_video, has_audio = result['has_video'], result['has_audio']
+        if file_path.lower().endswith('.mp4'):
+            # 根据文件包含的流类型启用相应按钮
+            if has_video:
+                self.clip_video_btn.setEnabled(True)
+                if has_audio:
+                    self.clip_audio_btn.setEnabled(True)
+                    self.status_label.setText("MP4文件（音视频）加载成功")
+                else:
+                    self.clip_audio_btn.setEnabled(False)
+                    self.status_label.setText("MP4文件（仅视频）加载成功")
+            else:
+                self.clip_video_btn.setEnabled(False)
+                if has_audio:
+                    self.clip_audio_btn.setEnabled(True)
+                    self.status_label.setText("MP4文件（仅音频）加载成功")
+                else:
+                    self.clip_audio_btn.setEnabled(False)
+                    self.status_label.setText("无效的MP4文件")
+                    return
+
+        else:  # MP3文件
+            if not has_audio:
+                self.status_label.setText("读取音频文件失败: 文件不包含音频流")
+                return
+            self.clip_audio_btn.setEnabled(True)
+            self.clip_video_btn.setEnabled(False)
+            self.status_label.setText("音频文件加载成功")
+
+        # 设置结束时间
+        if duration is not None:
+            self.end_time.setTime(seconds_to_qtime(duration))
 
     def start_clip(self, audio_only=False):
         file_path = self.file_path_input.text()
@@ -823,17 +4750,30 @@ class MainWindow(QMainWindow):
         # 获取时间值（转换为秒）
         start = self.start_time.time()
         end = self.end_time.time()
-        start_seconds = start.hour() * 3600 + start.minute() * 60 + start.second()
-        end_seconds = end.hour() * 3600 + end.minute() * 60 + end.second()
+        start_seconds = qtime_to_seconds(start)
+        end_seconds = qtime_to_seconds(end)
+
+        # 剪辑列表不为空时按列表剪辑，忽略上面的起止时间
+        try:
+            cues = parse_cue_list(self.cue_list_input.toPlainText())
+        except ValueError as e:
+            self.status_label.setText(str(e))
+            return
         
-        if start_seconds >= end_seconds:
+        if not cues and start_seconds >= end_seconds:
             self.status_label.setText("开始时间必须小于结束时间！")
             return
         
+        # 流信息在选择文件时已经在后台读取，这里直接使用结果
+        result = self.probe_results.get(file_path)
+        if result is None and file_path.lower().endswith('.mp4'):
+            self.status_label.setText("正在读取文件信息，请稍候...")
+            self.probe_file(file_path, ('clip',))
+            return
+
         # 如果是音频剪辑且文件是MP4，检查是否包含音频流
         if audio_only and file_path.lower().endswith('.mp4'):
-            worker = ClipWorker(file_path, 0, 0, True)
-            has_video, has_audio = worker.has_video_stream(file_path)
+            has_audio = result['has_audio']
             
             if has_audio:
                 # 有音频流，让用户选择输出格式
@@ -869,7 +4809,9 @@ class MainWindow(QMainWindow):
                 self.clip_video_btn.setEnabled(False)
                 
                 # 创建worker并设置正确的输出格式
-                worker = ClipWorker(file_path, start_seconds, end_seconds, True)
+                worker = ClipWorker(file_path, start_seconds, end_seconds, True,
+                                    mode=self.clip_mode_combo.currentData(), cues=cues,
+                                    profile=self.encoding_profile())
                 worker.save_as_mp4_audio = (clicked_button == mp4_btn)  # 根据用户选择设置输出格式
                 worker.progress_signal.connect(self.update_status)
                 worker.finished_signal.connect(lambda msg: self.task_finished(worker, msg))
@@ -884,8 +4826,7 @@ class MainWindow(QMainWindow):
         
         # 如果是视频剪辑且文件是MP4，检查是否包含音频流
         elif not audio_only and file_path.lower().endswith('.mp4'):
-            worker = ClipWorker(file_path, 0, 0, True)
-            has_video, has_audio = worker.has_video_stream(file_path)
+            has_video, has_audio = result['has_video'], result['has_audio']
             
             if has_video and has_audio:
                 # 有视频和音频流，让用户选择输出格式
@@ -921,7 +4862,9 @@ class MainWindow(QMainWindow):
                 self.clip_video_btn.setEnabled(False)
                 
                 # 创建worker并设置正确的输出格式
-                worker = ClipWorker(file_path, start_seconds, end_seconds, False)
+                worker = ClipWorker(file_path, start_seconds, end_seconds, False,
+                                    mode=self.clip_mode_combo.currentData(), cues=cues,
+                                    profile=self.encoding_profile())
                 worker.video_only = (clicked_button == video_btn)  # 根据用户选择设置是否只保留视频
                 worker.progress_signal.connect(self.update_status)
                 worker.finished_signal.connect(lambda msg: self.task_finished(worker, msg))
@@ -935,19 +4878,40 @@ class MainWindow(QMainWindow):
         self.clip_video_btn.setEnabled(False)
         
         # 开始剪辑
-        worker = ClipWorker(file_path, start_seconds, end_seconds, audio_only)
+        worker = ClipWorker(file_path, start_seconds, end_seconds, audio_only,
+                            mode=self.clip_mode_combo.currentData(), cues=cues,
+                            profile=self.encoding_profile())
         worker.progress_signal.connect(self.update_status)
         worker.finished_signal.connect(lambda msg: self.task_finished(worker, msg))
         
         self.active_workers.append(worker)
         worker.start()
 
+    def import_cue_file(self):
+        """从文本/CSV、JSON 或章节文件导入剪辑列表"""
+        file_path, _ = QFileDialog.getOpenFileName(
+            self,
+            "选择剪辑列表",
+            "",
+            "剪辑列表 (*.txt *.csv *.json *.ini *.meta);;所有文件 (*)"
+        )
+        if file_path:
+            try:
+                cues = load_cue_file(file_path)
+            except (OSError, ValueError, KeyError, TypeError) as e:
+                self.status_label.setText(f"读取剪辑列表失败: {str(e)}")
+                return
+            self.cue_list_input.setPlainText('\n'.join(
+                f"{format_time_text(start)} {format_time_text(end)} {name}".rstrip()
+                for start, end, name in cues))
+            self.status_label.setText(f"已导入 {len(cues)} 个片段")
+
     def task_finished(self, worker, message):
         """统一处理任务完成事件"""
         if worker in self.active_workers:
             self.active_workers.remove(worker)
         
-        if isinstance(worker, DownloadWorker):
+        if isinstance(worker, DownloadTask):
             self.download_finished(message)
         else:
             self.clip_finished(message)
@@ -956,35 +4920,163 @@ class MainWindow(QMainWindow):
         if self.is_closing and not self.active_workers:
             self.close()
 
+    def stream_policy(self):
+        """根据界面上的选项生成 DASH 流选择策略"""
+        codec = self.codec_combo.currentData()
+        return StreamPolicy(max_quality=self.quality_combo.currentData(),
+                            codec='avc' if codec == 'size' else codec,
+                            max_bitrate=self.max_bitrate_spin.value(),
+                            prefer_size=codec == 'size')
+
+    def encoding_profile(self):
+        """界面上选中的编码配置"""
+        return encoding_profiles.get(self.encoding_profile_combo.currentData())
+
+    def select_encoding_profile(self):
+        """记住选中的编码配置，下次启动和命令行批量下载默认使用"""
+        try:
+            encoding_profiles.select(self.encoding_profile_combo.currentData())
+        except (OSError, ValueError) as e:
+            self.status_label.setText(f"编码配置已切换，但保存失败: {str(e)}")
+
     def start_download(self, download_type):
         url = self.url_input.text().strip()
         if not url:
             self.status_label.setText("请输入视频链接！")
             return
         
+        worker = DownloadTask(url, download_type, pages=self.pages_input.text().strip() or None,
+                              policy=self.stream_policy(), profile=self.encoding_profile(),
+                              parent=self)
+        self._run_download(worker)
+
+    def start_range_download(self, download_type):
+        """只下载链接中视频的一段并按剪辑模式剪辑"""
+        url = self.url_input.text().strip()
+        if not url:
+            self.status_label.setText("请输入视频链接！")
+            return
+
+        start_seconds = qtime_to_seconds(self.range_start_time.time())
+        end_seconds = qtime_to_seconds(self.range_end_time.time())
+        if start_seconds >= end_seconds:
+            self.status_label.setText("开始时间必须小于结束时间！")
+            return
+
+        worker = RangeDownloadTask(url, start_seconds, end_seconds, download_type,
+                                   clip_mode=self.clip_mode_combo.currentData(),
+                                   policy=self.stream_policy(), profile=self.encoding_profile(),
+                                   parent=self)
+        self._run_download(worker)
+
+    def _run_download(self, worker):
+        """禁用下载按钮，连接信号后开始下载任务"""
         self.progress_bar.setValue(0)
+        self.speed_label.clear()
         
         # 禁用所有下按钮
         self.download_mp3_btn.setEnabled(False)
         self.download_mp4_btn.setEnabled(False)
         self.download_m4a_btn.setEnabled(False)
         self.download_full_mp4_btn.setEnabled(False)
+        self.download_range_btn.setEnabled(False)
+        self.download_range_audio_btn.setEnabled(False)
         self.open_folder_btn.setEnabled(False)
         
-        worker = DownloadWorker(url, download_type)
         worker.progress_signal.connect(self.update_status)
         worker.progress_value.connect(self.update_progress)
+        worker.telemetry_signal.connect(self.update_telemetry)
         worker.finished_signal.connect(lambda msg: self.task_finished(worker, msg))
         
         self.active_workers.append(worker)
         worker.start()
 
+    def import_batch_file(self):
+        """从文本文件导入批量下载列表"""
+        file_path, _ = QFileDialog.getOpenFileName(
+            self,
+            "选择下载列表",
+            "",
+            "文本文件 (*.txt);;所有文件 (*)"
+        )
+        if file_path:
+            try:
+                with open(file_path, 'r', encoding='utf-8') as f:
+                    self.batch_input.setPlainText(f.read())
+            except Exception as e:
+                self.status_label.setText(f"读取下载列表失败: {str(e)}")
+
+    def start_batch_download(self):
+        bvids = parse_batch_input(self.batch_input.toPlainText())
+        if not bvids:
+            self.status_label.setText("批量下载列表中没有找到BV号！")
+            return
+
+        self.batch_status_list.clear()
+        for bvid in bvids:
+            self.batch_status_list.addItem(f"{bvid}: 排队中")
+
+        self.batch_start_btn.setEnabled(False)
+        self.batch_cancel_btn.setEnabled(True)
+        self.progress_bar.setValue(0)
+        self.speed_label.clear()
+
+        worker = BatchDownloadTask(bvids, self.batch_type_combo.currentData(),
+                                   concurrency=self.batch_concurrency_spin.value(),
+                                   pages=self.pages_input.text().strip() or None,
+                                   policy=self.stream_policy(), profile=self.encoding_profile(),
+                                   parent=self)
+        worker.progress_signal.connect(self.update_status)
+        worker.progress_value.connect(self.update_progress)
+        worker.item_status_signal.connect(self.update_batch_item)
+        worker.telemetry_signal.connect(self.update_telemetry)
+        worker.finished_signal.connect(lambda msg: self.batch_finished(worker, msg))
+        self.batch_worker = worker
+        self.active_workers.append(worker)
+        worker.start()
+
+    def update_batch_item(self, index, message):
+        """更新批量下载列表中单个条目的状态"""
+        item = self.batch_status_list.item(index)
+        if item is not None:
+            bvid = item.text().split(':', 1)[0]
+            item.setText(f"{bvid}: {message}")
+
+    def cancel_batch_download(self):
+        if self.batch_worker is not None:
+            self.batch_worker.cancel()
+            self.batch_cancel_btn.setEnabled(False)
+            self.status_label.setText("正在取消批量下载...")
+
+    def batch_finished(self, worker, message):
+        if worker in self.active_workers:
+            self.active_workers.remove(worker)
+        self.batch_worker = None
+
+        if not self.is_closing:
+            stats = metadata_cache.stats()
+            self.status_label.setText(
+                f"{message}\n元数据缓存: 命中 {stats['hits']}，未命中 {stats['misses']}")
+            self.batch_start_btn.setEnabled(True)
+            self.batch_cancel_btn.setEnabled(False)
+            if worker.succeeded:
+                self.open_folder_btn.setEnabled(True)
+                self.last_download_path = os.path.join(get_app_dir(), 'downloads')
+
+        if self.is_closing and not self.active_workers:
+            self.close()
+
     def update_status(self, message):
         self.status_label.setText(message)
 
     def update_progress(self, value):
         self.progress_bar.setValue(value)
 
+    def update_telemetry(self, snapshot):
+        """显示下载速度和剩余时间"""
+        if not self.is_closing:
+            self.speed_label.setText(format_telemetry(snapshot))
+
     def download_finished(self, message):
         """下载完成处理"""
         if not self.is_closing:
@@ -994,6 +5086,8 @@ class MainWindow(QMainWindow):
             self.download_mp4_btn.setEnabled(True)
             self.download_m4a_btn.setEnabled(True)
             self.download_full_mp4_btn.setEnabled(True)
+            self.download_range_btn.setEnabled(True)
+            self.download_range_audio_btn.setEnabled(True)
             
             if "载完成" in message:
                 self.progress_bar.setValue(100)
@@ -1033,9 +5127,8 @@ class MainWindow(QMainWindow):
                 self.terminate_all_tasks()
                 event.accept()
             elif reply == QMessageBox.No:
-                # 等任务完成
-                self.wait_for_tasks()
-                event.accept()
+                # 等任务完成：每个任务结束时都会检查 is_closing，最后一个结束后关闭窗口
+                event.ignore()
             else:
                 # 取消关
                 self.is_closing = False
@@ -1047,24 +5140,22 @@ class MainWindow(QMainWindow):
         """终止所有活动任务"""
         for worker in self.active_workers:
             try:
-                if isinstance(worker, ClipWorker):
-                    # 对于剪辑任务，需要确保文件被正确关闭
-                    if hasattr(worker, 'media'):
-                        worker.media.close()
-                    if hasattr(worker, 'clip'):
-                        worker.clip.close()
+                if isinstance(worker, (ClipWorker, ConcatWorker)):
+                    # 结束 ffmpeg 子进程并关闭打开的文件，run() 随后自行返回；
+                    # 直接 terminate() 线程会留下孤儿 ffmpeg 进程
+                    worker.cancel()
+                    if worker.wait(5000):
+                        continue
+                elif isinstance(worker, (DownloadTask, BatchDownloadTask)):
+                    # 下载任务是事件循环中的协程，取消后由 main() 在退出前等待其保存断点续传日志
+                    worker.cancel()
+                    continue
                 worker.terminate()
                 worker.wait()
             except Exception as e:
                 print(f"终止任务时出错: {str(e)}")
         self.active_workers.clear()
 
-    def wait_for_tasks(self):
-        """等待所有务完成"""
-        for worker in self.active_workers:
-            worker.wait()
-        self.active_workers.clear()
-
     def select_concat_file(self, file_num):
         file_path, _ = QFileDialog.getOpenFileName(
             self,
@@ -1073,105 +5164,165 @@ class MainWindow(QMainWindow):
             "音频文件 (*.mp3 *.MP3 *.mp4 *.MP4)"
         )
         if file_path:
-            try:
-                duration = None
-                has_audio = False
-                has_video = False
+            # 先记下路径，时长在后台探测完成后再填入
+            if file_num == 1:
+                self.concat_file1_input.setText(file_path)
+            else:
+                self.concat_file2_input.setText(file_path)
+            self._update_concat_buttons()
+            self.status_label.setText("正在读取文件信息...")
+            self.probe_file(file_path, ('concat', file_num))
 
-                if file_path.lower().endswith('.mp4'):
-                    # 先尝试作为音频文件打开
-                    try:
-                        audio = AudioFileClip(file_path)
-                        duration = int(audio.duration)
-                        audio.close()
-                        has_audio = True
-                    except:
-                        pass
+    def _apply_concat_probe(self, file_num, file_path, result):
+        """根据探测结果设置拼接文件的结束时间"""
+        file_input = self.concat_file1_input if file_num == 1 else self.concat_file2_input
+        if file_path != file_input.text():
+            return
+        if not result['has_video'] and not result['has_audio']:
+            self.status_label.setText("无法读取文件：既不是有效的视频也不是有效的音频")
+            return
 
-                    # 再尝试作为视频文件打开
-                    try:
-                        video = VideoFileClip(file_path)
-                        if duration is None:
-                            duration = int(video.duration)
-                        has_video = video.size[0] > 0 and video.size[1] > 0
-                        # 如果之前没检测到音频，再次检查视频文件的音频
-                        if not has_audio:
-                            has_audio = video.audio is not None
-                        video.close()
-                    except:
-                        if not has_audio:
-                            self.status_label.setText("无法读取文件：既不是有效的视频也不是有效的音频")
-                            return
-                else:  # MP3文件
-                    try:
-                        audio = AudioFileClip(file_path)
-                        duration = int(audio.duration)
-                        audio.close()
-                        has_audio = True
-                    except Exception as e:
-                        self.status_label.setText(f"读取音频文件失败: {str(e)}")
-                        return
-
-                # 设文件路径和时长
-                if file_num == 1:
-                    self.concat_file1_input.setText(file_path)
-                    self.concat_end_time1.setTime(QTime(duration // 3600, (duration % 3600) // 60, duration % 60))
-                else:
-                    self.concat_file2_input.setText(file_path)
-                    self.concat_end_time2.setTime(QTime(duration // 3600, (duration % 3600) // 60, duration % 60))
-
-                # 如果两个文件都已选择，根据文件类型启用相应按钮
-                if self.concat_file1_input.text() and self.concat_file2_input.text():
-                    file1_is_video = self.concat_file1_input.text().lower().endswith('.mp4') and \
-                                    self._check_file_has_video(self.concat_file1_input.text())
-                    file2_is_video = self.concat_file2_input.text().lower().endswith('.mp4') and \
-                                    self._check_file_has_video(self.concat_file2_input.text())
-
-                    # 如果都是视频文件，启用所有视频相关按钮
-                    if file1_is_video and file2_is_video:
-                        self.concat_video_btn.setEnabled(True)
-                        self.concat_video_only_btn.setEnabled(True)
-                    else:
-                        self.concat_video_btn.setEnabled(False)
-                        self.concat_video_only_btn.setEnabled(False)
-
-                    # 音频拼接按钮始终可用
-                    self.concat_audio_btn.setEnabled(True)
+        # 设置时长
+        end_time = self.concat_end_time1 if file_num == 1 else self.concat_end_time2
+        end_time.setTime(seconds_to_qtime(result['info']['duration'] or 0))
+        self.status_label.setText(f"文件{file_num}加载成功")
 
-            except Exception as e:
-                self.status_label.setText(f"读取文件失败: {str(e)}")
+        # 根据文件类型启用相应按钮
+        self._update_concat_buttons()
 
-    def _check_file_has_video(self, file_path):
-        """检查MP4文件是否包含视频流"""
-        try:
-            video = VideoFileClip(file_path)
-            has_video = video.size[0] > 0 and video.size[1] > 0
-            video.close()
-            return has_video
-        except:
-            return False
+    def _update_concat_buttons(self):
+        """根据拼接列表或两个已选文件的情况启用拼接按钮"""
+        if self.concat_list.count():
+            segments = [self.concat_list.item(i).data(Qt.UserRole)
+                        for i in range(self.concat_list.count())]
+            # 还在读取信息的片段（数据为 None）未就绪
+            ready = len(segments) >= 2 and all(segments)
+            all_video = ready and all(segment[3] for segment in segments)
+        elif self.concat_file1_input.text() and self.concat_file2_input.text():
+            ready = (self.concat_file1_input.text() in self.probe_results and
+                     self.concat_file2_input.text() in self.probe_results)
+            all_video = self.concat_file1_input.text().lower().endswith('.mp4') and \
+                        self._check_file_has_video(self.concat_file1_input.text()) and \
+                        self.concat_file2_input.text().lower().endswith('.mp4') and \
+                        self._check_file_has_video(self.concat_file2_input.text())
+        else:
+            ready = all_video = False
 
-    def start_concat(self, concat_type):
-        # 获取文件路径和时间值
-        file1 = self.concat_file1_input.text()
-        file2 = self.concat_file2_input.text()
-        
-        # 获取时间值
-        start1 = self.concat_start_time1.time()
-        end1 = self.concat_end_time1.time()
-        start2 = self.concat_start_time2.time()
-        end2 = self.concat_end_time2.time()
-        
-        # 转换为秒
-        start_seconds1 = start1.hour() * 3600 + start1.minute() * 60 + start1.second()
-        end_seconds1 = end1.hour() * 3600 + end1.minute() * 60 + end1.second()
-        start_seconds2 = start2.hour() * 3600 + start2.minute() * 60 + start2.second()
-        end_seconds2 = end2.hour() * 3600 + end2.minute() * 60 + end2.second()
-        
-        # 验证时间
-        if start_seconds1 >= end_seconds1 or start_seconds2 >= end_seconds2:
+        # 都是视频文件时启用视频相关按钮，音频拼接按钮只要片段足够就可用
+        self.concat_video_btn.setEnabled(all_video)
+        self.concat_video_only_btn.setEnabled(all_video)
+        self.concat_audio_btn.setEnabled(ready)
+
+    def _append_concat_segment(self, file_path, start, end=None):
+        """向拼接列表追加一个片段
+
+        先插入占位条目保证列表顺序，文件信息在后台读取完成后再补全；
+        end 为 None 时使用文件的完整时长。
+        """
+        token = self.next_segment_token
+        self.next_segment_token += 1
+        item = QListWidgetItem(f"{os.path.basename(file_path)}    (正在读取...)")
+        item.setToolTip(file_path)
+        item.setData(Qt.UserRole, None)
+        item.setData(Qt.UserRole + 1, token)
+        self.concat_list.addItem(item)
+        self.probe_file(file_path, ('segment', token, start, end))
+
+    def _find_concat_segment(self, token):
+        """按占位标记查找拼接列表中的条目，已被移除时返回 None"""
+        for i in range(self.concat_list.count()):
+            item = self.concat_list.item(i)
+            if item.data(Qt.UserRole + 1) == token:
+                return item
+        return None
+
+    def _fill_concat_segment(self, tag, file_path, result):
+        """用探测结果补全占位片段"""
+        _, token, start, end = tag
+        item = self._find_concat_segment(token)
+        if item is None:
+            return
+        if end is None:
+            end = result['info']['duration'] or 0
+        item.setText(
+            f"{os.path.basename(file_path)}    "
+            f"{seconds_to_qtime(start).toString('HH:mm:ss.zzz')} - "
+            f"{seconds_to_qtime(end).toString('HH:mm:ss.zzz')}")
+        item.setData(Qt.UserRole, (file_path, start, end, result['has_video']))
+        self._update_concat_buttons()
+
+    def add_concat_segment(self):
+        """把文件1及其时间段加入拼接列表"""
+        file_path = self.concat_file1_input.text()
+        if not file_path:
+            self.status_label.setText("请先选择文件1！")
+            return
+        start = qtime_to_seconds(self.concat_start_time1.time())
+        end = qtime_to_seconds(self.concat_end_time1.time())
+        if start >= end:
             self.status_label.setText("开始时间必须小于结束时间！")
             return
+        self._append_concat_segment(file_path, start, end)
+        self._update_concat_buttons()
+
+    def add_concat_files(self):
+        """批量添加文件，每个文件以完整时长加入拼接列表（并行读取文件信息）"""
+        file_paths, _ = QFileDialog.getOpenFileNames(
+            self,
+            "选择要拼接的文件",
+            "",
+            "音视频文件 (*.mp3 *.MP3 *.mp4 *.MP4)"
+        )
+        for file_path in file_paths:
+            self._append_concat_segment(file_path, 0)
+        self._update_concat_buttons()
+
+    def remove_concat_segment(self):
+        """从拼接列表移除选中的片段"""
+        for item in self.concat_list.selectedItems():
+            self.concat_list.takeItem(self.concat_list.row(item))
+        self._update_concat_buttons()
+
+    def clear_concat_list(self):
+        """清空拼接列表"""
+        self.concat_list.clear()
+        self._update_concat_buttons()
+
+    def _check_file_has_video(self, file_path):
+        """根据已有的探测结果检查MP4文件是否包含视频流"""
+        result = self.probe_results.get(file_path)
+        return result is not None and result['has_video']
+
+    def start_concat(self, concat_type):
+        if self.concat_list.count():
+            # 按拼接列表的顺序拼接所有片段
+            segments = [self.concat_list.item(i).data(Qt.UserRole)[:3]
+                        for i in range(self.concat_list.count())]
+            if len(segments) < 2:
+                self.status_label.setText("拼接列表至少需要两个片段！")
+                return
+        else:
+            # 获取文件路径和时间值
+            file1 = self.concat_file1_input.text()
+            file2 = self.concat_file2_input.text()
+
+            # 获取时间值
+            start1 = self.concat_start_time1.time()
+            end1 = self.concat_end_time1.time()
+            start2 = self.concat_start_time2.time()
+            end2 = self.concat_end_time2.time()
+
+            # 转换为秒
+            start_seconds1 = qtime_to_seconds(start1)
+            end_seconds1 = qtime_to_seconds(end1)
+            start_seconds2 = qtime_to_seconds(start2)
+            end_seconds2 = qtime_to_seconds(end2)
+
+            # 验证时间
+            if start_seconds1 >= end_seconds1 or start_seconds2 >= end_seconds2:
+                self.status_label.setText("开始时间必须小于结束时间！")
+                return
+            segments = [(file1, start_seconds1, end_seconds1), (file2, start_seconds2, end_seconds2)]
         
         # 如果是音频拼接，先让用户选择输出格式
         if concat_type == 'audio':
@@ -1212,8 +5363,7 @@ class MainWindow(QMainWindow):
         self.concat_audio_btn.setEnabled(False)
         
         # 创建并启动工作线程
-        worker = ConcatWorker(file1, file2, start_seconds1, end_seconds1, 
-                            start_seconds2, end_seconds2, concat_type)
+        worker = ConcatWorker(segments, concat_type, profile=self.encoding_profile())
         worker.progress_signal.connect(self.update_status)
         worker.finished_signal.connect(lambda msg: self.concat_finished(worker, msg))
         
@@ -1226,17 +5376,8 @@ class MainWindow(QMainWindow):
         
         if not self.is_closing:
             self.status_label.setText(message)
-            # 重新启用所有拼接按钮
-            file1_is_video = self.concat_file1_input.text().lower().endswith('.mp4')
-            file2_is_video = self.concat_file2_input.text().lower().endswith('.mp4')
-            
-            # 如果都是视频文件，启用所有视频相关按钮
-            if file1_is_video and file2_is_video:
-                self.concat_video_btn.setEnabled(True)
-                self.concat_video_only_btn.setEnabled(True)
-            
-            # 音频拼接按钮始终可用
-            self.concat_audio_btn.setEnabled(True)
+            # 重新启用拼接按钮
+            self._update_concat_buttons()
             
         if self.is_closing and not self.active_workers:
             self.close()
@@ -1256,17 +5397,17 @@ class MainWindow(QMainWindow):
         self.clip_audio_btn.setEnabled(False)
         self.clip_video_btn.setEnabled(False)
         
-        # 获取文件时长
-        try:
-            audio = AudioFileClip(file_path)
-            duration = int(audio.duration)
-            audio.close()
-        except Exception as e:
-            self.status_label.setText(f"读取文件失败: {str(e)}")
+        # 获取文件时长（选择文件时已在后台读取）
+        result = self.probe_results.get(file_path)
+        if result is None:
+            self.status_label.setText("正在读取文件信息，请稍候...")
+            self.probe_file(file_path, ('clip',))
             return
+        duration = result['info']['duration']
         
         # 创建worker并设置为MP4音频输出
-        worker = ClipWorker(file_path, 0, duration, True)  # save_audio_only=True
+        worker = ClipWorker(file_path, 0, duration, True,  # save_audio_only=True
+                            profile=self.encoding_profile())
         worker.save_as_mp4_audio = True  # 强制设置为MP4音频输出
         
         # 连接信号
@@ -1277,11 +5418,85 @@ class MainWindow(QMainWindow):
         self.active_workers.append(worker)
         worker.start()
 
+def run_batch_cli(args):
+    """命令行批量下载：python main.py --batch 列表文件（- 表示从标准输入读取）"""
+    if args.batch == '-':
+        text = sys.stdin.read()
+    else:
+        with open(args.batch, 'r', encoding='utf-8') as f:
+            text = f.read()
+    bvids = parse_batch_input(text)
+    if not bvids:
+        print("下载列表中没有找到BV号")
+        return 1
+
+    policy = StreamPolicy(max_quality=args.quality, codec=args.codec,
+                          max_bitrate=args.max_bitrate, prefer_size=args.prefer_size)
+    print(f"流选择策略: {policy.describe()}")
+    for message in encoding_profiles.errors():
+        print(message)
+    profile = encoding_profiles.get(args.profile) if args.profile else encoding_profiles.current()
+    print(f"编码配置: {profile.describe()}")
+    worker = BatchDownloadTask(bvids, args.type, concurrency=args.concurrency,
+                               connections=args.connections, pages=args.pages, policy=policy,
+                               profile=profile)
+    worker.progress_signal.connect(print, Qt.DirectConnection)
+    worker.item_status_signal.connect(
+        lambda index, message: print(f"[{index + 1}/{len(bvids)}] {bvids[index]}: {message}"),
+        Qt.DirectConnection)
+    worker.finished_signal.connect(print, Qt.DirectConnection)
+    async def run():
+        try:
+            await worker.run_batch()
+        finally:
+            await http_client.close()
+
+    # 不需要界面，直接在新的事件循环中执行
+    asyncio.run(run())
+    stats = metadata_cache.stats()
+    print(f"元数据缓存: 命中 {stats['hits']}，未命中 {stats['misses']}，共 {stats['entries']} 条")
+    return 0 if worker.failed == 0 else 1
+
+
 def main():
-    app = QApplication(sys.argv)
+    parser = argparse.ArgumentParser(description="B站视频下载与剪辑工具")
+    parser.add_argument('--batch', metavar='FILE',
+                        help="批量下载列表文件，每行一个BV号或链接，- 表示从标准输入读取")
+    parser.add_argument('--type', default='mp3', choices=['mp3', 'mp4audio', 'mp4', 'full_mp4'],
+                        help="批量下载的类型")
+    parser.add_argument('--concurrency', type=int, default=3, help="同时下载的视频数量")
+    parser.add_argument('--connections', type=int, default=4, help="每个文件的下载连接数")
+    parser.add_argument('--pages', help="要下载的分P，如 1-3,5 或 all，默认只下载第一P")
+    parser.add_argument('--quality', type=int, default=0,
+                        help="最高清晰度代码，如 80 (1080P)、64 (720P)，默认不限")
+    parser.add_argument('--codec', default='avc', choices=['avc', 'hevc', 'av1'],
+                        help="优先使用的视频编码")
+    parser.add_argument('--max-bitrate', type=int, default=0, help="视频流和音频流的码率上限 (kbps)，默认不限")
+    parser.add_argument('--prefer-size', action='store_true',
+                        help="同一清晰度下选择体积最小的流（忽略编码偏好）")
+    parser.add_argument('--profile', choices=encoding_profiles.names(),
+                        help="需要转码时使用的编码配置，默认使用界面上最后选中的配置")
+    args, qt_args = parser.parse_known_args()
+    if args.batch:
+        sys.exit(run_batch_cli(args))
+
+    app = QApplication(sys.argv[:1] + qt_args)
+    # 界面和所有下载任务共用一个事件循环
+    loop = qasync.QEventLoop(app)
+    asyncio.set_event_loop(loop)
     window = MainWindow()
     window.show()
-    sys.exit(app.exec())
+    with loop:
+        loop.run_forever()
+        # 等待被取消的下载任务保存断点续传日志，再关闭连接池
+        pending = [task for task in asyncio.all_tasks(loop) if not task.done()]
+        if pending:
+            loop.run_until_complete(asyncio.wait(pending, timeout=5))
+        loop.run_until_complete(http_client.close())
+    asyncio.set_event_loop(None)
+    # 界面中探测文件时缓存只是间隔落盘，退出前写入剩余的修改
+    media_probe.flush()
+    sys.exit(0)
 
 if __name__ == "__main__":
     main()
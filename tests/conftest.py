@@ -0,0 +1,167 @@
+import http.server
+import os
+import re
+import socketserver
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def app_dir(tmp_path, monkeypatch):
+    """把模块级的缓存和配置单例换成指向临时目录的实例，测试不读写仓库里的 cache/ 和 config.json"""
+    path = tmp_path / 'app'
+    cache_dir = path / 'cache'
+    monkeypatch.setattr(main, 'get_app_dir', lambda: str(path))
+    monkeypatch.setattr(main, 'media_probe',
+                        main.MediaProbeService(str(cache_dir / 'probe_cache.json')))
+    monkeypatch.setattr(main, 'keyframe_index', main.KeyframeIndex(str(cache_dir / 'keyframes')))
+    monkeypatch.setattr(main, 'metadata_cache',
+                        main.MetadataCache(str(cache_dir / 'metadata_cache.json')))
+    monkeypatch.setattr(main, 'mirror_stats', main.MirrorStats(str(cache_dir / 'mirror_stats.json')))
+    monkeypatch.setattr(main, 'encoding_profiles', main.EncodingProfiles(str(path / 'config.json')))
+    return path
+
+
+class RangeRequestHandler(http.server.BaseHTTPRequestHandler):
+    """按 Range 请求返回内存中的文件，记录每个请求的 Range 头
+
+    server.delay 为返回数据前等待的秒数；server.cut_after 不为 None 时每个响应只发送
+    这么多字节就断开连接，模拟传输中出错的镜像。
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        data = server.files.get(self.path.split('?')[0])
+        if data is None:
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        range_header = self.headers.get('Range')
+        with server.lock:
+            server.requests.append((self.path, range_header))
+        start, end = 0, len(data) - 1
+        match = re.match(r'bytes=(\d+)-(\d*)', range_header or '')
+        if match and server.support_range:
+            start = int(match.group(1))
+            if match.group(2):
+                end = min(int(match.group(2)), len(data) - 1)
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{end}/{len(data)}')
+        else:
+            self.send_response(200)
+        self.send_header('Content-Length', str(end - start + 1))
+        self.send_header('ETag', f'"{len(data)}"')
+        self.end_headers()
+        if server.delay:
+            time.sleep(server.delay)
+        if server.cut_after is not None:
+            end = min(end, start + server.cut_after - 1)
+            self.close_connection = True
+        try:
+            self.wfile.write(data[start:end + 1])
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+
+class RangeServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), RangeRequestHandler)
+        self.files = {}
+        self.requests = []
+        self.support_range = True
+        self.delay = 0
+        self.cut_after = None
+        self.lock = threading.Lock()
+
+    def url(self, path):
+        return f'http://127.0.0.1:{self.server_address[1]}{path}'
+
+    def ranges(self, path):
+        """返回对 path 发出的所有 Range 头"""
+        with self.lock:
+            return [value for request_path, value in self.requests if request_path == path]
+
+
+def serve():
+    server = RangeServer()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def range_server():
+    yield from serve()
+
+
+@pytest.fixture
+def backup_server():
+    """另一个端口上的服务器，用作镜像（镜像统计按主机和端口区分）"""
+    yield from serve()
+
+
+class MediaFactory:
+    """用 ffmpeg 的测试源生成音视频文件，并读取结果文件的数据包和解码信息"""
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def make(self, name, duration=4, video=True, audio=True, extra=()):
+        """生成 160x120、25fps、每秒一个关键帧的 H.264 视频和 48kHz AAC 音频
+
+        extra 中的参数放在默认编码参数之后，可以覆盖编码器等设置。
+        """
+        path = str(self.directory / name)
+        args = []
+        if video:
+            args += ['-f', 'lavfi', '-i', 'testsrc2=s=160x120:r=25']
+        if audio:
+            args += ['-f', 'lavfi', '-i', 'sine=frequency=440:sample_rate=48000']
+        args += ['-t', str(duration)]
+        if video:
+            args += ['-c:v', 'libx264', '-g', '25', '-keyint_min', '25', '-sc_threshold', '0',
+                     '-pix_fmt', 'yuv420p']
+        if audio:
+            args += ['-c:a', 'aac']
+        main.run_ffmpeg(args + list(extra) + [path])
+        return path
+
+    @staticmethod
+    def packet_md5(path, selector):
+        """selector 指定的流所有数据包的 MD5，相同说明是直接复制的码流"""
+        return main.run_ffmpeg(['-i', path, '-map', f'0:{selector}', '-c', 'copy',
+                                '-f', 'md5', '-']).stdout.strip()
+
+    @staticmethod
+    def video_frames(path):
+        """解码得到的视频帧数"""
+        output = main.run_ffmpeg(['-i', path, '-map', '0:v:0', '-f', 'null', '-']).stderr
+        return int(re.findall(rb'frame=\s*(\d+)', output)[-1])
+
+    @staticmethod
+    def audio_seconds(path):
+        """解码得到的音频时长（秒）"""
+        output = main.run_ffmpeg(['-i', path, '-map', '0:a:0', '-f', 's16le', '-ac', '1',
+                                  '-ar', '48000', '-']).stdout
+        return len(output) / 2 / 48000
+
+
+@pytest.fixture
+def media(tmp_path):
+    return MediaFactory(tmp_path)
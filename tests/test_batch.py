@@ -0,0 +1,171 @@
+import asyncio
+
+import pytest
+
+import main
+
+BVIDS = [f'BV1{index:09d}' for index in range(6)]
+
+
+def test_parse_batch_input_dedupes_and_skips_comments():
+    text = "\n".join([
+        "# 收藏夹",
+        f"https://www.bilibili.com/video/{BVIDS[0]}?p=2",
+        "",
+        f"{BVIDS[1]} {BVIDS[0]}",
+        f"  # {BVIDS[2]}",
+        "没有BV号的行",
+    ])
+    assert main.parse_batch_input(text) == BVIDS[:2]
+
+
+class Tracker:
+    """记录同时进行的协程数量的最大值"""
+
+    def __init__(self):
+        self.active = 0
+        self.peak = 0
+
+    async def run(self, delay):
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        try:
+            await asyncio.sleep(delay)
+        finally:
+            self.active -= 1
+
+
+@pytest.fixture
+def fake_items(monkeypatch):
+    """把单个条目的元数据和传输阶段换成只记录并发数的协程，BVIDS[3] 下载失败"""
+    meta_tracker, transfer_tracker = Tracker(), Tracker()
+
+    async def fetch_metadata(self):
+        await meta_tracker.run(0.02)
+        return {'title': self.url}
+
+    async def download_pages(self, meta, merge_executor=None, transfer_slot=None):
+        async with transfer_slot:
+            self.progress_value.emit(50)
+            await transfer_tracker.run(0.05)
+        if self.url == BVIDS[3]:
+            raise RuntimeError("网络错误")
+        return f"下载完成: {meta['title']}.mp3"
+
+    monkeypatch.setattr(main.DownloadTask, 'fetch_metadata', fetch_metadata)
+    monkeypatch.setattr(main.DownloadTask, 'download_pages', download_pages)
+    return meta_tracker, transfer_tracker
+
+
+def run_batch(worker):
+    statuses, progress, finished = {}, [], []
+    worker.item_status_signal.connect(lambda index, message: statuses.__setitem__(index, message))
+    worker.progress_value.connect(progress.append)
+    worker.finished_signal.connect(finished.append)
+    asyncio.run(worker.run_batch())
+    return statuses, progress, finished
+
+
+def test_batch_limits_concurrency_and_counts_results(fake_items):
+    meta_tracker, transfer_tracker = fake_items
+    worker = main.BatchDownloadTask(BVIDS, concurrency=2, meta_concurrency=3)
+    statuses, progress, finished = run_batch(worker)
+    assert transfer_tracker.peak == 2
+    assert meta_tracker.peak == 3
+    assert (worker.succeeded, worker.failed) == (5, 1)
+    assert statuses[3] == "下载失败: 网络错误"
+    assert statuses[0] == f"下载完成: {BVIDS[0]}.mp3"
+    assert progress == sorted(progress) and progress[-1] == 100
+    assert finished == ["批量下载结束: 成功 5，失败 1，共 6 个"]
+
+
+def test_batch_cancel_skips_pending_items(fake_items, monkeypatch):
+    worker = main.BatchDownloadTask(BVIDS, concurrency=1, meta_concurrency=1)
+    fetch_metadata = main.DownloadTask.fetch_metadata
+
+    async def cancel_on_first(self):
+        if self.url == BVIDS[0]:
+            worker.cancel()
+        return await fetch_metadata(self)
+    monkeypatch.setattr(main.DownloadTask, 'fetch_metadata', cancel_on_first)
+
+    statuses, _, finished = run_batch(worker)
+    assert set(statuses.values()) == {"已取消"}
+    assert worker.succeeded == 0 and worker.failed == len(BVIDS)
+    assert finished[0].startswith("批量下载结束")
+
+
+def test_parse_page_selection():
+    assert main.parse_page_selection('1-3,5', 6) == [1, 2, 3, 5]
+    assert main.parse_page_selection(' 2，2 4 ', 6) == [2, 4]
+    assert main.parse_page_selection('ALL', 3) == [1, 2, 3]
+    assert main.parse_page_selection('全部', 2) == [1, 2]
+    for text in ('0', '7', '3-1', 'x', ''):
+        with pytest.raises(ValueError):
+            main.parse_page_selection(text, 6)
+
+
+class FakeVideo:
+    """代替 bilibili_api 的 Video，记录请求了哪些分P的下载地址"""
+    requested = []
+
+    def __init__(self, bvid):
+        self.bvid = bvid
+
+    async def get_info(self):
+        return {'title': '合集/标题', 'cid': 101,
+                'pages': [{'page': n, 'part': f'第{n}集', 'cid': 100 + n} for n in range(1, 5)]}
+
+    async def get_download_url(self, cid):
+        FakeVideo.requested.append(cid)
+        return {'cid': cid}
+
+
+@pytest.fixture
+def fake_video(monkeypatch):
+    FakeVideo.requested = []
+    monkeypatch.setattr(main.video, 'Video', FakeVideo)
+    return FakeVideo
+
+
+def run(coroutine):
+    async def wrapper():
+        try:
+            return await coroutine
+        finally:
+            await main.http_client.close()
+    return asyncio.run(wrapper())
+
+
+def test_fetch_metadata_selects_pages(fake_video):
+    meta = run(main.DownloadTask(f'https://www.bilibili.com/video/{BVIDS[0]}?p=3').fetch_metadata())
+    assert [page['cid'] for page in meta['pages']] == [103]
+    assert not meta['multi_page']
+    # 只预先取得第一个分P的下载地址，其余的在下载前一P时获取
+    meta = run(main.DownloadTask(BVIDS[0], pages='2-4').fetch_metadata())
+    assert [page['cid'] for page in meta['pages']] == [102, 103, 104]
+    assert meta['multi_page']
+    assert meta['pages'][0]['download_info'] == {'cid': 102}
+    assert fake_video.requested == [103, 102]
+
+
+def test_download_pages_runs_every_page(fake_video, monkeypatch):
+    transferred = []
+
+    async def transfer_streams(self, page_meta):
+        transferred.append((page_meta['subdir'], page_meta['title'], page_meta['download_info']))
+        return page_meta
+
+    def finalize(self, plan):
+        return f"下载完成: {plan['subdir']}/{plan['title']}.mp3"
+    monkeypatch.setattr(main.DownloadTask, 'transfer_streams', transfer_streams)
+    monkeypatch.setattr(main.DownloadTask, 'finalize', finalize)
+
+    task = main.DownloadTask(BVIDS[0], pages='all')
+
+    async def download():
+        return await task.download_pages(await task.fetch_metadata())
+    message = run(download())
+    assert message == "下载完成（共 4 P）: 合集_标题/P04_第4集.mp3"
+    assert transferred == [('合集_标题', f'P{n:02d}_第{n}集', {'cid': 100 + n}) for n in range(1, 5)]
+    assert task.page_position == (3, 4)
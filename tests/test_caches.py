@@ -0,0 +1,90 @@
+import asyncio
+import time
+
+import main
+
+
+def test_metadata_cache_expires_entries(tmp_path):
+    cache = main.MetadataCache(str(tmp_path / 'meta.json'))
+    cache.put('a', 1, time.time() + 60)
+    cache.put('b', 2, time.time() - 1)
+    assert cache.get('a') == 1
+    assert cache.get('b') is None
+    assert cache.get('c') is None
+    assert cache.stats() == {'hits': 1, 'misses': 2, 'entries': 1}
+
+
+def test_metadata_cache_evicts_least_recently_used(tmp_path):
+    cache = main.MetadataCache(str(tmp_path / 'meta.json'), max_entries=2)
+    expires = time.time() + 60
+    cache.put('a', 1, expires)
+    cache.put('b', 2, expires)
+    assert cache.get('a') == 1
+    cache.put('c', 3, expires)
+    assert cache.get('b') is None
+    assert (cache.get('a'), cache.get('c')) == (1, 3)
+
+
+def test_metadata_cache_saves_periodically_and_on_flush(tmp_path):
+    path = str(tmp_path / 'meta.json')
+    cache = main.MetadataCache(path)
+    expires = time.time() + 60
+    cache.put('a', 1, expires)
+    cache.put('b', 2, expires)
+    # 第一次写入立即落盘，间隔内的修改等到 flush
+    assert main._load_json_cache(path).keys() == {'a'}
+    cache.flush()
+    reloaded = main.MetadataCache(path)
+    assert (reloaded.get('a'), reloaded.get('b')) == (1, 2)
+
+
+def test_corrupt_cache_file_starts_empty(tmp_path):
+    path = tmp_path / 'meta.json'
+    path.write_text('{"a":', encoding='utf-8')
+    cache = main.MetadataCache(str(path))
+    assert cache.get('a') is None
+    cache.put('a', 1, time.time() + 60)
+    cache.flush()
+    assert main.MetadataCache(str(path)).get('a') == 1
+
+
+def stream(deadline):
+    return {'baseUrl': f'https://upos.example.com/a.m4s?deadline={deadline}&os=x',
+            'backupUrl': [f'https://cn.example.com/a.m4s?deadline={deadline + 100}']}
+
+
+def test_play_url_deadline_takes_earliest():
+    info = {'dash': {'video': [stream(2000)], 'audio': [stream(1500)]}}
+    assert main.play_url_deadline(info) == 1500
+    assert main.play_url_deadline({'durl': []}) is None
+
+
+class FakeVideo:
+    def __init__(self, info):
+        self.info = info
+        self.calls = 0
+
+    async def get_download_url(self, cid):
+        self.calls += 1
+        return self.info
+
+
+def test_download_url_is_cached_until_before_deadline(tmp_path):
+    cache = main.MetadataCache(str(tmp_path / 'meta.json'))
+    deadline = int(time.time()) + 3600
+    signed = FakeVideo({'dash': {'video': [stream(deadline)], 'audio': []}})
+    for _ in range(2):
+        asyncio.run(cache.download_url(signed, 'BV', 1))
+    assert signed.calls == 1
+    entry = cache._entries['playurl:BV:1']
+    assert entry['expires'] == deadline - cache.EXPIRY_MARGIN
+
+    # 快要过期的地址不缓存
+    expiring = FakeVideo({'dash': {'video': [stream(int(time.time()) + 60)], 'audio': []}})
+    for _ in range(2):
+        asyncio.run(cache.download_url(expiring, 'BV', 2))
+    assert expiring.calls == 2
+
+    unsigned = FakeVideo({'durl': []})
+    asyncio.run(cache.download_url(unsigned, 'BV', 3))
+    assert cache._entries['playurl:BV:3']['expires'] <= time.time() + cache.PLAY_URL_TTL
@@ -0,0 +1,101 @@
+import threading
+import time
+
+import pytest
+
+import main
+
+
+def run_clip(worker):
+    """在当前线程执行剪辑，返回结束消息"""
+    messages = []
+    worker.finished_signal.connect(messages.append)
+    worker.run()
+    return messages[-1]
+
+
+def wait_for_process(processes):
+    deadline = time.monotonic() + 10
+    while not processes._processes and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return list(processes._processes)
+
+
+def test_cancel_kills_running_ffmpeg():
+    processes = main.ProcessGroup()
+    errors = []
+
+    def encode():
+        try:
+            main.run_ffmpeg(['-f', 'lavfi', '-i', 'testsrc2=s=160x120:r=25', '-t', '600',
+                             '-f', 'null', '-'], processes)
+        except RuntimeError as e:
+            errors.append(str(e))
+
+    thread = threading.Thread(target=encode)
+    thread.start()
+    (process,) = wait_for_process(processes)
+    processes.cancel()
+    thread.join(10)
+    assert not thread.is_alive()
+    assert errors == ["任务已取消"]
+    assert process.returncode is not None and not processes._processes
+    # 取消后不再启动新进程
+    with pytest.raises(RuntimeError):
+        main.run_ffmpeg(['-version'], processes)
+
+
+def test_clip_worker_cancel_stops_encoding(media):
+    source = media.make('src.mp4', duration=60)
+    worker = main.ClipWorker(source, 0.5, 59.5, mode='precise')
+    running = []
+
+    def cancel_when_encoding():
+        running.extend(wait_for_process(worker.processes))
+        worker.cancel()
+
+    canceller = threading.Thread(target=cancel_when_encoding)
+    canceller.start()
+    started = time.monotonic()
+    assert run_clip(worker) == "剪辑失败: 任务已取消"
+    canceller.join()
+    assert time.monotonic() - started < 10
+    assert running and all(process.returncode is not None for process in running)
+    assert not list(media.directory.glob('src_剪辑_*'))
+
+
+def test_clip_worker_cancelled_before_start(media):
+    source = media.make('src.mp4')
+    worker = main.ClipWorker(source, 1, 3, mode='fast')
+    worker.cancel()
+    assert run_clip(worker) == "剪辑失败: 任务已取消"
+
+
+def test_media_clipper_cancel_closes_clips():
+    closed = []
+
+    class FakeClip:
+        def __init__(self, name):
+            self.name = name
+
+        def close(self):
+            closed.append(self.name)
+
+    clipper = main.MediaClipper('a.mp3', 0, 1)
+    clipper.media, clipper.clip = FakeClip('media'), FakeClip('clip')
+    clipper.cancel()
+    assert clipper.processes.cancelled
+    assert closed == ['clip', 'media']
+
+
+@pytest.mark.parametrize('mode', ['precise', 'smart'])
+def test_clip_cues_writes_one_file_per_cue(media, mode):
+    source = media.make('src.mp4', duration=6)
+    cues = [(3.0, 4.2, '第二段'), (0.6, 1.6, '')]
+    clipper = main.MediaClipper(source, 0, 0, mode=mode, cues=cues)
+    outputs = clipper.clip_cues(source[:-4])
+    # 按开始时间排序输出
+    assert len(outputs) == 2 and '第二段' in outputs[1]
+    assert [media.video_frames(path) for path in outputs] == [25, 30]
+    assert media.audio_seconds(outputs[0]) == pytest.approx(1.0, abs=0.05)
+    assert media.audio_seconds(outputs[1]) == pytest.approx(1.2, abs=0.05)
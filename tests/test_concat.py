@@ -0,0 +1,67 @@
+import os
+
+import pytest
+
+import main
+
+
+def run_concat(segments, concat_type):
+    """在当前线程执行拼接，返回 (输出文件, 进度消息列表)"""
+    worker = main.ConcatWorker(segments, concat_type)
+    messages = []
+    worker.progress_signal.connect(messages.append)
+    worker.finished_signal.connect(messages.append)
+    worker.run()
+    assert messages[-1].startswith("拼接完成: "), messages[-1]
+    return messages[-1][len("拼接完成: "):], messages
+
+
+@pytest.fixture
+def source(media):
+    return media.make('src.mp4', duration=12)
+
+
+def test_copy_concat_audio_length_matches_segments(source, media):
+    segments = [(source, 1.5, 4.2), (source, 7, 9)]
+    output, messages = run_concat(segments, 'audio_mp4')
+    assert any("直接复制码流拼接" in message for message in messages)
+    # 直接复制只能按音频帧（约 21ms）截断，每个片段允许一帧误差
+    assert media.audio_seconds(output) == pytest.approx(4.7, abs=0.05)
+
+
+def test_copy_concat_video_keeps_audio_in_sync(source, media):
+    segments = [(source, 1.5, 4.2), (source, 6, 8), (source, 9.3, 11.8)]
+    output, messages = run_concat(segments, 'video')
+    assert any("直接复制码流拼接" in message for message in messages)
+    # 每段按 25fps 取 [start, end) 内的帧：67 + 50 + 62
+    assert media.video_frames(output) == 179
+    assert media.audio_seconds(output) == pytest.approx(7.2, abs=0.08)
+    assert os.path.basename(output) == '拼接_3段_00-00-01.500_00-00-11.800.mp4'
+
+
+def test_reencode_concat_unifies_different_sources(source, media):
+    other = media.make('big.mkv', duration=3, extra=['-s', '320x240', '-c:v', 'mpeg4'])
+    segments = [(source, 1, 3), (other, 0.5, 2.5), (source, 10, 11)]
+    output, messages = run_concat(segments, 'video')
+    assert any("改为重新编码拼接" in message for message in messages)
+    info = main.probe_media(output)
+    video_stream = main.first_stream(info, 'video')
+    assert (video_stream['width'], video_stream['height']) == (160, 120)
+    assert media.video_frames(output) == 125
+    assert media.audio_seconds(output) == pytest.approx(5, abs=0.08)
+
+
+def test_reencode_concat_to_mp3(source, media):
+    output, messages = run_concat([(source, 0, 2), (source, 5, 6.5)], 'audio_mp3')
+    assert output.endswith('.mp3')
+    assert main.first_stream(main.probe_media(output), 'audio')['codec'] == 'mp3'
+    assert media.audio_seconds(output) == pytest.approx(3.5, abs=0.08)
+
+
+def test_concat_rejects_files_without_video(source, media):
+    audio = media.make('a.m4a', video=False)
+    worker = main.ConcatWorker([(source, 0, 1), (audio, 0, 1)], 'video')
+    messages = []
+    worker.finished_signal.connect(messages.append)
+    worker.run()
+    assert messages == ["拼接失败: 视频拼接模式需要所有文件都包含视频流"]
@@ -0,0 +1,195 @@
+import asyncio
+import os
+import re
+
+import pytest
+
+import main
+
+
+def run(coroutine):
+    async def wrapper():
+        try:
+            return await coroutine
+        finally:
+            await main.http_client.close()
+    return asyncio.run(wrapper())
+
+
+def make_downloader(**kwargs):
+    kwargs.setdefault('min_segment_size', 64 * 1024)
+    return main.RangedDownloader(**kwargs)
+
+
+@pytest.fixture
+def payload():
+    return os.urandom(1024 * 1024 + 123)
+
+
+def test_download_uses_several_connections(range_server, payload, tmp_path):
+    range_server.files['/f.bin'] = payload
+    target = str(tmp_path / 'f.bin')
+    downloaded = run(make_downloader(connections=4).download(range_server.url('/f.bin'), target))
+    assert downloaded == len(payload)
+    with open(target, 'rb') as f:
+        assert f.read() == payload
+    assert len([r for r in range_server.ranges('/f.bin') if r != 'bytes=0-0']) > 1
+    assert not os.path.exists(target + '.part.json')
+
+
+def test_download_without_range_support(range_server, payload, tmp_path):
+    range_server.files['/f.bin'] = payload
+    range_server.support_range = False
+    target = str(tmp_path / 'f.bin')
+    run(make_downloader().download(range_server.url('/f.bin'), target))
+    with open(target, 'rb') as f:
+        assert f.read() == payload
+
+
+def test_download_reports_progress(range_server, payload, tmp_path):
+    range_server.files['/f.bin'] = payload
+    reports = []
+    downloader = make_downloader(connections=4,
+                                 progress_callback=lambda done, total: reports.append((done, total)))
+    run(downloader.download(range_server.url('/f.bin'), str(tmp_path / 'f.bin')))
+    assert reports and reports[-1] == (len(payload), len(payload))
+    assert all(a[0] <= b[0] for a, b in zip(reports, reports[1:]))
+
+
+def test_journal_merges_ranges_and_reports_missing(tmp_path):
+    journal = main.DownloadJournal(str(tmp_path / 'a.json'), '"e"', 100)
+    journal.add_range(10, 19)
+    journal.add_range(20, 29)
+    journal.add_range(50, 59)
+    assert journal.completed == [(10, 29), (50, 59)]
+    assert journal.completed_size() == 30
+    assert journal.missing_ranges() == [(0, 9), (30, 49), (60, 99)]
+
+
+def test_journal_round_trip_and_matching(tmp_path):
+    path = str(tmp_path / 'a.json')
+    journal = main.DownloadJournal(path, '"e"', 100, [(0, 49)])
+    journal.save()
+    loaded = main.DownloadJournal.load(path)
+    assert (loaded.etag, loaded.content_length, loaded.completed) == ('"e"', 100, [(0, 49)])
+    assert loaded.matches('"e"', 100)
+    assert not loaded.matches('"other"', 100)
+    assert not loaded.matches('"e"', 101)
+    # 服务器不返回 ETag 时只比较长度
+    assert loaded.matches(None, 100)
+    loaded.remove()
+    assert main.DownloadJournal.load(path) is None
+
+
+def test_journal_load_ignores_corrupt_file(tmp_path):
+    path = tmp_path / 'bad.json'
+    path.write_text('{', encoding='utf-8')
+    assert main.DownloadJournal.load(str(path)) is None
+
+
+def write_partial(target, payload, completed, etag):
+    """模拟中断的下载：.part 文件中只有 completed 区间的数据是有效的"""
+    with open(target + '.part', 'wb') as f:
+        f.truncate(len(payload))
+        for start, end in completed:
+            f.seek(start)
+            f.write(payload[start:end + 1])
+    main.DownloadJournal(target + '.part.json', etag, len(payload), completed).save()
+
+
+def range_starts(range_server, path):
+    return [int(re.match(r'bytes=(\d+)', r).group(1))
+            for r in range_server.ranges(path) if r != 'bytes=0-0']
+
+
+def test_download_resumes_from_journal(range_server, payload, tmp_path):
+    range_server.files['/f.bin'] = payload
+    target = str(tmp_path / 'f.bin')
+    half = len(payload) // 2
+    write_partial(target, payload, [(0, half - 1)], f'"{len(payload)}"')
+
+    run(make_downloader(connections=2).download(range_server.url('/f.bin'), target))
+    with open(target, 'rb') as f:
+        assert f.read() == payload
+    starts = range_starts(range_server, '/f.bin')
+    assert starts and min(starts) >= half
+    assert not os.path.exists(target + '.part.json')
+
+
+def test_download_restarts_when_file_changed(range_server, payload, tmp_path):
+    range_server.files['/f.bin'] = payload
+    target = str(tmp_path / 'f.bin')
+    # ETag 不一致说明服务器上的文件已经变化，已下载的部分作废
+    write_partial(target, bytes(len(payload)), [(0, len(payload) // 2)], '"old"')
+
+    run(make_downloader(connections=2).download(range_server.url('/f.bin'), target))
+    with open(target, 'rb') as f:
+        assert f.read() == payload
+    assert min(range_starts(range_server, '/f.bin')) == 0
+
+
+def test_download_ranges_and_read_range(range_server, payload, tmp_path):
+    range_server.files['/f.bin'] = payload
+    url = range_server.url('/f.bin')
+    ranges = [(0, 999), (300000, 700000)]
+    target = str(tmp_path / 'part.bin')
+    run(make_downloader(connections=3).download_ranges(url, ranges, target))
+    with open(target, 'rb') as f:
+        assert f.read() == payload[:1000] + payload[300000:700001]
+    assert run(make_downloader().read_range(url, 10, 19)) == payload[10:20]
+
+
+def test_mirror_stats_ranking_and_persistence(tmp_path):
+    path = str(tmp_path / 'mirrors.json')
+    stats = main.MirrorStats(path)
+    fast, slow, failing, unknown = (f'https://{host}.example.com/a.m4s'
+                                    for host in ('fast', 'slow', 'failing', 'unknown'))
+    stats.record(fast, latency=0.05, rate=4e6)
+    stats.record(slow, rate=1e6)
+    stats.record(failing, rate=8e6)
+    stats.record(failing, failed=True)
+    assert stats.rank([unknown, failing, slow, fast]) == [fast, slow, unknown, failing]
+    assert stats.best_rate([slow, failing]) == 4e6
+    assert stats.is_fresh(fast) and not stats.is_fresh(failing) and not stats.is_fresh(unknown)
+    # 速度按指数平滑更新，成功的传输抵消以前的失败
+    stats.record(slow, rate=2e6)
+    assert stats._entry(slow)['rate'] == pytest.approx(1e6 + stats.SMOOTHING * 1e6)
+    stats.record(failing, rate=8e6)
+    assert stats._entry(failing)['failures'] == 0
+
+    stats.flush()
+    reloaded = main.MirrorStats(path)
+    assert reloaded.rank([slow, fast]) == [fast, slow]
+
+
+def test_download_races_mirrors_and_starts_on_the_fastest(range_server, backup_server, payload,
+                                                          tmp_path):
+    for server in (range_server, backup_server):
+        server.files['/f.bin'] = payload
+    range_server.delay = 0.5
+    slow, fast = range_server.url('/f.bin'), backup_server.url('/f.bin')
+    downloader = make_downloader(connections=2)
+    target = str(tmp_path / 'f.bin')
+    run(downloader.download([slow, fast], target))
+    with open(target, 'rb') as f:
+        assert f.read() == payload
+    assert downloader._mirrors[0] == fast
+    assert main.mirror_stats.rank([slow, fast])[0] == fast
+
+
+def test_download_fails_over_to_backup_mid_transfer(range_server, backup_server, tmp_path):
+    payload = os.urandom(4 * 1024 * 1024)
+    for server in (range_server, backup_server):
+        server.files['/f.bin'] = payload
+    primary, backup = range_server.url('/f.bin'), backup_server.url('/f.bin')
+    # 主镜像最近测过速，跳过测速直接使用；它的每个连接传输 300KB 后断开
+    main.mirror_stats.record(primary, rate=1e9)
+    range_server.cut_after = 300 * 1024
+    downloader = make_downloader(connections=2, min_segment_size=1024 * 1024)
+    target = str(tmp_path / 'f.bin')
+    run(downloader.download([primary, backup], target))
+    with open(target, 'rb') as f:
+        assert f.read() == payload
+    assert downloader.switches >= 1
+    assert backup_server.ranges('/f.bin')
+    assert main.mirror_stats._entry(primary)['failures'] >= 1
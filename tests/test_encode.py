@@ -0,0 +1,35 @@
+import pytest
+
+import main
+
+
+@pytest.fixture
+def source(media):
+    # 20 秒，每秒一个关键帧
+    return media.make('src.mp4', duration=20)
+
+
+def test_split_points_land_on_keyframes(source):
+    encoder = main.ChunkedEncoder(workers=2)
+    assert encoder.split_points(source, 0.6, 19.3, 0) == [0.6, 5.0, 10.0, 15.0, 19.3]
+
+
+def test_short_ranges_are_not_split(source):
+    encoder = main.ChunkedEncoder(workers=4)
+    assert encoder.split_points(source, 2.5, 9.5, 0) == [2.5, 9.5]
+
+
+def test_encode_joins_chunks_without_gaps(source, media):
+    messages = []
+    encoder = main.ChunkedEncoder(workers=2, progress_callback=messages.append)
+    output = str(media.directory / 'out.mp4')
+    audio = main.ChunkedEncoder.audio_source(source, 0.6, 19.3, 1, ['-c:a', 'aac'])
+    encoder.encode(source, 0.6, 19.3, output, audio=audio)
+    # 4 段视频加 1 个音频任务
+    assert any("已完成 5/5" in message for message in messages)
+    # 0.6s 到 19.28s 之间的帧
+    assert media.video_frames(output) == 468
+    assert media.audio_seconds(output) == pytest.approx(18.7, abs=0.05)
+    # 各段直接复制拼接，每段以自己的关键帧开头
+    pts, _, _ = main.parse_mp4_keyframes(output)
+    assert [round(t, 2) for t in pts] == [0.0, 4.4, 9.4, 14.4]
@@ -0,0 +1,48 @@
+import asyncio
+
+from bilibili_api.utils import network
+
+import main
+
+
+def test_session_is_shared_per_loop_and_recreated_after_close():
+    async def scenario():
+        session = main.http_client.session()
+        assert main.http_client.session() is session
+        assert network.get_aiohttp_session() is session
+        await main.http_client.close()
+        assert session.closed
+        replacement = main.http_client.session()
+        assert replacement is not session and network.get_aiohttp_session() is replacement
+        await main.http_client.close()
+    asyncio.run(scenario())
+
+
+class FakeVideo:
+    """代替 bilibili_api 的 Video，记录请求时 bilibili_api 使用的会话"""
+    sessions = []
+
+    def __init__(self, bvid):
+        self.bvid = bvid
+
+    async def get_info(self):
+        FakeVideo.sessions.append(network.get_aiohttp_session())
+        return {'title': '标题', 'cid': 1}
+
+    async def get_download_url(self, cid):
+        FakeVideo.sessions.append(network.get_aiohttp_session())
+        return {}
+
+
+def test_bilibili_api_requests_use_the_shared_session(monkeypatch):
+    FakeVideo.sessions = []
+    monkeypatch.setattr(main.video, 'Video', FakeVideo)
+
+    async def scenario():
+        try:
+            await main.DownloadTask('BV1xx411c7mD').fetch_metadata()
+            return main.http_client.session()
+        finally:
+            await main.http_client.close()
+    shared = asyncio.run(scenario())
+    assert FakeVideo.sessions == [shared, shared]
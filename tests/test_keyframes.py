@@ -0,0 +1,50 @@
+import pytest
+
+import main
+
+
+def encode(tmp_path, name, *args):
+    path = str(tmp_path / name)
+    main.run_ffmpeg(['-f', 'lavfi', '-i', 'testsrc2=s=160x120:r=25', '-t', '4',
+                     '-c:v', 'libx264', '-g', '25', '-keyint_min', '25', '-sc_threshold', '0']
+                    + list(args) + [path])
+    return path
+
+
+@pytest.mark.parametrize('bframes', ['0', '3'])
+def test_parse_mp4_keyframes_matches_gop_layout(tmp_path, bframes):
+    path = encode(tmp_path, f'bf{bframes}.mp4', '-bf', bframes)
+    pts, dts, offsets = main.parse_mp4_keyframes(path)
+    assert pts == pytest.approx([0.0, 1.0, 2.0, 3.0], abs=1e-6)
+    assert all(d <= p + 1e-9 for p, d in zip(pts, dts))
+    assert offsets == sorted(offsets) and offsets[0] > 0
+
+
+def test_parse_mp4_keyframes_offsets_point_at_samples(tmp_path):
+    path = encode(tmp_path, 'offsets.mp4')
+    _, _, offsets = main.parse_mp4_keyframes(path)
+    with open(path, 'rb') as f:
+        data = f.read()
+    for offset in offsets:
+        # 每个样本以 4 字节长度开头的 NAL 单元，长度不会超出文件
+        length = int.from_bytes(data[offset:offset + 4], 'big')
+        assert 0 < length < len(data) - offset
+
+
+def test_parse_mp4_keyframes_skips_fragmented_and_non_mp4(tmp_path):
+    fragmented = encode(tmp_path, 'frag.mp4', '-movflags', 'frag_keyframe+empty_moov')
+    assert main.parse_mp4_keyframes(fragmented) is None
+    other = tmp_path / 'x.bin'
+    other.write_bytes(b'not a movie')
+    assert main.parse_mp4_keyframes(str(other)) is None
+
+
+def test_keyframe_index_round_trip(tmp_path):
+    path = encode(tmp_path, 'index.mp4')
+    index = main.KeyframeIndex(str(tmp_path / 'kfi'))
+    table = index.get(path)
+    assert [round(t, 3) for t in table.pts] == [0.0, 1.0, 2.0, 3.0]
+    # 新实例从磁盘读取同样的索引
+    reloaded = main.KeyframeIndex(str(tmp_path / 'kfi')).get(path)
+    assert list(reloaded.pts) == list(table.pts)
+    assert list(reloaded.offsets) == list(table.offsets)
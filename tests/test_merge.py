@@ -0,0 +1,49 @@
+import pytest
+
+import main
+
+
+@pytest.fixture
+def task():
+    return main.DownloadTask('BV1xx411c7mD', download_type='full_mp4')
+
+
+def codec(path, kind):
+    return main.first_stream(main.probe_media(path), kind)['codec']
+
+
+def test_remux_copies_both_streams(media):
+    video = media.make('v.mp4', audio=False)
+    audio = media.make('a.m4a', video=False)
+    output = str(media.directory / 'out.mp4')
+    main.remux_audio_video(video, audio, output)
+    assert media.packet_md5(output, 'v') == media.packet_md5(video, 'v')
+    assert media.packet_md5(output, 'a') == media.packet_md5(audio, 'a')
+
+
+def test_remux_rejects_codecs_mp4_cannot_hold(media):
+    video = media.make('v.mp4', audio=False)
+    audio = media.make('a.wav', video=False, extra=['-c:a', 'pcm_s16le'])
+    with pytest.raises(ValueError):
+        main.remux_audio_video(video, audio, str(media.directory / 'out.mp4'))
+
+
+def test_merge_reencodes_only_incompatible_audio(media, task):
+    video = media.make('v.mp4', audio=False)
+    # 音频比视频长，合并结果截到与视频等长
+    audio = media.make('a.wav', duration=5, video=False, extra=['-c:a', 'pcm_s16le'])
+    output = str(media.directory / 'out.mp4')
+    assert task._merge_audio_video(video, audio, output)
+    assert media.packet_md5(output, 'v') == media.packet_md5(video, 'v')
+    assert codec(output, 'audio') == 'aac'
+    assert media.audio_seconds(output) == pytest.approx(4, abs=0.05)
+
+
+def test_merge_reencodes_only_incompatible_video(media, task):
+    video = media.make('v.mkv', audio=False, extra=['-c:v', 'mpeg2video'])
+    audio = media.make('a.m4a', duration=3, video=False)
+    output = str(media.directory / 'out.mp4')
+    assert task._merge_audio_video(video, audio, output)
+    assert media.packet_md5(output, 'a') == media.packet_md5(audio, 'a')
+    assert codec(output, 'video') == 'h264'
+    assert media.video_frames(output) == 100
@@ -0,0 +1,92 @@
+import struct
+
+import pytest
+
+import main
+
+
+def make_sidx(references, timescale=1000, earliest=0, first_offset=0, version=0):
+    """构造 sidx 盒，references 为 [(分片字节数, 分片时长)]"""
+    body = struct.pack('>B3xII', version, 1, timescale)
+    if version == 0:
+        body += struct.pack('>II', earliest, first_offset)
+    else:
+        body += struct.pack('>QQ', earliest, first_offset)
+    body += struct.pack('>HH', 0, len(references))
+    for size, duration in references:
+        body += struct.pack('>III', size, duration, 0x90000000)
+    return struct.pack('>I4s', 8 + len(body), b'sidx') + body
+
+
+def test_parse_sidx_returns_absolute_byte_ranges():
+    data = make_sidx([(100, 2000), (150, 2000), (50, 1000)], earliest=500)
+    fragments = main.parse_sidx(data, 1000)
+    base = 1000 + len(data)
+    assert fragments == [
+        (0.5, 2.5, base, base + 99),
+        (2.5, 4.5, base + 100, base + 249),
+        (4.5, 5.5, base + 250, base + 299),
+    ]
+
+
+def test_parse_sidx_version_1_and_first_offset():
+    data = make_sidx([(10, 90000)], timescale=90000, first_offset=20, version=1)
+    (fragment,) = main.parse_sidx(data, 0)
+    assert fragment == (0.0, 1.0, len(data) + 20, len(data) + 29)
+
+
+def test_parse_sidx_rejects_other_boxes_and_nested_indexes():
+    with pytest.raises(ValueError):
+        main.parse_sidx(struct.pack('>I4s', 8, b'moof'), 0)
+    nested = bytearray(make_sidx([(10, 1000)]))
+    nested[-12] |= 0x80
+    with pytest.raises(ValueError):
+        main.parse_sidx(bytes(nested), 0)
+
+
+def test_parse_time_text_formats():
+    assert main.parse_time_text('75.5') == 75.5
+    assert main.parse_time_text('01:05.5') == 65.5
+    assert main.parse_time_text('00:01:05.500') == 65.5
+    with pytest.raises(ValueError):
+        main.parse_time_text('abc')
+
+
+def test_parse_cue_list_whitespace_csv_and_header():
+    text = "\n".join([
+        "开始,结束,名称",
+        "00:00:05.5,00:00:17.25,精彩 1",
+        "# 注释",
+        "",
+        "70 100.5",
+    ])
+    assert main.parse_cue_list(text) == [(5.5, 17.25, '精彩 1'), (70.0, 100.5, '')]
+
+
+def test_parse_cue_list_keeps_spaces_in_names():
+    assert main.parse_cue_list("1 2 重叠 片段") == [(1.0, 2.0, '重叠 片段')]
+
+
+def test_parse_cue_list_rejects_bad_rows():
+    with pytest.raises(ValueError):
+        main.parse_cue_list("5 3 倒序")
+    with pytest.raises(ValueError):
+        main.parse_cue_list("1 2\nfoo bar")
+
+
+def test_load_cue_file_reads_ffmetadata_chapters(tmp_path):
+    path = tmp_path / 'chapters.txt'
+    path.write_text(";FFMETADATA1\n[CHAPTER]\nTIMEBASE=1/1000\nSTART=1000\nEND=2500\n"
+                    "title=第一章\n", encoding='utf-8')
+    assert main.load_cue_file(str(path)) == [(1.0, 2.5, '第一章')]
+
+
+@pytest.mark.parametrize('text, number', [
+    ("00:05 abc\n1 2", 1),
+    ("5\n1 2", 1),
+    ("开始,结束,名称\n备注\n1 2", 2),
+    ("# 注释\n\n1:00 x 片段\n1 2", 3),
+])
+def test_parse_cue_list_reports_bad_lines_before_first_cue(text, number):
+    with pytest.raises(ValueError, match=f"第{number}行"):
+        main.parse_cue_list(text)
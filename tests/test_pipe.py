@@ -0,0 +1,111 @@
+import asyncio
+import os
+
+import pytest
+
+import main
+
+FRAGMENTED = ['-movflags', 'frag_keyframe+empty_moov+default_base_moof']
+
+
+def run(coroutine):
+    async def wrapper():
+        try:
+            return await coroutine
+        finally:
+            await main.http_client.close()
+    return asyncio.run(wrapper())
+
+
+@pytest.fixture
+def dash_files(media):
+    """和 B站 DASH 流一样的分片 MP4：只有视频的 video.m4s 和只有音频的 audio.m4s"""
+    video = media.make('video.m4s', audio=False, extra=FRAGMENTED + ['-f', 'mp4'])
+    audio = media.make('audio.m4s', video=False, extra=FRAGMENTED + ['-f', 'mp4'])
+    return video, audio
+
+
+def test_stream_delivers_data_in_order(range_server):
+    payload = os.urandom(1024 * 1024 + 123)
+    range_server.files['/f.bin'] = payload
+    chunks = []
+
+    async def write(data):
+        chunks.append(bytes(data))
+
+    downloader = main.RangedDownloader(connections=4, min_segment_size=64 * 1024)
+    run(downloader.stream(range_server.url('/f.bin'), write))
+    assert b''.join(chunks) == payload
+
+
+def test_pipe_muxer_copies_written_streams(media, dash_files):
+    output = str(media.directory / 'out.mp4')
+
+    async def mux():
+        muxer = main.PipeMuxer(2, ['-map', '0:v', '-map', '1:a', '-c', 'copy'], output)
+        try:
+            await muxer.start()
+            for pipe_input, path in zip(muxer.inputs, dash_files):
+                with open(path, 'rb') as f:
+                    while True:
+                        data = f.read(4096)
+                        if not data:
+                            break
+                        await pipe_input.write(data)
+                await pipe_input.close()
+            await muxer.finish()
+        finally:
+            await muxer.close()
+    asyncio.run(mux())
+    assert media.packet_md5(output, 'v') == media.packet_md5(dash_files[0], 'v')
+    assert media.packet_md5(output, 'a') == media.packet_md5(dash_files[1], 'a')
+
+
+def test_pipe_muxer_reports_ffmpeg_errors(media):
+    output = str(media.directory / 'out.mp4')
+
+    async def mux():
+        muxer = main.PipeMuxer(1, ['-c', 'copy'], output)
+        try:
+            await muxer.start()
+            await muxer.inputs[0].write(b'not a movie' * 1000)
+            await muxer.inputs[0].close()
+            await muxer.finish()
+        finally:
+            await muxer.close(remove_output=True)
+    with pytest.raises(main.MuxerError):
+        asyncio.run(mux())
+    assert not os.path.exists(output)
+
+
+def serve_streams(range_server, paths):
+    streams = []
+    for kind, path in zip(('video', 'audio'), paths):
+        with open(path, 'rb') as f:
+            range_server.files[f'/{kind}.m4s'] = f.read()
+        streams.append((kind, {'baseUrl': range_server.url(f'/{kind}.m4s')}))
+    return streams
+
+
+def test_stream_mux_downloads_into_ffmpeg(range_server, media, dash_files):
+    streams = serve_streams(range_server, dash_files)
+    output = str(media.directory / 'out.mp4')
+    task = main.DownloadTask('BV1xx411c7mD', download_type='full_mp4')
+    args = ['-map', '0:v', '-map', '1:a', '-c', 'copy']
+    assert run(task._stream_mux(streams, args, output))
+    assert media.packet_md5(output, 'v') == media.packet_md5(dash_files[0], 'v')
+    assert media.packet_md5(output, 'a') == media.packet_md5(dash_files[1], 'a')
+
+
+def test_stream_mux_falls_back_when_input_needs_seeking(range_server, media):
+    # moov 在文件末尾的普通 MP4 无法顺序读取
+    paths = [media.make('v.mp4', audio=False), media.make('a.m4a', video=False)]
+    streams = serve_streams(range_server, paths)
+    output = str(media.directory / 'out.mp4')
+    task = main.DownloadTask('BV1xx411c7mD', download_type='full_mp4')
+    messages = []
+    task.progress_signal.connect(messages.append)
+    args = ['-map', '0:v', '-map', '1:a', '-c', 'copy']
+    assert not run(task._stream_mux(streams, args, output))
+    assert any("改为先下载到临时文件" in message for message in messages)
+    assert not os.path.exists(output)
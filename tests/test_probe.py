@@ -0,0 +1,95 @@
+import os
+
+import pytest
+
+import main
+
+
+@pytest.fixture
+def probe_calls(monkeypatch):
+    """记录真正启动 ffmpeg 探测的文件"""
+    calls = []
+    probe_media = main.probe_media
+
+    def counting(path):
+        calls.append(path)
+        return probe_media(path)
+    monkeypatch.setattr(main, 'probe_media', counting)
+    return calls
+
+
+def test_probe_reads_streams_and_caches(media, probe_calls, tmp_path):
+    path = media.make('a.mp4', duration=2)
+    service = main.MediaProbeService(str(tmp_path / 'probe.json'))
+    info = service.probe(path)
+    assert main.first_stream(info, 'video')['codec'] == 'h264'
+    assert main.first_stream(info, 'audio')['codec'] == 'aac'
+    assert info['duration'] == pytest.approx(2, abs=0.1)
+    assert service.probe(path) == info
+    assert service.stream_flags(path) == (True, True)
+    assert len(probe_calls) == 1
+
+
+def test_modified_file_is_probed_again(media, probe_calls, tmp_path):
+    path = media.make('a.mp4', duration=2)
+    service = main.MediaProbeService(str(tmp_path / 'probe.json'))
+    service.probe(path)
+    media.make('a.mp4', duration=3, audio=False)
+    info = service.probe(path)
+    assert main.first_stream(info, 'audio') is None
+    assert len(probe_calls) == 2
+
+
+def test_batch_of_probes_is_saved_once_then_flushed(media, probe_calls, tmp_path, monkeypatch):
+    paths = [media.make(f'{i}.m4a', duration=1, video=False) for i in range(4)]
+    saves = []
+    save_json_cache = main._save_json_cache
+
+    def counting(path, data, indent=None):
+        saves.append(len(data))
+        save_json_cache(path, data, indent)
+    monkeypatch.setattr(main, '_save_json_cache', counting)
+
+    cache_path = str(tmp_path / 'probe.json')
+    service = main.MediaProbeService(cache_path)
+    for path in paths:
+        service.probe(path)
+    assert saves == [1]
+    service.flush()
+    service.flush()
+    assert saves == [1, 4]
+
+    # 新实例从磁盘读取缓存，不再启动 ffmpeg
+    reloaded = main.MediaProbeService(cache_path)
+    for path in paths:
+        reloaded.probe(path)
+    assert len(probe_calls) == 4
+
+
+def test_stream_flags_for_unreadable_files(tmp_path):
+    path = tmp_path / 'x.txt'
+    path.write_text('not media', encoding='utf-8')
+    service = main.MediaProbeService()
+    assert service.stream_flags(str(path)) == (False, False)
+    assert service.stream_flags(os.path.join(str(tmp_path), 'missing.mp4')) == (False, False)
+
+
+def test_probe_task_reports_through_signals(media):
+    path = media.make('a.mp4', duration=2)
+    task = main.ProbeTask(path, ('clip',))
+    results = []
+    task.signals.finished_signal.connect(lambda *args: results.append(args))
+    task.run()
+    (tag, file_path, result), = results
+    assert (tag, file_path) == (('clip',), path)
+    assert (result['has_video'], result['has_audio']) == (True, True)
+    # 顺便建立的关键帧索引已在缓存中
+    assert main.keyframe_index.get(path).pts[:2] == pytest.approx([0.0, 1.0], abs=1e-6)
+
+
+def test_probe_task_reports_errors(tmp_path):
+    task = main.ProbeTask(str(tmp_path / 'missing.mp4'), 'tag')
+    errors = []
+    task.signals.error_signal.connect(lambda *args: errors.append(args))
+    task.run()
+    assert len(errors) == 1 and errors[0][0] == 'tag'
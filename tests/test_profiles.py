@@ -0,0 +1,70 @@
+import json
+
+import pytest
+
+import main
+
+
+def write_config(tmp_path, data):
+    path = tmp_path / 'config.json'
+    path.write_text(data if isinstance(data, str) else json.dumps(data), encoding='utf-8')
+    return path
+
+
+def test_builtin_profiles_without_config(tmp_path):
+    profiles = main.EncodingProfiles(str(tmp_path / 'config.json'))
+    assert profiles.names() == [profile.name for profile in main.EncodingProfiles.BUILTIN]
+    assert profiles.current().name == main.EncodingProfiles.DEFAULT
+    assert profiles.errors() == []
+    with pytest.raises(ValueError):
+        profiles.get('不存在')
+
+
+def test_profile_arguments():
+    profile = main.EncodingProfile('x', video_codec='libx265', preset='fast', video_bitrate='4M',
+                                   threads=2, audio_bitrate='128k')
+    assert profile.video_args() == ['-c:v', 'libx265', '-preset', 'fast', '-b:v', '4M',
+                                    '-x265-params', 'log-level=error']
+    assert profile.tag_args() == ['-tag:v', 'hvc1']
+    assert profile.thread_args() == ['-threads', '2']
+    assert profile.audio_args(mp3=True) == ['-c:a', 'libmp3lame', '-b:a', '128k']
+    with pytest.raises(ValueError):
+        main.EncodingProfile('bad', video_codec='mpeg2video')
+
+
+def test_config_overrides_and_adds_profiles(tmp_path):
+    path = write_config(tmp_path, {
+        'encoding_profile': '快速',
+        'encoding_profiles': {
+            '标准': {'crf': 18},
+            '快速': {'preset': 'veryfast', 'threads': 4},
+            '坏的': {'video_codec': 'vp9'},
+        },
+    })
+    profiles = main.EncodingProfiles(str(path))
+    assert profiles.get('标准').crf == 18
+    assert profiles.current().name == '快速'
+    assert profiles.current().thread_args() == ['-threads', '4']
+    assert '坏的' not in profiles.names()
+    assert len(profiles.errors()) == 1 and '坏的' in profiles.errors()[0]
+
+
+def test_select_persists_and_keeps_other_settings(tmp_path):
+    path = write_config(tmp_path, {'other': [1, 2]})
+    main.EncodingProfiles(str(path)).select('归档')
+    saved = json.loads(path.read_text(encoding='utf-8'))
+    assert saved['other'] == [1, 2]
+    assert saved['encoding_profile'] == '归档'
+    assert main.EncodingProfiles(str(path)).current().name == '归档'
+
+
+def test_corrupt_config_is_reported_and_never_overwritten(tmp_path):
+    path = write_config(tmp_path, '{"other": 1,')
+    profiles = main.EncodingProfiles(str(path))
+    assert profiles.current().name == main.EncodingProfiles.DEFAULT
+    assert len(profiles.errors()) == 1
+    with pytest.raises(ValueError):
+        profiles.select('预览')
+    # 选中的配置在本次运行中仍然有效，文件保持原样
+    assert profiles.current().name == '预览'
+    assert path.read_text(encoding='utf-8') == '{"other": 1,'
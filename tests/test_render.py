@@ -0,0 +1,47 @@
+import pytest
+
+import main
+
+
+@pytest.fixture
+def source(media):
+    # 6 秒，每秒一个关键帧
+    return media.make('src.mp4', duration=6)
+
+
+def test_cut_on_keyframes_copies_everything(media, source):
+    renderer = main.SmartRenderer()
+    output = str(media.directory / 'out.mp4')
+    renderer.render(source, 1.0, 4.0, output)
+    assert renderer.encoded_pieces == 0
+    assert media.video_frames(output) == 75
+    assert media.audio_seconds(output) == pytest.approx(3.0, abs=0.03)
+
+
+def test_cut_between_keyframes_encodes_only_boundaries(media, source):
+    renderer = main.SmartRenderer()
+    output = str(media.directory / 'out.mp4')
+    renderer.render(source, 1.5, 4.3, output)
+    assert renderer.encoded_pieces == 2
+    # 1.52s 到 4.28s 之间的帧
+    assert media.video_frames(output) == 70
+    assert media.audio_seconds(output) == pytest.approx(2.8, abs=0.03)
+
+
+def test_cut_inside_one_gop_encodes_the_whole_range(media, source):
+    renderer = main.SmartRenderer()
+    output = str(media.directory / 'out.mp4')
+    renderer.render(source, 2.2, 2.8, output, include_audio=False)
+    assert renderer.encoded_pieces == 1
+    assert media.video_frames(output) == 15
+
+
+def test_unsupported_codec_raises(media):
+    source = media.make('src.mkv', extra=['-c:v', 'mpeg2video'])
+    with pytest.raises(ValueError):
+        main.SmartRenderer().render(source, 1.5, 2.5, str(media.directory / 'out.mp4'))
+
+
+def test_time_labels_keep_milliseconds():
+    assert main.format_time_label(65) == '00-01-05'
+    assert main.format_time_label(65.5) == '00-01-05.500'
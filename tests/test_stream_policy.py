@@ -0,0 +1,46 @@
+import pytest
+
+import main
+
+
+def video(quality, codec, bandwidth):
+    return {'id': quality, 'codecs': {'avc': 'avc1.640032', 'hevc': 'hev1.1.6.L150',
+                                      'av1': 'av01.0.08M.08'}[codec], 'bandwidth': bandwidth}
+
+
+VIDEOS = [
+    video(80, 'avc', 3000000), video(80, 'hevc', 1500000), video(80, 'av1', 1200000),
+    video(64, 'avc', 1500000), video(64, 'hevc', 800000),
+]
+AUDIOS = [{'id': 30216, 'bandwidth': 67000}, {'id': 30232, 'bandwidth': 132000},
+          {'id': 30280, 'bandwidth': 192000}]
+
+
+def test_default_policy_picks_highest_quality_avc():
+    assert main.StreamPolicy().select_video(VIDEOS) is VIDEOS[0]
+
+
+def test_codec_preference_and_prefer_size():
+    assert main.StreamPolicy(codec='hevc').select_video(VIDEOS) is VIDEOS[1]
+    assert main.StreamPolicy(prefer_size=True).select_video(VIDEOS) is VIDEOS[2]
+
+
+def test_quality_and_bitrate_caps():
+    assert main.StreamPolicy(max_quality=64).select_video(VIDEOS) is VIDEOS[3]
+    # 1080P 只有 AV1 不超过上限
+    assert main.StreamPolicy(max_bitrate=1200).select_video(VIDEOS) is VIDEOS[2]
+    # 没有满足上限的流时退回码率最小的流
+    assert main.StreamPolicy(max_bitrate=100).select_video(VIDEOS) is VIDEOS[4]
+
+
+def test_audio_selection_respects_bitrate_cap():
+    assert main.StreamPolicy().select_audio(AUDIOS) is AUDIOS[2]
+    assert main.StreamPolicy(max_bitrate=150).select_audio(AUDIOS) is AUDIOS[1]
+    assert main.StreamPolicy(max_bitrate=50).select_audio(AUDIOS) is AUDIOS[0]
+
+
+def test_empty_stream_lists_raise():
+    with pytest.raises(ValueError):
+        main.StreamPolicy().select_video([])
+    with pytest.raises(ValueError):
+        main.StreamPolicy().select_audio([])
@@ -0,0 +1,49 @@
+import pytest
+
+import main
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """可以手动推进的 time.monotonic"""
+    now = [100.0]
+    monkeypatch.setattr(main.time, 'monotonic', lambda: now[0])
+    return now
+
+
+def test_updates_are_throttled_to_the_interval(clock):
+    telemetry = main.TransferTelemetry(interval=0.25)
+    assert telemetry.update(0, 1000) is None
+    clock[0] += 0.125
+    assert telemetry.update(100, 1000) is None
+    clock[0] += 0.125
+    snapshot = telemetry.update(200, 1000)
+    assert snapshot['rate'] == pytest.approx(800)
+    assert snapshot['percent'] == 20
+    assert snapshot['eta'] == pytest.approx(1.0)
+    # force 用于最后一次进度，不受采样间隔限制
+    clock[0] += 0.0625
+    assert telemetry.update(210, 1000, force=True)['downloaded'] == 210
+
+
+def test_average_rate_is_smoothed(clock):
+    telemetry = main.TransferTelemetry(interval=0.1, smoothing=0.5)
+    telemetry.update(0, None)
+    clock[0] += 1
+    assert telemetry.update(1000, None)['average_rate'] == pytest.approx(1000)
+    clock[0] += 1
+    snapshot = telemetry.update(4000, None)
+    assert snapshot['rate'] == pytest.approx(3000)
+    assert snapshot['average_rate'] == pytest.approx(2000)
+    # 总大小未知时没有百分比和剩余时间
+    assert snapshot['percent'] is None and snapshot['eta'] is None
+
+
+def test_formatting():
+    assert main.format_rate(512 * 1024) == "512 KB/s"
+    assert main.format_rate(3 * 1024 * 1024) == "3.0 MB/s"
+    assert main.format_eta(None) == "--:--:--"
+    assert main.format_eta(3725.9) == "01:02:05"
+    text = main.format_telemetry({'downloaded': 1024 * 1024, 'total': 4 * 1024 * 1024,
+                                  'rate': 2048, 'average_rate': 1024, 'eta': 61})
+    assert text == "速度 2 KB/s（平均 1 KB/s）  已下载 1.0 MB / 4.0 MB  剩余 00:01:01"